@@ -1,134 +1,257 @@
-import jsonpickle
 import numpy as np
 import math
+import re
+from functools import lru_cache
+
+# Per-zone fields, in the order they appear on the wire (after the frame header)
+ZONE_FIELDS = (
+    ('ambient_per_spad', np.uint32),
+    ('nb_target_detected', np.uint8),
+    ('nb_spads_enabled', np.uint32),
+)
+
+# Per-target fields, in the order they appear on the wire (within a zone)
+TARGET_FIELDS = (
+    ('signal_per_spad', np.uint32),
+    ('range_sigma_mm', np.uint16),
+    ('distance_mm', np.int16),
+    ('reflectance', np.uint8),
+    ('target_status', np.uint8),
+)
+
+# Number of integers preceding the zone data: nb_zones; nb_targets_per_zone; silicon_temp_degc
+HEADER_LEN = 3
+
+VALID_NB_ZONES = (16, 64)
+
+
+@lru_cache(maxsize=None)
+def frame_dtype(nb_zones: int, nb_targets_per_zone: int) -> np.dtype:
+    """Packed record holding one complete frame. Types follow the ULD driver (VL53L5CX_ResultsData)"""
+    return np.dtype(
+        [('silicon_temp_degc', np.int8)]
+        + [(name, dtype, (nb_zones,)) for name, dtype in ZONE_FIELDS]
+        + [(name, dtype, (nb_zones, nb_targets_per_zone)) for name, dtype in TARGET_FIELDS]
+    )
+
+
+def frame_len(nb_zones: int, nb_targets_per_zone: int) -> int:
+    """Number of integers in one frame on the wire, header included"""
+    return HEADER_LEN + nb_zones * (len(ZONE_FIELDS) + len(TARGET_FIELDS) * nb_targets_per_zone)
+
+
+def records_from_values(values: np.ndarray) -> np.ndarray:
+    """
+    Reshape integers in wire order, shaped (n_frames, >= frame_len), into an array of frame records.
+    All frames must share the layout given by the header of the first frame.
+    """
+    nb_zones, nb_targets_per_zone = int(values[0, 0]), int(values[0, 1])
+    n_frames = values.shape[0]
+    records = np.zeros(n_frames, dtype=frame_dtype(nb_zones, nb_targets_per_zone))
+    records['silicon_temp_degc'] = values[:, 2]
+
+    zone_data = values[:, HEADER_LEN:frame_len(nb_zones, nb_targets_per_zone)].reshape(n_frames, nb_zones, -1)
+    for ix, (name, _) in enumerate(ZONE_FIELDS):
+        records[name] = zone_data[:, :, ix]
+
+    target_data = zone_data[:, :, len(ZONE_FIELDS):].reshape(n_frames, nb_zones, nb_targets_per_zone, -1)
+    for ix, (name, _) in enumerate(TARGET_FIELDS):
+        records[name] = target_data[:, :, :, ix]
+
+    return records
+
 
 class VL53L5CX_Target:
-    signal_per_spad: int | None
-    range_sigma_mm: int | None
-    distance_mm: int | None
-    reflectance: int | None
-    target_status: int | None
-
-    def __init__(
-        self, 
-        signal_per_spad: int, 
-        range_sigma_mm: int, 
-        distance_mm: int,
-        reflectance: int,
-        target_status: int
-        ):
-        self.signal_per_spad = signal_per_spad
-        self.range_sigma_mm = range_sigma_mm
-        self.distance_mm = distance_mm
-        self.reflectance = reflectance
-        self.target_status = target_status
+    """View of one target in a VL53L5CX_Reading. Kept for code that walks .zones[i].targets[j]"""
+    __slots__ = ('_reading', '_zone', '_target')
+
+    def __init__(self, reading, zone: int, target: int):
+        self._reading = reading
+        self._zone = zone
+        self._target = target
+
+    def _field(self, name: str):
+        return self._reading.record[name][self._zone, self._target]
+
+    signal_per_spad = property(lambda self: self._field('signal_per_spad'))
+    range_sigma_mm = property(lambda self: self._field('range_sigma_mm'))
+    distance_mm = property(lambda self: self._field('distance_mm'))
+    reflectance = property(lambda self: self._field('reflectance'))
+    target_status = property(lambda self: self._field('target_status'))
 
 
 class VL53L5CX_Zone:
-    ambient_per_spad: int | None
-    nb_target_detected: int | None
-    nb_spads_enabled: int | None
-    targets: list[VL53L5CX_Target] | None
-
-    def __init__(
-        self, 
-        ambient_per_spad: int, 
-        nb_target_detected: int, 
-        nb_spads_enabled: int,
-        targets: list[VL53L5CX_Target] | None,
-        ):
-        self.ambient_per_spad = ambient_per_spad
-        self.nb_target_detected = nb_target_detected
-        self.nb_spads_enabled = nb_spads_enabled
-        self.targets = targets
+    """View of one zone in a VL53L5CX_Reading. Kept for code that walks .zones[i].targets[j]"""
+    __slots__ = ('_reading', '_zone')
+
+    def __init__(self, reading, zone: int):
+        self._reading = reading
+        self._zone = zone
+
+    def _field(self, name: str):
+        return self._reading.record[name][self._zone]
+
+    ambient_per_spad = property(lambda self: self._field('ambient_per_spad'))
+    nb_target_detected = property(lambda self: self._field('nb_target_detected'))
+    nb_spads_enabled = property(lambda self: self._field('nb_spads_enabled'))
+
+    @property
+    def targets(self) -> list[VL53L5CX_Target]:
+        return [VL53L5CX_Target(self._reading, self._zone, ix_t)
+                for ix_t in range(self._reading.nb_targets_per_zone)]
 
 
 class VL53L5CX_Reading:
+    """
+    One frame from the sensor, stored column-wise.
+
+    All fields live in a single packed record (see frame_dtype). Per-zone fields are
+    arrays shaped (nb_zones,), per-target fields are shaped (nb_zones, nb_targets_per_zone).
+    """
     nb_zones: int
     nb_targets_per_zone: int
-    silicon_temp_degc: int | None
-    zones: list[VL53L5CX_Zone] | None
+    row_len: int
+    record: np.ndarray
+
+    # time.monotonic_ns() when the frame was received, None if not known (e.g. jsonpickle logs)
+    timestamp_ns: int | None = None
 
     def __init__(self, data: list[str]):
         # Read tokenized data in string format
-        ix = 0 # index..
         nb_zones = int(data[0]) # a.k.a resolution
-        self.nb_targets_per_zone = int(data[ix:=ix+1])
-        self.silicon_temp_degc = int(data[ix:=ix+1])
+        nb_targets_per_zone = int(data[1])
+
+        if nb_zones not in VALID_NB_ZONES:
+            raise ValueError
 
-        if nb_zones not in [16, 64]:
+        expected_len = frame_len(nb_zones, nb_targets_per_zone)
+        if len(data) < expected_len:
             raise ValueError
 
-        self.nb_zones = nb_zones
-        self.row_len = int(math.sqrt(nb_zones))    # 4 or 8 depending on incoming data
-        temp_list_of_zones = list()
-        
-        for _ in range(0, self.nb_zones):
-            # Using pre-increments on z_index
-            temp_ambient_per_spad = int(data[ix:=ix+1])
-            temp_nb_target_detected = int(data[ix:=ix+1])
-            temp_nb_spads_enabled = int(data[ix:=ix+1])
+        values = np.array(data[:expected_len], dtype=np.int64)
+        self._set_record(records_from_values(values[np.newaxis])[0, ...])
 
-            targets = list()
-            for _ in range(self.nb_targets_per_zone):
-
-                temp_target = VL53L5CX_Target(
-                    signal_per_spad=int(data[ix:=ix+1]),
-                    range_sigma_mm=int(data[ix:=ix+1]),
-                    distance_mm=int(data[ix:=ix+1]),
-                    reflectance=int(data[ix:=ix+1]),
-                    target_status=int(data[ix:=ix+1])
-                )
-                targets.append(temp_target)
-
-            zone = VL53L5CX_Zone(
-                ambient_per_spad=temp_ambient_per_spad,
-                nb_target_detected=temp_nb_target_detected,
-                nb_spads_enabled=temp_nb_spads_enabled,
-                targets=targets
-            )
-            temp_list_of_zones.append(zone)
-            
-        self.zones = temp_list_of_zones
+    @classmethod
+    def from_values(cls, values: np.ndarray):
+        """Create a reading from the integers of one frame, in wire order"""
+        return cls.from_record(records_from_values(values[np.newaxis])[0, ...])
+
+    @classmethod
+    def from_record(cls, record: np.ndarray):
+        """Wrap an existing frame record (e.g. a slice of a memory mapped log) without copying"""
+        reading = cls.__new__(cls)
+        reading._set_record(record)
+        return reading
+
+    def _set_record(self, record: np.ndarray):
+        self.record = record
+        self.nb_zones = record.dtype['ambient_per_spad'].shape[0]
+        self.nb_targets_per_zone = record.dtype['distance_mm'].shape[1]
+        self.row_len = int(math.sqrt(self.nb_zones))    # 4 or 8 depending on incoming data
+
+    # Columns
+    silicon_temp_degc = property(lambda self: int(self.record['silicon_temp_degc']))
+    ambient_per_spad = property(lambda self: self.record['ambient_per_spad'])
+    nb_target_detected = property(lambda self: self.record['nb_target_detected'])
+    nb_spads_enabled = property(lambda self: self.record['nb_spads_enabled'])
+    signal_per_spad = property(lambda self: self.record['signal_per_spad'])
+    range_sigma_mm = property(lambda self: self.record['range_sigma_mm'])
+    distance_mm = property(lambda self: self.record['distance_mm'])
+    reflectance = property(lambda self: self.record['reflectance'])
+    target_status = property(lambda self: self.record['target_status'])
+
+    @property
+    def zones(self) -> list[VL53L5CX_Zone]:
+        return [VL53L5CX_Zone(self, ix_z) for ix_z in range(self.nb_zones)]
 
     def print_temp(self):
         print(f'Silicon temperature: {self.silicon_temp_degc} degrees celcius')
 
     # Note: This is a remainder from old raster rendering of the data frame.
-    # Probably cheaper to rotate the 3d object around one of the axis 
+    # Probably cheaper to rotate the 3d object around one of the axis
     def rotate_ccw(self):
-        rotated_zone_list = [None] * self.nb_zones
-        for ix, zone in enumerate(self.zones):
-            y_s1 = int(ix / self.row_len)
-            x_s1 = ix % self.row_len
+        """
+        Rotates the zones a quarter turn counterclockwise. The reading gets a rotated copy of its
+        record, whatever backs the original (e.g. a read-only memory mapped log) is left as it is.
+        """
+        # Zone ix moves to x_s2 + (y_s2 * row_len), where y_s2 = (row_len - 1) - x_s1 and x_s2 = y_s1
+        ix = np.arange(self.nb_zones)
+        rotated_ix = (ix // self.row_len) + ((self.row_len - 1) - (ix % self.row_len)) * self.row_len
 
-            y_s2 = (self.row_len - 1) - x_s1
-            x_s2 = y_s1
-
-            rotated_zone_list[x_s2 + (y_s2 * self.row_len)] = zone
-        
-        # Overwrite with rotated
-        self.zones = rotated_zone_list
+        rotated = self.record.copy()
+        for name in self.record.dtype.names[1:]:
+            rotated[name][rotated_ix] = self.record[name]
+        self._set_record(rotated)
 
 
     # Note: This method is no longer used. Can probably be deleted.
     # Point cloud conversion has been moved to Sensor3D
     """Converts all targets to points in 3d space"""
     def get_point_cloud(self):
-        # Not implemented for 4x4 resolution
-        if self.nb_zones != 64:
-            return None
-        
-        # Only 8x8 resolution
-        points = np.empty([0, 4])
-        for ix_z, zone in enumerate(self.zones):
-            theta_x = get_theta_x(ix_z % 8)
-            theta_y = get_theta_y(ix_z // 8)
-            for _, target in enumerate(zone.targets):
-                hypothenuse = target.distance_mm / 1000
-                points = np.concatenate((points, calc_3d_point(hypothenuse, theta_x, theta_y)), axis=0)
-
-        return points
+        hypothenuse = self.distance_mm / 1000
+
+        points = np.ones((self.nb_zones, self.nb_targets_per_zone, 4))
+        points[:, :, :3] = hypothenuse[:, :, np.newaxis] * ZONE_DIRECTIONS[self.nb_zones][:, np.newaxis, :]
+
+        return points.reshape(-1, 4)
+
+    def to_legacy_dict(self) -> dict:
+        """Nested zone/target layout of the original jsonpickle logs"""
+        zones = list()
+        for ix_z in range(self.nb_zones):
+            targets = list()
+            for ix_t in range(self.nb_targets_per_zone):
+                target = {'py/object': 'VL53L5CX.VL53L5CX_Target'}
+                target.update({name: int(self.record[name][ix_z, ix_t]) for name, _ in TARGET_FIELDS})
+                targets.append(target)
+            zone = {'py/object': 'VL53L5CX.VL53L5CX_Zone'}
+            zone.update({name: int(self.record[name][ix_z]) for name, _ in ZONE_FIELDS})
+            zone['targets'] = targets
+            zones.append(zone)
+
+        return {
+            'nb_targets_per_zone': self.nb_targets_per_zone,
+            'silicon_temp_degc': self.silicon_temp_degc,
+            'nb_zones': self.nb_zones,
+            'row_len': self.row_len,
+            'zones': zones,
+        }
+
+    @classmethod
+    def from_legacy_dict(cls, obj: dict):
+        """Inverse of to_legacy_dict"""
+        nb_zones = int(obj['nb_zones'])
+        nb_targets_per_zone = int(obj['nb_targets_per_zone'])
+
+        reading = cls.__new__(cls)
+        reading._set_record(np.zeros((), dtype=frame_dtype(nb_zones, nb_targets_per_zone)))
+        record = reading.record
+        record['silicon_temp_degc'] = obj['silicon_temp_degc']
+        for name, _ in ZONE_FIELDS:
+            record[name] = [zone[name] for zone in obj['zones']]
+        for name, _ in TARGET_FIELDS:
+            record[name] = [[target[name] for target in zone['targets']] for zone in obj['zones']]
+
+        return reading
+
+
+@lru_cache(maxsize=None)
+def jsonpickle_module():
+    """jsonpickle, imported when first needed (only by jsonpickle logs), with our handler registered"""
+    import jsonpickle
+    import jsonpickle.handlers
+
+    # Keeps log files in the nested layout, so that logs remain readable by older versions
+    class VL53L5CX_ReadingHandler(jsonpickle.handlers.BaseHandler):
+        def flatten(self, obj: VL53L5CX_Reading, data: dict):
+            data.update(obj.to_legacy_dict())
+            return data
+
+        def restore(self, obj: dict):
+            return VL53L5CX_Reading.from_legacy_dict(obj)
+
+    jsonpickle.handlers.register(VL53L5CX_Reading, VL53L5CX_ReadingHandler)
+    return jsonpickle
 
 # TODO: Migrate math to Sensor3D?
 
@@ -141,22 +264,133 @@ def calc_3d_point(h: np.float64, theta_x: np.float64, theta_y: np.float64):
 
     return np.array([(f_y, f_x, f_z, 1)], dtype=np.float64)
 
-# TODO: Make get_thetas to work with 4*4 resolution
-"""Index 0 is 'leftmost' zone, -7/64 pi, incremented 2/64 pi for each zone in x direction"""
-def get_theta_x(x: int):
-    return ((-7 + (x * 2)) / 64) * math.pi
+"""Index 0 is 'leftmost' zone. Zones are pi/(4 * row_len) wide, e.g. zone 0 at 8x8 is centered at -7/64 pi"""
+def get_theta_x(x: int, row_len: int = 8):
+    return ((-(row_len - 1) + (x * 2)) / (8 * row_len)) * math.pi
+
+"""Index 0 is top row of zone, e.g. 7/64 pi at 8x8, decremented for each row (positive y direction)"""
+def get_theta_y(y: int, row_len: int = 8):
+    return (((row_len - 1) - (y * 2)) / (8 * row_len)) * math.pi
+
+"""Unit vector towards the center of each zone, shaped (nb_zones, 3). Components are ordered as in calc_3d_point"""
+def zone_directions(nb_zones: int) -> np.ndarray:
+    row_len = int(math.sqrt(nb_zones))
+    ix_z = np.arange(nb_zones)
+    theta_x = get_theta_x(ix_z % row_len, row_len)
+    theta_y = get_theta_y(ix_z // row_len, row_len)
+    return np.stack((
+        np.sin(theta_y),
+        np.cos(theta_y) * np.sin(theta_x),
+        np.cos(theta_y) * np.cos(theta_x),
+    ), axis=1)
+
+# A target's position is its distance times the direction of its zone
+ZONE_DIRECTIONS = {nb_zones: zone_directions(nb_zones) for nb_zones in VALID_NB_ZONES}
+
+# Serial line parsing
+# A line is the frame in wire order, as integers separated by ';'. Whitespace and a trailing ';' are ignored.
+# Numbers are parsed by NumPy in C, i.e. no per-token Python int() calls.
+
+# A '-' not followed by a digit, which NumPy reads as 0 (as it does a '+'). Other malformed tokens make it raise
+MALFORMED_MINUS = re.compile(rb'-(?![0-9])')
+
+
+def parse_values(buffer: bytes) -> np.ndarray | None:
+    """Parses ';'-separated integers into an int64 array. Returns None if anything in the buffer is malformed"""
+    buffer = buffer.strip().rstrip(b';')
+    if not buffer or b'+' in buffer or (b'-' in buffer and MALFORMED_MINUS.search(buffer)):
+        return None
+
+    try:
+        values = np.fromstring(buffer, dtype=np.int64, sep=';')
+    except ValueError:
+        return None
+
+    # Older NumPy stops at the first bad token (e.g. an empty one) instead of raising
+    if len(values) != buffer.count(b';') + 1:
+        return None
+
+    return values
+
+
+@lru_cache(maxsize=None)
+def _value_bounds(nb_zones: int, nb_targets_per_zone: int) -> tuple[np.ndarray, np.ndarray]:
+    """Lowest and highest value of each integer of a frame in wire order, those its field can hold"""
+    zone_dtypes = [dtype for _, dtype in ZONE_FIELDS] + [dtype for _, dtype in TARGET_FIELDS] * nb_targets_per_zone
+    dtypes = [np.uint8, np.uint8, np.int8] + zone_dtypes * nb_zones
+    return (np.array([np.iinfo(dtype).min for dtype in dtypes], dtype=np.int64),
+            np.array([np.iinfo(dtype).max for dtype in dtypes], dtype=np.int64))
+
+
+def _frame_layout(values: np.ndarray) -> tuple[int, int] | None:
+    """Layout (nb_zones, nb_targets_per_zone) from the header, or None if the values can't hold a valid frame"""
+    if len(values) < HEADER_LEN:
+        return None
+    nb_zones, nb_targets_per_zone = int(values[0]), int(values[1])
+    if nb_zones not in VALID_NB_ZONES or not 1 <= nb_targets_per_zone <= 4:
+        return None
+    if len(values) < frame_len(nb_zones, nb_targets_per_zone):
+        return None
+    return nb_zones, nb_targets_per_zone
+
+
+def _values_in_range(values: np.ndarray, layout: tuple[int, int]) -> np.ndarray:
+    """Which frames, shaped (n_frames, frame_len), have values that fit their fields. Others would wrap around"""
+    low, high = _value_bounds(*layout)
+    return ((low <= values) & (values <= high)).all(axis=1)
+
+
+def parse_line(line: bytes) -> VL53L5CX_Reading | None:
+    """Parses one line from the sensor. Truncated or malformed lines, or values their field can't hold, return None"""
+    values = parse_values(line)
+    layout = None if values is None else _frame_layout(values)
+    if layout is None or not _values_in_range(values[np.newaxis, :frame_len(*layout)], layout)[0]:
+        return None
+    return VL53L5CX_Reading.from_values(values)
+
+
+def parse_lines(lines: list[bytes]) -> list[VL53L5CX_Reading]:
+    """
+    Parses a batch of lines with a single pass over the joined bytes. Frames sharing the
+    layout of the first frame are converted to records in one go. Bad lines are dropped.
+    """
+    lines = [stripped for line in lines if (stripped := line.strip().rstrip(b';'))]
+    if not lines:
+        return list()
+
+    values = parse_values(b';'.join(lines))
+    if values is None:
+        # Some line is malformed, fall back to salvaging line by line
+        return [reading for line in lines if (reading := parse_line(line)) is not None]
+
+    token_counts = [line.count(b';') + 1 for line in lines]
+    offsets = np.concatenate(([0], np.cumsum(token_counts)))
+    frames = [values[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+    layouts = [_frame_layout(frame) for frame in frames]
+
+    common_layout = layouts[0]
+    if common_layout is not None and all(layout == common_layout for layout in layouts):
+        n_values = frame_len(*common_layout)
+        values = np.stack([frame[:n_values] for frame in frames])
+        values = values[_values_in_range(values, common_layout)]
+        if not len(values):
+            return list()
+        records = records_from_values(values)
+        return [VL53L5CX_Reading.from_record(records[ix, ...]) for ix in range(len(records))]
+
+    return [
+        VL53L5CX_Reading.from_values(frame) for frame, layout in zip(frames, layouts)
+        if layout is not None and _values_in_range(frame[np.newaxis, :frame_len(*layout)], layout)[0]
+    ]
 
-"""Index 0 is top row of zone, 7/64 pi, decremented 2/64 pi for each row (positive y direction)"""
-def get_theta_y(y: int):
-    return ((7 - (y * 2)) / 64) * math.pi
 
 # File operations
 def save_readings_json(readings: list[VL53L5CX_Reading], path: str):
     f = open(path, 'w')
-    json_obj = jsonpickle.encode(readings)
+    json_obj = jsonpickle_module().encode(readings)
     f.write(json_obj)
     f.close()
 
 def read_json_file(path: str):
     f = open(path)
-    return jsonpickle.decode(f.read())
\ No newline at end of file
+    return jsonpickle_module().decode(f.read())
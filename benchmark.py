@@ -0,0 +1,644 @@
+import argparse
+import json
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import Namespace
+from datetime import datetime
+from types import SimpleNamespace
+import numpy as np
+from VL53L5CX import VL53L5CX_Reading, parse_line, parse_lines, read_json_file, save_readings_json
+from binary_protocol import BinaryDecoder, encode_packet
+
+# No display needed
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+import pygame as pg
+
+try:
+    import resource
+except ImportError:
+    resource = None     # Not available on Windows
+
+"""
+Performance benchmarks for the whole pipeline, run without sensor or display.
+
+    python benchmark.py [stage ...] [-o results.json] [--quick]
+
+Each stage is timed separately. Inputs are the logs in example_logs and synthetic frames for
+4x4 and 8x8 with 1-4 targets per zone. The camera follows a scripted path, so runs are
+comparable. Results are printed (or saved) as JSON, together with the peak RSS of the process.
+
+Sensor rates we must keep up with (frames per second):
+    4x4 at 60 Hz
+    8x8 at 15 Hz
+"""
+
+EXAMPLE_LOGS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'example_logs')
+
+SENSOR_RATE_HZ = {16: 60, 64: 15}
+
+# (nb_zones, nb_targets_per_zone)
+LAYOUTS = [(nb_zones, nb_targets) for nb_zones in (16, 64) for nb_targets in (1, 2, 3, 4)]
+
+# Minimum time spent timing each case, see time_per_call()
+MIN_TIME = 0.5
+
+# Seconds from launching the viewer to its first frame drawn, see bench_startup()
+STARTUP_BUDGET = 1.0
+
+# Only needed by some modes or logs, must not be imported on the way to the first frame. numba is no
+# longer a dependency, it is listed so that bringing it back shows up in the results
+DEFERRED_MODULES = ('jsonpickle', 'serial', 'numba', 'tkinter', 'yaml', 'concurrent.futures.process')
+
+# Run in a new interpreter: opens the viewer on a log and draws its first frame
+STARTUP_SCRIPT = """
+import os, sys
+import main
+from argparse import Namespace
+window = main.Window3D(Namespace(replay={replay}, live=False, i={path!r}, f=None))
+for worker in window.workers:
+    worker.show_frame(0)
+window.draw()
+print(','.join(name for name in {deferred!r} if name in sys.modules))
+os._exit(0)     # Without waiting for the workers' threads
+"""
+
+
+def layout_name(nb_zones: int, nb_targets_per_zone: int) -> str:
+    row_len = int(math.sqrt(nb_zones))
+    return f'{row_len}x{row_len}x{nb_targets_per_zone}'
+
+
+def synthetic_line(rng: np.random.Generator, nb_zones: int, nb_targets_per_zone: int) -> bytes:
+    """One line in the serial format, with plausible values"""
+    tokens = [nb_zones, nb_targets_per_zone, int(rng.integers(20, 70))]
+    for _ in range(nb_zones):
+        tokens += [int(rng.integers(0, 50)), int(rng.integers(0, nb_targets_per_zone + 1)), int(rng.integers(1000, 16000))]
+        for _ in range(nb_targets_per_zone):
+            tokens += [
+                int(rng.integers(0, 3000)),     # signal_per_spad
+                int(rng.integers(0, 60)),       # range_sigma_mm
+                int(rng.integers(0, 4000)),     # distance_mm
+                int(rng.integers(0, 100)),      # reflectance
+                int(rng.choice([4, 5, 5, 5, 9, 12, 255])),  # target_status
+            ]
+    return (';'.join(str(token) for token in tokens) + ';\r\n').encode()
+
+
+def synthetic_frames(nb_zones: int, nb_targets_per_zone: int, n_frames: int = 32, seed: int = 0) -> list[VL53L5CX_Reading]:
+    rng = np.random.default_rng(seed)
+    return [parse_line(synthetic_line(rng, nb_zones, nb_targets_per_zone)) for _ in range(n_frames)]
+
+
+def example_logs() -> list[str]:
+    return sorted(os.path.join(EXAMPLE_LOGS_DIR, name) for name in os.listdir(EXAMPLE_LOGS_DIR) if name.endswith('.json'))
+
+
+def binary_decode(chunks: list[bytes]) -> list[VL53L5CX_Reading]:
+    """Binary protocol, as received in serial read chunks"""
+    decoder = BinaryDecoder()
+    return [reading for chunk in chunks for reading in decoder.feed(chunk)]
+
+
+def legacy_parse(rx_data: bytes):
+    """The parser as it was before the columnar readings: one int() and one object per value"""
+    data = rx_data.decode().replace(" ", "").strip().split(';')
+    ix = 0
+    nb_zones = int(data[0])
+    nb_targets_per_zone = int(data[ix:=ix+1])
+    silicon_temp_degc = int(data[ix:=ix+1])
+    zones = list()
+    for _ in range(nb_zones):
+        ambient_per_spad = int(data[ix:=ix+1])
+        nb_target_detected = int(data[ix:=ix+1])
+        nb_spads_enabled = int(data[ix:=ix+1])
+        targets = list()
+        for _ in range(nb_targets_per_zone):
+            targets.append(SimpleNamespace(
+                signal_per_spad=int(data[ix:=ix+1]),
+                range_sigma_mm=int(data[ix:=ix+1]),
+                distance_mm=int(data[ix:=ix+1]),
+                reflectance=int(data[ix:=ix+1]),
+                target_status=int(data[ix:=ix+1]),
+            ))
+        zones.append(SimpleNamespace(
+            ambient_per_spad=ambient_per_spad,
+            nb_target_detected=nb_target_detected,
+            nb_spads_enabled=nb_spads_enabled,
+            targets=targets,
+        ))
+    return SimpleNamespace(nb_zones=nb_zones, silicon_temp_degc=silicon_temp_degc, zones=zones)
+
+
+def legacy_draw_points(screen, points, visible, color_ix, radius, palette):
+    """Point drawing as it was before PointRenderer: one pg.draw.circle per point"""
+    h_width, h_height = screen.get_width() // 2, screen.get_height() // 2
+    for ix, vertex in enumerate(points):
+        if visible[ix]:
+            if not np.any((vertex == h_width) | (vertex == h_height)):
+                pg.draw.circle(screen, palette[color_ix[ix]], vertex, radius[ix])
+
+
+def time_per_call(func, arg=None, min_time: float | None = None) -> float:
+    """Mean seconds per call of func(arg), repeated for at least min_time seconds"""
+    min_time = MIN_TIME if min_time is None else min_time
+    func(arg)   # Warm up
+    n_calls = 0
+    start = time.perf_counter()
+    while (elapsed := time.perf_counter() - start) < min_time or n_calls == 0:
+        func(arg)
+        n_calls += 1
+    return elapsed / n_calls
+
+
+def result(stage: str, case: str, seconds: float, **extra) -> dict:
+    return {'stage': stage, 'case': case, 'ms_per_call': seconds * 1e3, **extra}
+
+
+# Rendering harness
+def make_render():
+    """A Window3D without workers, drawing to the dummy video driver"""
+    from main import Window3D
+    return Window3D(Namespace(replay=False, live=False))
+
+
+def camera_path(render, step: int):
+    """Scripted camera pose for a given step: sway around the home position (see Camera.control), moving in and out"""
+    camera = render.camera
+    camera.position = np.array([0.5 + 0.5 * math.sin(step / 10), 1 + 0.2 * math.sin(step / 7), -7 + 2 * math.sin(step / 13), 1.0])
+    camera.forward = np.array([0, 0, 1, 1])
+    camera.up = np.array([0, 1, 0, 1])
+    camera.right = np.array([1, 0, 0, 1])
+    camera.camera_yaw(0.2 * math.sin(step / 11))
+    camera.camera_pitch(0.1 * math.sin(step / 17))
+    camera.dirty = True
+
+
+def with_camera_path(render, func):
+    """Wraps func so that every call first moves the camera one step along the path"""
+    step = 0
+    def stepped(arg):
+        nonlocal step
+        camera_path(render, step)
+        step += 1
+        return func(arg)
+    return stepped
+
+
+# Stages
+def bench_parser() -> list[dict]:
+    rng = np.random.default_rng(0)
+    results = list()
+    for nb_zones, nb_targets_per_zone in LAYOUTS:
+        n_lines, batch_size = 64, 8
+        lines = [synthetic_line(rng, nb_zones, nb_targets_per_zone) for _ in range(n_lines)]
+        batches = [lines[ix:ix + batch_size] for ix in range(0, n_lines, batch_size)]
+        packets = b''.join(encode_packet(reading) for reading in parse_lines(lines))
+        chunks = [packets[ix:ix + 4096] for ix in range(0, len(packets), 4096)]
+
+        per_frame = {
+            'legacy': time_per_call(lambda lines: [legacy_parse(line) for line in lines], lines) / n_lines,
+            'parse_line': time_per_call(lambda lines: [parse_line(line) for line in lines], lines) / n_lines,
+            'parse_lines': time_per_call(lambda batches: [parse_lines(batch) for batch in batches], batches) / n_lines,
+            'binary': time_per_call(binary_decode, chunks) / n_lines,
+        }
+        for parser, seconds in per_frame.items():
+            results.append(result(
+                'parser', f'{parser} {layout_name(nb_zones, nb_targets_per_zone)}', seconds,
+                frames_per_s=1 / seconds,
+                # Share of one CPU core needed to keep up with the sensor
+                load_at_sensor_rate=seconds * SENSOR_RATE_HZ[nb_zones],
+            ))
+    return results
+
+
+def bench_frames() -> list[dict]:
+    """Frame construction from parsed values and from the nested jsonpickle layout"""
+    rng = np.random.default_rng(0)
+    results = list()
+    for nb_zones, nb_targets_per_zone in LAYOUTS:
+        line = synthetic_line(rng, nb_zones, nb_targets_per_zone)
+        values = np.fromstring(line.strip().rstrip(b';'), dtype=np.int64, sep=';')
+        legacy_dict = parse_line(line).to_legacy_dict()
+
+        name = layout_name(nb_zones, nb_targets_per_zone)
+        results.append(result('frames', f'from_values {name}', time_per_call(VL53L5CX_Reading.from_values, values)))
+        results.append(result('frames', f'from_legacy_dict {name}', time_per_call(VL53L5CX_Reading.from_legacy_dict, legacy_dict)))
+    return results
+
+
+def bench_pointcloud() -> list[dict]:
+    from sensor_frame_3d import Sensor3D
+    render = make_render()
+    sensor = Sensor3D(render, pg.Color('magenta'))
+
+    inputs = [(layout_name(*layout), synthetic_frames(*layout)) for layout in LAYOUTS]
+    inputs += [(os.path.basename(path), read_json_file(path)) for path in example_logs()]
+
+    results = list()
+    for case, frames in inputs:
+        seconds = time_per_call(lambda frames: [sensor.update_pointcloud(frame) for frame in frames], frames) / len(frames)
+        results.append(result('pointcloud', case, seconds))
+    return results
+
+
+def bench_filter() -> list[dict]:
+    """Temporal filter update per frame, all targets valid"""
+    from temporal_filter import TemporalFilter, FILTER_MODES
+
+    results = list()
+    for nb_zones, nb_targets_per_zone in ((16, 1), (64, 4)):
+        frames = synthetic_frames(nb_zones, nb_targets_per_zone)
+        valid = np.ones(nb_zones * nb_targets_per_zone, dtype=bool)
+        for mode in FILTER_MODES:
+            for window in (4, 16):
+                temporal_filter = TemporalFilter(mode, window)
+                seconds = time_per_call(lambda frames: [temporal_filter.update(frame, valid) for frame in frames], frames) / len(frames)
+                results.append(result(
+                    'filter', f'{mode} window {window} {layout_name(nb_zones, nb_targets_per_zone)}', seconds,
+                    load_at_sensor_rate=seconds * SENSOR_RATE_HZ[nb_zones],
+                ))
+    return results
+
+
+def bench_projection() -> list[dict]:
+    from sensor_frame_3d import Sensor3D
+    render = make_render()
+    sensor = Sensor3D(render, pg.Color('magenta'))
+    sensor.update_pointcloud(synthetic_frames(64, 4, n_frames=1)[0])
+    sensor.acquire_frame()
+
+    results = list()
+    for case, obj in [('sensor 8x8x4', sensor), ('static scene', render.static_scene)]:
+        seconds = time_per_call(with_camera_path(render, lambda _: obj.project_vertices()))
+        results.append(result('projection', case, seconds, n_vertices=len(obj.vertices)))
+    return results
+
+
+def bench_points() -> list[dict]:
+    from point_renderer import PointRenderer
+    from sensor_frame_3d import COLOR_SELECT, MAX_TARGETS, SIZE_BY_EDGE
+
+    rng = np.random.default_rng(0)
+    screen = pg.Surface((1920, 1080))
+    renderer = PointRenderer(COLOR_SELECT)
+    results = list()
+    for n_sensors in (1, 4, 8):
+        n_points = n_sensors * MAX_TARGETS
+        points = rng.uniform((0, 0), (1920, 1080), size=(n_points, 2))
+        visible = np.ones(n_points, dtype=bool)
+        color_ix = rng.integers(0, len(COLOR_SELECT), n_points)
+        radius = rng.choice(SIZE_BY_EDGE, n_points)
+
+        per_frame = {
+            'legacy': time_per_call(lambda _: legacy_draw_points(screen, points, visible, color_ix, radius, COLOR_SELECT)),
+            'point_renderer': time_per_call(lambda _: renderer.draw(screen, points, visible, color_ix, radius)),
+        }
+        for method, seconds in per_frame.items():
+            results.append(result('points', f'{method} {n_points} points', seconds, points_per_ms=n_points / (seconds * 1e3)))
+    return results
+
+
+def bench_rig() -> list[dict]:
+    """New frame on every sensor, then fuse, project and draw, with the camera moving"""
+    from sensor_rig import SensorRig
+    render = make_render()
+    frames = synthetic_frames(64, 4, n_frames=16)
+
+    results = list()
+    for n_sensors in (1, 4, 8, 16):
+        rig = SensorRig(render, [np.identity(4)] * n_sensors)
+        def frame(_):
+            for sensor, reading in zip(rig.sensors, frames):
+                sensor.update_pointcloud(reading)
+            rig.draw()
+        seconds = time_per_call(with_camera_path(render, frame))
+        results.append(result('rig', f'{n_sensors} sensors 8x8x4', seconds, ms_per_sensor=seconds * 1e3 / n_sensors))
+    return results
+
+
+def bench_voxels() -> list[dict]:
+    """Insert of one 8x8x4 frame into a full voxel map, and drawing the map"""
+    from voxel_map import VoxelMap, DEFAULT_MAX_VOXELS
+    render = make_render()
+    rng = np.random.default_rng(0)
+    origin = np.zeros(3)
+
+    results = list()
+    for voxel_size in (0.02, 0.05):
+        voxel_map = VoxelMap(render, voxel_size, DEFAULT_MAX_VOXELS)
+        while len(voxel_map) < DEFAULT_MAX_VOXELS * 0.9:
+            voxel_map.insert(rng.uniform(-3, 3, (256, 3)), origin)
+        frames = [rng.uniform(-3, 3, (256, 3)) for _ in range(16)]
+        seconds = time_per_call(lambda frames: [voxel_map.insert(points, origin) for points in frames], frames) / len(frames)
+        results.append(result(
+            'voxels', f'insert 256 points, {voxel_size * 100:g} cm', seconds,
+            load_at_sensor_rate=seconds * SENSOR_RATE_HZ[64], n_voxels=len(voxel_map),
+        ))
+
+    seconds = time_per_call(with_camera_path(render, lambda _: voxel_map.draw()))
+    results.append(result('voxels', f'draw {len(voxel_map.vertices)} occupied voxels', seconds))
+    return results
+
+
+def bench_stats() -> list[dict]:
+    """Statistics of a chunk of frames (log reports), of one frame (viewer, at sensor rate) and the heatmap"""
+    from log_stats import LogStats, CHUNK_FRAMES
+    from stats_heatmap import StatsHeatmap
+    render = make_render()
+
+    results = list()
+    for nb_zones, nb_targets in LAYOUTS:
+        frames = synthetic_frames(nb_zones, nb_targets)
+        records = np.stack([frame.record for frame in frames])
+        chunk = np.resize(records, CHUNK_FRAMES)
+        seconds = np.arange(CHUNK_FRAMES) / SENSOR_RATE_HZ[nb_zones]
+        stats = LogStats()
+
+        name = layout_name(nb_zones, nb_targets)
+        seconds_per_chunk = time_per_call(lambda _: stats.update(chunk, seconds))
+        results.append(result('stats', f'update {CHUNK_FRAMES} frames {name}', seconds_per_chunk, frames_per_second=CHUNK_FRAMES / seconds_per_chunk))
+        seconds_per_frame = time_per_call(lambda ix: stats.update(records[ix % len(records):][:1]), 0)
+        results.append(result('stats', f'update one frame {name}', seconds_per_frame, load_at_sensor_rate=seconds_per_frame * SENSOR_RATE_HZ[nb_zones]))
+
+    results.append(result('stats', f'report {stats.n_frames} frames', time_per_call(lambda _: stats.report())))
+    heatmap = StatsHeatmap(render, 'distance')
+    results.append(result('stats', 'draw heatmap 8x8', time_per_call(lambda _: heatmap.draw(stats, (20, 20)))))
+    return results
+
+
+def bench_faces() -> list[dict]:
+    """Rasterizing the room, i.e. what the static scene costs whenever the camera moves"""
+    render = make_render()
+    scene = render.static_scene
+
+    def draw_faces(_):
+        scene.background.fill(scene.background_color)
+        scene.draw_faces(scene.project_vertices(), scene.background)
+
+    scene.draw()
+    return [
+        result('faces', 'static scene, camera moving', time_per_call(with_camera_path(render, draw_faces)), n_faces=len(scene.faces)),
+        result('faces', 'static scene, camera still', time_per_call(lambda _: scene.draw())),
+    ]
+
+
+def bench_hud() -> list[dict]:
+    from workers import ReplayWorker
+    render = make_render()
+    results = [result('hud', 'camera info', time_per_call(lambda _: render.camera.draw_info()))]
+    # On a copy, opening a jsonpickle log writes its index next to it
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for path in example_logs()[:1]:
+            json_path = os.path.join(tmp_dir, os.path.basename(path))
+            shutil.copy(path, json_path)
+            worker = ReplayWorker(render=render, path_to_file=json_path, frequency=5, point_color=pg.Color('magenta'))
+            try:
+                results.append(result('hud', 'replay info', time_per_call(lambda _: worker.draw_info())))
+            finally:
+                worker.kill()
+    return results
+
+
+def bench_log() -> list[dict]:
+    from log_files import open_log, save_readings_binary, convert_log, BinaryLogWriter, TimeIndex, INDEX_SUFFIX, CODECS
+
+    results = list()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for path in example_logs():
+            name = os.path.basename(path)
+            json_path = os.path.join(tmp_dir, name)
+            shutil.copy(path, json_path)
+            binary_path = json_path + '.vlog'
+
+            frames = read_json_file(json_path)
+            save_readings_binary(frames, binary_path)
+
+            def open_cold(_):
+                if os.path.exists(json_path + INDEX_SUFFIX):
+                    os.remove(json_path + INDEX_SUFFIX)
+                return open_log(json_path)
+
+            # A timestamped log of 3 hours at 15 Hz, for seeking by time
+            timed_path = binary_path + '.timed.vlog'
+            n_timed = 15 * 3600 * 3
+            with BinaryLogWriter(timed_path, timestamps=True) as writer:
+                for ix in range(n_timed):
+                    frame = frames[ix % len(frames)]
+                    frame.timestamp_ns = ix * 10**9 // 15
+                    writer.write(frame)
+            timed_log = open_log(timed_path)
+            time_index = TimeIndex(timed_log, 15)
+            seek_times = np.random.default_rng(0).uniform(0, time_index.duration, 64)
+
+            def read_all(path):
+                log = open_log(path)
+                checksum = sum(int(frame.distance_mm.sum()) for frame in log)
+                log.close()
+                return checksum
+
+            cases = {
+                'json decode all': lambda _: read_json_file(json_path),
+                'json save': lambda _: save_readings_json(frames, json_path + '.out'),
+                'json open lazy, no index': lambda _: open_cold(_).close(),
+                'json open lazy, indexed': lambda _: open_log(json_path).close(),
+                'json read all lazy': lambda _: read_all(json_path),
+                'binary save': lambda _: save_readings_binary(frames, binary_path + '.out'),
+                'binary open': lambda _: open_log(binary_path).close(),
+                'binary read all': lambda _: read_all(binary_path),
+            }
+            for case, func in cases.items():
+                results.append(result('log', f'{case} {name}', time_per_call(func), n_frames=len(frames)))
+
+            seek = lambda _: [timed_log[time_index.frame_at(seconds)] for seconds in seek_times]
+            results.append(result('log', f'binary seek by time, 3 h log {name}', time_per_call(seek) / len(seek_times), n_frames=n_timed))
+
+            # Compressed logs: size against the jsonpickle log, and a frame in a chunk not yet decoded
+            for codec in CODECS:
+                compressed_path = convert_log(json_path, f'{binary_path}.{codec}.vlz', codec)
+                compressed_log = open_log(compressed_path)
+                uncached = lambda _: [compressed_log.cache.clear(), compressed_log[len(compressed_log) // 2]]
+                cases = {
+                    f'{codec} save': lambda _: convert_log(binary_path, f'{binary_path}.{codec}.out.vlz', codec),
+                    f'{codec} open': lambda _: open_log(compressed_path).close(),
+                    f'{codec} read all': lambda _: read_all(compressed_path),
+                    f'{codec} random frame': uncached,
+                }
+                ratio = os.path.getsize(json_path) / os.path.getsize(compressed_path)
+                for case, func in cases.items():
+                    results.append(result('log', f'{case} {name}', time_per_call(func), n_frames=len(frames), ratio_to_json=round(ratio, 1)))
+                compressed_log.close()
+            timed_log.close()
+    return results
+
+
+def bench_export() -> list[dict]:
+    """Per process, i.e. without the pool: converting all frames of a log to points and encoding them"""
+    import io
+    from point_cloud_export import run_points, write_body
+    from sensor_frame_3d import DEFAULT_STYLE
+    from style_rules import Style
+    from temporal_filter import TemporalFilter
+
+    style = Style(DEFAULT_STYLE)
+    results = list()
+    for path in example_logs():
+        name = os.path.basename(path)
+        records = np.stack([frame.record for frame in read_json_file(path)])
+        points = run_points(0, records, style, None)
+
+        cases = {
+            'points': lambda _: run_points(0, records, style, None),
+            'points, ema filter': lambda _: run_points(0, records, style, TemporalFilter('ema')),
+            'encode ply/npz': lambda _: write_body(io.BytesIO(), points, 'ply'),
+            'encode csv': lambda _: write_body(io.BytesIO(), points, 'csv'),
+        }
+        for case, func in cases.items():
+            results.append(result('export', f'{case} {name}', time_per_call(func), n_frames=len(records), n_points=len(points)))
+    return results
+
+
+def bench_startup() -> list[dict]:
+    """
+    Cold start, each case in a new interpreter: the time until the viewer has drawn the first
+    frame of a log, against STARTUP_BUDGET, and which of DEFERRED_MODULES got imported anyway
+    """
+    from log_files import convert_log
+
+    def launch(script: str) -> str:
+        process = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True,
+                                 cwd=os.path.dirname(os.path.abspath(__file__)))
+        return process.stdout.strip().splitlines()[-1] if process.stdout.strip() else ''
+
+    results = list()
+    for case, script in {'python': 'pass', 'import main': 'import main'}.items():
+        results.append(result('startup', case, time_per_call(launch, script)))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cases = {'first frame, no log': STARTUP_SCRIPT.format(replay=False, path=None, deferred=DEFERRED_MODULES)}
+        for path in example_logs():
+            json_path = os.path.join(tmp_dir, os.path.basename(path))
+            shutil.copy(path, json_path)
+            for log_path in (json_path, convert_log(json_path), convert_log(json_path, codec='zlib')):
+                script = STARTUP_SCRIPT.format(replay=True, path=log_path, deferred=DEFERRED_MODULES)
+                cases[f'first frame, replay {os.path.basename(log_path)}'] = script
+
+        for case, script in cases.items():
+            seconds = time_per_call(launch, script)
+            imported = [name for name in launch(script).split(',') if name]
+            results.append(result('startup', case, seconds, within_budget=seconds <= STARTUP_BUDGET, deferred_modules_imported=imported))
+            if seconds > STARTUP_BUDGET:
+                print(f'startup: {case} takes {seconds:.2f} s, over the budget of {STARTUP_BUDGET} s', file=sys.stderr)
+    return results
+
+
+def bench_video() -> list[dict]:
+    """Per process, i.e. without the pool: one video frame drawn offscreen and encoded, 30 fps"""
+    from video_render import VideoScene, DEFAULT_FPS
+
+    results = list()
+    # On copies, opening a jsonpickle log writes its index next to it
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for path in example_logs():
+            json_path = os.path.join(tmp_dir, os.path.basename(path))
+            shutil.copy(path, json_path)
+            args = Namespace(replay=True, live=False, i=json_path, f=None)
+            scene = VideoScene(tuple(sorted(vars(args).items())), DEFAULT_FPS)
+            frame = 0
+            def render(_):
+                nonlocal frame
+                screen = scene.render(frame)
+                frame += 1
+                return screen
+
+            cases = {
+                'draw': render,
+                'draw, encode rgb': lambda _: pg.image.tostring(render(_), 'RGB'),
+                'draw, encode png': lambda _: pg.image.save(render(_), os.path.join(tmp_dir, 'benchmark_frame.png')),
+            }
+            try:
+                for case, func in cases.items():
+                    seconds = time_per_call(func)
+                    results.append(result('video', f'{case} {os.path.basename(path)}', seconds, frames_per_second=1 / seconds))
+            finally:
+                for worker in scene.window.workers:
+                    worker.kill()
+    return results
+
+
+STAGES = {
+    'parser': bench_parser,
+    'frames': bench_frames,
+    'pointcloud': bench_pointcloud,
+    'filter': bench_filter,
+    'projection': bench_projection,
+    'points': bench_points,
+    'rig': bench_rig,
+    'voxels': bench_voxels,
+    'stats': bench_stats,
+    'faces': bench_faces,
+    'hud': bench_hud,
+    'log': bench_log,
+    'export': bench_export,
+    'video': bench_video,
+    'startup': bench_startup,
+}
+
+
+def peak_rss_kb() -> int | None:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak    # macOS reports bytes
+
+
+def run(stages: list[str]) -> dict:
+    results = list()
+    for stage in stages:
+        start = time.perf_counter()
+        stage_results = STAGES[stage]()
+        for stage_result in stage_results:
+            stage_result['peak_rss_kb'] = peak_rss_kb()
+        results += stage_results
+        print(f'{stage}: {len(stage_results)} cases in {time.perf_counter() - start:.1f} s', file=sys.stderr)
+
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pygame': pg.version.ver,
+        'min_time_s': MIN_TIME,
+        'peak_rss_kb': peak_rss_kb(),
+        'results': results,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="RemoteViewer benchmarks")
+    parser.add_argument("stages", nargs="*", help=f"Stages to run: {', '.join(STAGES)} (default: all)")
+    parser.add_argument("-o", type=str, help="Path to output file (default: print)")
+    parser.add_argument("--quick", action="store_true", help="Time each case briefly, for smoke testing")
+    args = parser.parse_args()
+
+    stages = args.stages or list(STAGES)
+    for stage in stages:
+        if stage not in STAGES:
+            parser.error(f"Unknown stage '{stage}'")
+
+    if args.quick:
+        MIN_TIME = 0.01
+
+    report = run(stages)
+    if args.o:
+        with open(args.o, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
@@ -0,0 +1,113 @@
+import zlib
+import numpy as np
+from VL53L5CX import VL53L5CX_Reading, VALID_NB_ZONES
+from log_files import record_dtype
+
+"""
+Binary serial protocol, an alternative to the ';' separated text lines
+
+    Packet:
+        sync                2 bytes     0xA5 0x5A
+        nb_zones            uint8       16 or 64
+        nb_targets_per_zone uint8       1 - 4
+        length              uint16      payload bytes, must equal the record size of the layout
+        payload             length bytes, one frame laid out as VL53L5CX.frame_dtype(nb_zones, nb_targets_per_zone)
+        crc                 uint32      CRC-32 (as zlib.crc32) of everything from nb_zones to the end of the payload
+
+All values are little-endian. The payload is the same record as in binary logs (.vlog), e.g. 3137
+bytes for 8x8 zones with 4 targets each, roughly a third of the same frame as text.
+
+0xA5 never occurs in the text format, which is how a stream is told apart from text lines.
+"""
+
+SYNC = b'\xa5\x5a'
+PACKET_HEADER_DTYPE = np.dtype([
+    ('sync', 'S2'),
+    ('nb_zones', 'u1'),
+    ('nb_targets_per_zone', 'u1'),
+    ('length', '<u2'),
+])
+PACKET_HEADER_SIZE = PACKET_HEADER_DTYPE.itemsize
+CRC_SIZE = 4
+MAX_TARGETS_PER_ZONE = 4
+
+
+def encode_packet(reading: VL53L5CX_Reading) -> bytes:
+    """One reading as a packet, e.g. for testing against a pty"""
+    payload = reading.record.astype(record_dtype(reading.nb_zones, reading.nb_targets_per_zone)).tobytes()
+
+    header = np.zeros((), dtype=PACKET_HEADER_DTYPE)
+    header['sync'] = SYNC
+    header['nb_zones'] = reading.nb_zones
+    header['nb_targets_per_zone'] = reading.nb_targets_per_zone
+    header['length'] = len(payload)
+
+    body = header.tobytes()[len(SYNC):] + payload
+    return SYNC + body + zlib.crc32(body).to_bytes(CRC_SIZE, 'little')
+
+
+class BinaryDecoder:
+    """
+    Decodes packets from a byte stream fed in arbitrary chunks.
+
+    Readings are views into the received bytes, not copies, unless a packet was split over
+    two chunks. After a corrupt packet (bad header or CRC) decoding resumes at the next sync word.
+    """
+    def __init__(self):
+        self.buffer = b''
+        self.frames = 0
+        self.errors = 0             # Packets dropped for a bad header or CRC
+        self.discarded_bytes = 0    # Bytes skipped while looking for a sync word
+
+    def feed(self, chunk: bytes) -> list[VL53L5CX_Reading]:
+        # Only a partial packet from the previous chunk is ever copied
+        buffer = self.buffer + chunk if self.buffer else bytes(chunk)
+        readings = list()
+        pos = 0
+
+        while True:
+            start = buffer.find(SYNC, pos)
+            if start == -1:
+                # Keep a trailing 0xA5, it may be the first half of a sync word
+                keep = 1 if pos < len(buffer) and buffer.endswith(SYNC[:1]) else 0
+                self.discarded_bytes += len(buffer) - pos - keep
+                pos = len(buffer) - keep
+                break
+            self.discarded_bytes += start - pos
+
+            if len(buffer) - start < PACKET_HEADER_SIZE:
+                pos = start
+                break
+            header = np.frombuffer(buffer, dtype=PACKET_HEADER_DTYPE, count=1, offset=start)[0]
+            nb_zones, nb_targets, length = int(header['nb_zones']), int(header['nb_targets_per_zone']), int(header['length'])
+
+            if (
+                nb_zones not in VALID_NB_ZONES
+                or not 1 <= nb_targets <= MAX_TARGETS_PER_ZONE
+                or length != record_dtype(nb_zones, nb_targets).itemsize
+            ):
+                # Not a packet, or a corrupt header. Look for the next sync word
+                self.errors += 1
+                self.discarded_bytes += len(SYNC)
+                pos = start + len(SYNC)
+                continue
+
+            end = start + PACKET_HEADER_SIZE + length + CRC_SIZE
+            if len(buffer) < end:
+                pos = start
+                break
+
+            crc = int.from_bytes(buffer[end - CRC_SIZE:end], 'little')
+            if zlib.crc32(memoryview(buffer)[start + len(SYNC):end - CRC_SIZE]) != crc:
+                self.errors += 1
+                self.discarded_bytes += len(SYNC)
+                pos = start + len(SYNC)
+                continue
+
+            records = np.frombuffer(buffer, dtype=record_dtype(nb_zones, nb_targets), count=1, offset=start + PACKET_HEADER_SIZE)
+            readings.append(VL53L5CX_Reading.from_record(records[0, ...]))
+            pos = end
+
+        self.buffer = buffer[pos:]
+        self.frames += len(readings)
+        return readings
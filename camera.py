@@ -1,6 +1,11 @@
 import pygame as pg
 from matrix_operations import *
 from copy import copy
+from profiler import profiler
+from hud import draw_panel
+
+# Keys that move or rotate the camera, see control()
+CONTROL_KEYS = [pg.K_a, pg.K_d, pg.K_w, pg.K_s, pg.K_q, pg.K_e, pg.K_LEFT, pg.K_RIGHT, pg.K_UP, pg.K_DOWN, pg.K_r]
 
 class Camera:
     def __init__(self, render, position):
@@ -17,14 +22,25 @@ class Camera:
         self.moving_speed = 0.025
         self.rotation_speed = 0.025
 
+        # Camera * projection matrix, shared by all objects. Recomputed when the camera has moved (dirty).
+        # version is incremented on every recompute, so that others can tell when the view has changed.
+        self.dirty = True
+        self.version = 0
+        self.view_projection = None
+
         # For info box
         self.text_color = pg.Color('aqua')
         self.font = pg.font.SysFont("Source Code Pro", 14)
         self.text_position = (20, 20) # (x, y)
 
 
-    def control(self):
+    def control(self) -> bool:
+        """Moves the camera by the keys held down, False if none are"""
         key = pg.key.get_pressed()
+        if not any(key[k] for k in CONTROL_KEYS):
+            return False
+        self.dirty = True
+
         if key[pg.K_a]:
             self.position -= self.right * self.moving_speed
         if key[pg.K_d]:
@@ -54,11 +70,10 @@ class Camera:
             self.forward = np.array([0, 0, 1, 1])
             self.up = np.array([0, 1, 0, 1])
             self.right = np.array([1, 0, 0, 1])
+        return True
     
 
     def draw_info(self):
-        cursor_x, cursor_y = self.text_position
-
         cam_position = self.render.camera.position
         cam_forward = self.render.camera.forward
         cam_up = self.render.camera.up
@@ -77,6 +92,10 @@ class Camera:
             ("Key Up / Key Down       - Pitch"          , 20),
             ("Key Left / Key Right    - Yaw"            , 20),
             ("R                       - Home Camera"    , 20),
+            ("F                       - Temporal filter"  , 20),
+            ("L                       - Reload style"     , 20),
+            ("P                       - Profiler overlay", 20),
+            ("V / H                   - Voxel map / Heatmap", 20),
             ("Cam position:"                            , 40),
             (cam_position_text                          , 20),
             (cam_forward_text                           , 20),
@@ -84,14 +103,12 @@ class Camera:
             (cam_right_text                             , 20),
         ]
 
-        for row in panel_rows:
-            cursor_y += row[1]
-            tmp_surface = self.font.render(row[0], True, self.text_color, None)
-            self.render.screen.blit(tmp_surface, (cursor_x, cursor_y))
+        draw_panel(self.render.screen, self.font, self.text_color, self.text_position, panel_rows)
 
 
     def draw(self):
-        self.draw_info()
+        with profiler.span('hud'):
+            self.draw_info()
 
     def camera_yaw(self, angle):
         rotate = rotate_y(angle)
@@ -131,3 +148,11 @@ class Camera:
 
     def camera_matrix(self):
         return self.translate_matrix() @ self.rotate_matrix()
+
+
+    def view_projection_matrix(self):
+        if self.dirty:
+            self.view_projection = self.camera_matrix() @ self.render.projection.projection_matrix
+            self.version += 1
+            self.dirty = False
+        return self.view_projection
@@ -1,4 +1,5 @@
 import argparse
+import sys
 from sys import exit
 from datetime import datetime
 
@@ -9,12 +10,69 @@ Commands:
     -l  --live          Open program with connection to sensor live via serial port
                         Parameters:
     -p                  Serial port e.g. 'COM3' or '/dev/TTY*' [String] (MANDATORY)
-    -o                  Output file path [String]                       (OPTIONAL)
+    -o                  Output file path, saved as .vlog [String]       (OPTIONAL)
+    --rotate-mb         Start a new log file every N megabytes [Int]    (OPTIONAL)
+    --rotate-min        Start a new log file every N minutes [Int]      (OPTIONAL)
 
     -rp --replay        Open program and and get input from file.
                         Parameters:
     -i                  Input file path [String]                        (MANDATORY)
-    -f                  Playback frequency [Int, Hz]                    (OPTIONAL)
+    -f                  Playback frequency of logs without timestamps [Int, Hz]  (OPTIONAL)
+                        Logs recorded in live view are played at their original timing
+    --video             Render the replay offscreen to video frames instead of a window, then exit:
+                        png or rgb [String]. See video_render.py         (OPTIONAL)
+    -o                  Output directory (png) or file, '-' for stdout (rgb) [String]  (OPTIONAL)
+    --fps               Video frames per second of log time, default 30 [Int]   (OPTIONAL)
+    -j  --jobs          Number of processes, default one per CPU [Int]  (OPTIONAL)
+
+    --convert           Convert a log to the binary log format (.vlog), or compressed (.vlz), then exit.
+                        Parameters:
+    -i                  Input file path [String]                        (MANDATORY)
+    -o                  Output file path, .vlog, .vlz or .json [String] (OPTIONAL)
+    --compress          Compress with zlib or lzma (.vlz) [String]      (OPTIONAL)
+
+    --stats             Write statistics of a log, or of every log in a directory, then exit:
+                        json or csv [String]. See log_stats.py
+                        Parameters:
+    -i                  Input file or directory [String]                (MANDATORY)
+    -o                  Output file, or directory [String]              (OPTIONAL)
+    -f                  Frequency of logs without timestamps [Int, Hz]  (OPTIONAL)
+
+    --export            Export a log, or every log in a directory, to point clouds, then exit:
+                        ply, npz or csv [String]. See point_cloud_export.py
+                        Parameters:
+    -i                  Input file or directory [String]                (MANDATORY)
+    -o                  Output file, or directory [String]              (OPTIONAL)
+    --per-frame         One file per frame instead of one merged file   (OPTIONAL)
+    -j  --jobs          Number of processes, default one per CPU [Int]  (OPTIONAL)
+    --style, --filter and --filter-window apply as in the viewer
+
+    --rig               Open program with several sensors, live and/or replayed, as configured in a
+                        rig configuration file (see sensor_rig.py) [String]
+                        Parameters:
+    -f                  Default playback frequency [Int, Hz]            (OPTIONAL)
+    --rotate-mb         Start a new log file every N megabytes [Int]    (OPTIONAL)
+    --rotate-min        Start a new log file every N minutes [Int]      (OPTIONAL)
+    --video, -o, --fps and -j render a rig of replayed sensors as in replay view
+
+    --filter            Smooth distances over the last frames: ema, median or outlier [String]  (OPTIONAL)
+                        Cycle with F while running. See temporal_filter.py
+    --filter-window     Number of frames the filter looks at, default 8 [Int]   (OPTIONAL)
+
+    --style             Style file (YAML) with the rules for which targets are drawn, their size and
+                        color, see style_rules.py. Reload with L while running [String]     (OPTIONAL)
+
+    --voxels            Accumulate the points into an occupancy map of voxels of this size, in meters
+                        [Float]. Toggle with V while running. See voxel_map.py         (OPTIONAL)
+    --voxel-max         Most voxels kept, the least recently hit are forgotten first [Int]  (OPTIONAL)
+    --voxel-max-age     Forget voxels not hit in this many frames [Int]            (OPTIONAL)
+
+    --heatmap           Show a heatmap of the zones: valid, distance, sigma, signal or ambient [String]
+                        Cycle with H while running. See stats_heatmap.py          (OPTIONAL)
+
+    --profile           Show per-stage timings (p50/p99) on screen, toggle with P   (OPTIONAL)
+    --trace             Record per-stage timings and write them as a Chrome trace
+                        (chrome://tracing, Perfetto) on exit [String]   (OPTIONAL)
 """
 
 def run_arg_parse():
@@ -22,11 +80,31 @@ def run_arg_parse():
     group = parser.add_mutually_exclusive_group()
     group.add_argument("--live", action="store_true")
     group.add_argument("--replay", action="store_true")
+    group.add_argument("--convert", action="store_true", help="Convert a log to binary or compressed log")
+    group.add_argument("--export", choices=["ply", "npz", "csv"], help="Export log(s) to point clouds")
+    group.add_argument("--stats", choices=["json", "csv"], help="Write statistics of log(s)")
+    group.add_argument("--rig", type=str, help="Rig configuration file, see sensor_rig.py")
     parser.add_argument("-p", type=str, help="COM port")
     parser.add_argument("-b", type=int, help="Baudrate (e.g. 115200)")
     parser.add_argument("-o", type=str, help="Path to output file")
     parser.add_argument("-i", type=str, help="Input file")
     parser.add_argument("-f", type=int, help="Playback frequency")
+    parser.add_argument("--compress", choices=["zlib", "lzma"], help="Compress the converted log (.vlz)")
+    parser.add_argument("--rotate-mb", type=int, help="Start a new log file every N megabytes")
+    parser.add_argument("--rotate-min", type=int, help="Start a new log file every N minutes")
+    parser.add_argument("--per-frame", action="store_true", help="Export one file per frame")
+    parser.add_argument("-j", "--jobs", type=int, help="Number of export or video processes (default one per CPU)")
+    parser.add_argument("--video", choices=["png", "rgb"], help="Render the replay to video frames instead of a window")
+    parser.add_argument("--fps", type=int, help="Video frames per second of log time (default 30)")
+    parser.add_argument("--filter", choices=["ema", "median", "outlier"], help="Smooth distances over the last frames")
+    parser.add_argument("--filter-window", type=int, help="Number of frames the filter looks at (default 8)")
+    parser.add_argument("--style", type=str, help="Style file (YAML) with filter, size and color rules")
+    parser.add_argument("--voxels", type=float, help="Accumulate points into an occupancy map with voxels of this size (m)")
+    parser.add_argument("--voxel-max", type=int, help="Most voxels kept in the occupancy map")
+    parser.add_argument("--voxel-max-age", type=int, help="Forget voxels not hit in this many frames")
+    parser.add_argument("--heatmap", choices=["valid", "distance", "sigma", "signal", "ambient"], help="Show a heatmap of the zones (cycle with H)")
+    parser.add_argument("--profile", action="store_true", help="Show per-stage timings on screen (toggle with P)")
+    parser.add_argument("--trace", type=str, help="Write per-stage timings as a Chrome trace to this file on exit")
 
     args = parser.parse_args()
 
@@ -38,7 +116,7 @@ def run_arg_parse():
             print("Baudrate MUST be specified with the option -b <baudrate>")
             exit()
         if not args.o:
-            print("Output will be saved to file in the format log_<date>_<time>.json")
+            print("Output will be saved to file in the format log_<date>_<time>.vlog")
             print("Output MAY be specified with the option -o <path/filename>")
     elif args.replay:
         if not args.i:
@@ -46,9 +124,38 @@ def run_arg_parse():
             exit()
         if not args.f:
             # args['f'] = 5
-            print("Playback frequency defaulted to 5Hz. MAY be specified with the option -f <Hz>")
+            # In video mode stdout may carry the frames
+            print("Playback frequency of logs without timestamps defaulted to 5Hz. MAY be specified with the option -f <Hz>",
+                  file=sys.stderr if args.video else sys.stdout)
+    elif args.convert:
+        if not args.i:
+            print("Input file not provided. MUST be specified with -i <path/filename>")
+            exit()
+        if not args.o:
+            print("Output will be saved next to the input file, with the extension .vlog (.vlz with --compress)")
+            print("Output MAY be specified with the option -o <path/filename>")
+    elif args.export:
+        if not args.i:
+            print("Input file or directory not provided. MUST be specified with -i <path>")
+            exit()
+        if not args.o:
+            print("Output will be saved next to the input, named after the log")
+            print("Output MAY be specified with the option -o <path>")
+    elif args.stats:
+        if not args.i:
+            print("Input file or directory not provided. MUST be specified with -i <path>")
+            exit()
+        if not args.o:
+            print("Output will be saved next to the input, named after the log")
+            print("Output MAY be specified with the option -o <path>")
+    elif args.rig:
+        pass
     else:
         print("No valid arguments given. See --help")
         exit()
 
+    if args.video and not (args.replay or args.rig):
+        print("Video MUST be rendered from a replay, with --replay or --rig")
+        exit()
+
     return args
\ No newline at end of file
@@ -0,0 +1,76 @@
+import threading
+from collections import deque
+
+# What FrameRing.put does when the ring is full
+KEEP_LATEST = 'latest'      # Drop the oldest frame, for display where only the newest matters
+LOSSLESS = 'lossless'       # Block until there is room, for recording
+
+
+class FrameRing:
+    """
+    Bounded, thread safe FIFO of frames between a producer and a consumer thread.
+
+    Frames lost to the KEEP_LATEST policy (or put after close()) are counted in dropped.
+    """
+    def __init__(self, capacity: int, policy: str = KEEP_LATEST):
+        if capacity < 1:
+            raise ValueError(f'Capacity must be at least 1, got {capacity}')
+        if policy not in (KEEP_LATEST, LOSSLESS):
+            raise ValueError(f'Unknown policy {policy!r}, expected {KEEP_LATEST!r} or {LOSSLESS!r}')
+
+        self.capacity = capacity
+        self.policy = policy
+        self.items = deque()
+        self.condition = threading.Condition()
+        self.closed = False
+
+        self.received = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def put(self, item, timeout: float | None = None) -> bool:
+        """Adds item, False if it was dropped (lossless ring closed or still full after timeout)"""
+        with self.condition:
+            self.received += 1
+
+            if self.closed:
+                self.dropped += 1
+                return False
+
+            if self.policy == LOSSLESS:
+                self.condition.wait_for(lambda: self.closed or len(self.items) < self.capacity, timeout)
+                if self.closed or len(self.items) >= self.capacity:
+                    self.dropped += 1
+                    return False
+            elif len(self.items) >= self.capacity:
+                self.items.popleft()
+                self.dropped += 1
+
+            self.items.append(item)
+            self.condition.notify_all()
+            return True
+
+    def get(self, timeout: float | None = None):
+        """Oldest item, or None if nothing arrived within timeout"""
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.items or self.closed, timeout) or not self.items:
+                return None
+            item = self.items.popleft()
+            self.condition.notify_all()
+            return item
+
+    def drain(self) -> list:
+        """All items, oldest first, without waiting"""
+        with self.condition:
+            items = list(self.items)
+            self.items.clear()
+            self.condition.notify_all()
+            return items
+
+    def close(self):
+        """Wakes up all waiting threads, further puts are dropped. Items already in the ring can still be read."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
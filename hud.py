@@ -0,0 +1,25 @@
+import pygame as pg
+from functools import lru_cache
+
+"""
+Info panels drawn over the scene. A panel is a list of rows (text string, px linespace above it).
+
+Most rows never change, and the others change far less often than frames are drawn. Rendered rows
+are cached, so that drawing a panel is mostly blits, and a row is only rendered again when its text
+(or font, or color) has changed.
+"""
+
+TEXT_CACHE_SIZE = 1024
+
+
+@lru_cache(maxsize=TEXT_CACHE_SIZE)
+def render_text(font: pg.font.Font, text: str, color: tuple[int, int, int, int]) -> pg.Surface:
+    return font.render(text, True, color, None)
+
+
+def draw_panel(screen: pg.Surface, font: pg.font.Font, color: pg.Color, position: tuple[int, int], panel_rows: list[tuple[str, int]]):
+    cursor_x, cursor_y = position
+    color = tuple(color)    # pg.Color is not hashable
+    for text, linespace in panel_rows:
+        cursor_y += linespace
+        screen.blit(render_text(font, text, color), (cursor_x, cursor_y))
@@ -0,0 +1,814 @@
+import json
+import lzma
+import mmap
+import numpy as np
+import os
+import threading
+import time
+import zlib
+from bisect import bisect_right
+from pathlib import Path
+from collections import OrderedDict
+from VL53L5CX import VL53L5CX_Reading, frame_dtype, read_json_file, save_readings_json
+from frame_buffer import FrameRing, LOSSLESS
+
+"""
+Binary log format (.vlog)
+
+    Header, HEADER_SIZE bytes:
+        magic               8 bytes     b'RVIEWLOG'
+        version             uint16
+        nb_zones            uint16
+        nb_targets_per_zone uint16
+        record_size         uint32      bytes per frame record
+        (zero padding)
+    Frame records, record_size bytes each:
+        timestamp_ns        int64       Version 2 only. time.monotonic_ns() when the frame was received
+        frame               laid out as VL53L5CX.frame_dtype(nb_zones, nb_targets_per_zone)
+
+All values are little-endian. The number of frames follows from the file size, so a log that
+was cut short (e.g. by a crash) is read up to the last complete frame.
+
+Version 2 logs are written by the live view. Version 1 logs (e.g. converted from jsonpickle) have
+no timestamps, and are still read.
+
+Compressed log format (.vlz), for archiving
+
+    Header, HEADER_SIZE bytes: as above with magic b'RVIEWLZC', followed by
+        codec               uint8       1 zlib, 2 lzma
+        chunk_frames        uint32      frames per chunk, all chunks but the last are full
+    Chunks, one after the other:
+        n_frames            uint32
+        timestamps_size     uint32      0 in version 1 logs
+        frames_size         uint32
+        timestamps          timestamps_size bytes, compressed
+        frames              frames_size bytes, compressed
+
+Within a chunk every field (and the timestamps) is stored as the chunk's first frame, the keyframe,
+followed by the differences to the frame before, per zone and target. These are mostly zero or
+small, either side of zero, and are zigzag coded (0, -1, 1, -2, ... as 0, 1, 2, 3, ...) so that
+small ones have zero high bytes. Fields are stored one after the other, zone by zone (the chunk's
+frames of a zone in a row), split into byte planes (all low bytes first), so that the compressor
+sees long runs of zeros. Differences wrap around in the field's own integer type, the log is
+lossless. Each chunk is decoded on its own, a frame costs at most one chunk.
+"""
+
+BINARY_LOG_SUFFIX = '.vlog'
+JSON_LOG_SUFFIX = '.json'
+MAGIC = b'RVIEWLOG'
+VERSION = 2
+UNTIMED_VERSION = 1
+HEADER_SIZE = 64
+
+HEADER_DTYPE = np.dtype([
+    ('magic', 'S8'),
+    ('version', '<u2'),
+    ('nb_zones', '<u2'),
+    ('nb_targets_per_zone', '<u2'),
+    ('record_size', '<u4'),
+])
+
+COMPRESSED_LOG_SUFFIX = '.vlz'
+COMPRESSED_MAGIC = b'RVIEWLZC'
+COMPRESSED_HEADER_DTYPE = np.dtype(HEADER_DTYPE.descr + [('codec', 'u1'), ('chunk_frames', '<u4')])
+CHUNK_HEADER_DTYPE = np.dtype([('n_frames', '<u4'), ('timestamps_size', '<u4'), ('frames_size', '<u4')])
+CHUNK_FRAMES = 256
+
+# (id in the header, compress, decompress)
+CODECS = {
+    'zlib': (1, lambda data: zlib.compress(data, 9), zlib.decompress),
+    'lzma': (2, lzma.compress, lzma.decompress),
+}
+CODEC_NAMES = {codec_id: name for name, (codec_id, _, _) in CODECS.items()}
+
+
+def record_dtype(nb_zones: int, nb_targets_per_zone: int) -> np.dtype:
+    return frame_dtype(nb_zones, nb_targets_per_zone).newbyteorder('<')
+
+
+def log_record_dtype(version: int, nb_zones: int, nb_targets_per_zone: int) -> np.dtype:
+    """Record of one frame in a binary log of the given version"""
+    if version == UNTIMED_VERSION:
+        return record_dtype(nb_zones, nb_targets_per_zone)
+    return np.dtype([('timestamp_ns', '<i8'), ('frame', record_dtype(nb_zones, nb_targets_per_zone))])
+
+
+def make_header(nb_zones: int, nb_targets_per_zone: int, version: int = VERSION) -> bytes:
+    header = np.zeros((), dtype=HEADER_DTYPE)
+    header['magic'] = MAGIC
+    header['version'] = version
+    header['nb_zones'] = nb_zones
+    header['nb_targets_per_zone'] = nb_targets_per_zone
+    header['record_size'] = log_record_dtype(version, nb_zones, nb_targets_per_zone).itemsize
+    return header.tobytes().ljust(HEADER_SIZE, b'\0')
+
+
+def log_magic(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC))
+
+
+def is_binary_log(path: str) -> bool:
+    return log_magic(path) == MAGIC
+
+
+class BinaryLog:
+    """
+    Memory mapped binary log. Opening is instant regardless of size, and indexing
+    returns readings that are views into the mapping, i.e. nothing is decoded or copied.
+
+    records holds the frame records, timestamps the capture timestamps (None for version 1 logs).
+    """
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            header = np.frombuffer(f.read(HEADER_SIZE).ljust(HEADER_SIZE, b'\0'), dtype=HEADER_DTYPE, count=1)[0]
+
+        if header['magic'] != MAGIC:
+            raise ValueError(f'{path} is not a binary log')
+        if header['version'] not in (UNTIMED_VERSION, VERSION):
+            raise ValueError(f'{path} has unsupported version {header["version"]}')
+
+        self.version = int(header['version'])
+        self.nb_zones = int(header['nb_zones'])
+        self.nb_targets_per_zone = int(header['nb_targets_per_zone'])
+        dtype = log_record_dtype(self.version, self.nb_zones, self.nb_targets_per_zone)
+        if header['record_size'] != dtype.itemsize:
+            raise ValueError(f'{path} has a corrupt header')
+
+        n_frames = (Path(path).stat().st_size - HEADER_SIZE) // dtype.itemsize
+        if n_frames > 0:
+            records = np.memmap(path, dtype=dtype, mode='r', offset=HEADER_SIZE, shape=(n_frames,))
+        else:
+            records = np.empty(0, dtype=dtype)
+
+        if self.version == UNTIMED_VERSION:
+            self.records, self.timestamps = records, None
+        else:
+            self.records, self.timestamps = records['frame'], records['timestamp_ns']
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, ix: int) -> VL53L5CX_Reading:
+        if ix < 0:
+            ix += len(self.records)
+        reading = VL53L5CX_Reading.from_record(self.records[ix, ...])
+        if self.timestamps is not None:
+            reading.timestamp_ns = int(self.timestamps[ix])
+        return reading
+
+    def __iter__(self):
+        for ix in range(len(self.records)):
+            yield self[ix]
+
+    def close(self):
+        # The mapping is released once no reading refers to it any more
+        self.records = self.records[:0]
+        if self.timestamps is not None:
+            self.timestamps = self.timestamps[:0]
+
+
+class BinaryLogWriter:
+    """
+    Appends readings to a binary log. The layout is taken from the first reading. With timestamps,
+    a version 2 log is written and every reading must carry its capture timestamp.
+    """
+    def __init__(self, path: str, timestamps: bool = False):
+        self.path = path
+        self.file = open(path, 'wb')
+        self.version = VERSION if timestamps else UNTIMED_VERSION
+        self.layout = None
+        self.dtype = None
+        self.row = None
+
+    def write(self, reading: VL53L5CX_Reading):
+        layout = (reading.nb_zones, reading.nb_targets_per_zone)
+        if self.layout is None:
+            self.layout = layout
+            self.dtype = log_record_dtype(self.version, *layout)
+            self.row = np.zeros((), dtype=self.dtype)
+            self.file.write(make_header(*layout, self.version))
+
+        if layout != self.layout:
+            raise ValueError('Readings in a binary log must share resolution and number of targets')
+
+        if self.version == UNTIMED_VERSION:
+            self.file.write(reading.record.astype(self.dtype, copy=False).tobytes())
+            return
+
+        if reading.timestamp_ns is None:
+            raise ValueError('Reading has no capture timestamp')
+        self.row['timestamp_ns'] = reading.timestamp_ns
+        self.row['frame'] = reading.record
+        self.file.write(self.row.tobytes())
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class StreamingLogWriter(threading.Thread):
+    """
+    Records readings to binary logs from a background thread, so that disk I/O never blocks the caller.
+
+    Readings are queued by append() and written in batches every flush_interval seconds, followed by
+    an fsync, so a crash or power loss costs at most the last batch. A new file is started when the
+    current one exceeds max_bytes or max_seconds (if given), or when the sensor layout changes.
+    Rotated files are named <stem>_<part><suffix>. Logs are written with the capture timestamps of
+    the readings (version 2).
+
+    The queue is a lossless ring of queue_size frames, append() blocks while it is full. If writing
+    fails (error), the queue is closed and further frames are dropped instead.
+    """
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int | None = None,
+        max_seconds: float | None = None,
+        flush_interval: float = 0.5,
+        queue_size: int = 4096,
+        ):
+        threading.Thread.__init__(self, daemon=True)
+
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.flush_interval = flush_interval
+        self.rotate = max_bytes is not None or max_seconds is not None
+
+        self.queue = FrameRing(queue_size, LOSSLESS)
+        self.stop_event = threading.Event()
+        self.paths = list()     # Files written so far
+        self.frames_written = 0
+        self.error = None       # OSError that stopped recording, e.g. disk full
+
+        self.writer = None
+        self.part = 0
+        self.file_bytes = 0
+        self.file_opened = 0.0
+
+    def append(self, reading: VL53L5CX_Reading):
+        self.queue.put(reading)
+
+    def close(self):
+        """Writes what is still queued, then closes the log"""
+        # Closed first, so that a frame either makes it into the last batch or is counted as dropped
+        self.queue.close()
+        self.stop_event.set()
+        if self.is_alive():
+            self.join()
+
+    def run(self):
+        try:
+            while not self.stop_event.is_set():
+                self.stop_event.wait(self.flush_interval)
+                self._write(self.queue.drain())
+            self._write(self.queue.drain())     # Queued while the last batch was written
+        except OSError as e:
+            # Frames are dropped from now on, rather than blocking the lossless queue's producer
+            self.error = e
+            self.queue.close()
+            print(f'Recording to {self.path} stopped: {e}')
+        finally:
+            if self.writer is not None:
+                self.writer.close()
+
+    def _write(self, batch: list[VL53L5CX_Reading]):
+        if not batch:
+            return
+
+        for reading in batch:
+            if self._needs_new_file(reading):
+                self._open_next_file()
+            self.writer.write(reading)
+            self.file_bytes += self.writer.dtype.itemsize
+        self.frames_written += len(batch)
+
+        self.writer.file.flush()
+        os.fsync(self.writer.file.fileno())
+
+    def _needs_new_file(self, reading: VL53L5CX_Reading) -> bool:
+        if self.writer is None:
+            return True
+        if self.writer.layout != (reading.nb_zones, reading.nb_targets_per_zone):
+            return True
+        if self.max_bytes is not None and self.file_bytes >= self.max_bytes:
+            return True
+        if self.max_seconds is not None and time.monotonic() - self.file_opened >= self.max_seconds:
+            return True
+        return False
+
+    def _open_next_file(self):
+        if self.writer is not None:
+            self.writer.close()
+
+        if self.rotate or self.part > 0:
+            path = self.path.with_name(f'{self.path.stem}_{self.part:03d}{self.path.suffix}')
+        else:
+            path = self.path
+
+        self.writer = BinaryLogWriter(str(path), timestamps=True)
+        self.paths.append(str(path))
+        self.part += 1
+        self.file_bytes = HEADER_SIZE
+        self.file_opened = time.monotonic()
+
+
+def encode_deltas(values: np.ndarray) -> bytes:
+    """Keyframe and zigzag coded differences along the first axis, by zone, as byte planes"""
+    size = values.dtype.itemsize
+    deltas = values.astype(f'<i{size}')
+    deltas[1:] -= deltas[:-1].copy()        # Wraps around
+    zigzag = (deltas << 1) ^ (deltas >> (8 * size - 1))
+    series = np.ascontiguousarray(np.moveaxis(zigzag, 0, -1))
+    return series.reshape(-1).view(np.uint8).reshape(-1, size).T.tobytes()
+
+
+def decode_deltas(planes: bytes, out: np.ndarray):
+    """Inverse of encode_deltas(), into out, which has the shape and type of the values encoded"""
+    size = out.dtype.itemsize
+    zigzag = np.frombuffer(planes, dtype=np.uint8).reshape(size, -1).T.copy().view(f'<u{size}')
+    zigzag = np.moveaxis(zigzag.reshape(out.shape[1:] + out.shape[:1]), -1, 0)
+    deltas = (zigzag >> 1) ^ -(zigzag & 1)
+    np.cumsum(deltas.view(out.dtype), axis=0, dtype=out.dtype, out=out)
+
+
+def encode_chunk(records: np.ndarray, timestamps: np.ndarray | None, compress) -> bytes:
+    frames = compress(b''.join(encode_deltas(records[name]) for name in records.dtype.names))
+    stamps = compress(encode_deltas(timestamps)) if timestamps is not None else b''
+    header = np.array((len(records), len(stamps), len(frames)), dtype=CHUNK_HEADER_DTYPE)
+    return header.tobytes() + stamps + frames
+
+
+def decode_frames(data: bytes, dtype: np.dtype, n_frames: int) -> np.ndarray:
+    records = np.empty(n_frames, dtype=dtype)
+    offset = 0
+    for name in dtype.names:
+        field = records[name]
+        size = field.size * field.dtype.itemsize
+        decode_deltas(data[offset:offset + size], field)
+        offset += size
+    return records
+
+
+class CompressedLogWriter:
+    """
+    Writes readings to a compressed log, a chunk at a time. The layout is taken from the first
+    reading. With timestamps, a version 2 log is written and every reading must carry its capture timestamp.
+    """
+    def __init__(self, path: str, codec: str = 'zlib', timestamps: bool = False, chunk_frames: int = CHUNK_FRAMES):
+        if codec not in CODECS:
+            raise ValueError(f'Unknown codec {codec!r}, expected one of {tuple(CODECS)}')
+        self.path = path
+        self.file = open(path, 'wb')
+        self.version = VERSION if timestamps else UNTIMED_VERSION
+        self.codec = codec
+        self.compress = CODECS[codec][1]
+        self.chunk_frames = chunk_frames
+        self.layout = None
+        self.records = list()
+        self.timestamps = list()
+
+    def write(self, reading: VL53L5CX_Reading):
+        layout = (reading.nb_zones, reading.nb_targets_per_zone)
+        if self.layout is None:
+            self.layout = layout
+            self.file.write(self.header())
+
+        if layout != self.layout:
+            raise ValueError('Readings in a compressed log must share resolution and number of targets')
+        if self.version != UNTIMED_VERSION:
+            if reading.timestamp_ns is None:
+                raise ValueError('Reading has no capture timestamp')
+            self.timestamps.append(reading.timestamp_ns)
+
+        self.records.append(reading.record)
+        if len(self.records) == self.chunk_frames:
+            self.flush()
+
+    def header(self) -> bytes:
+        header = np.zeros((), dtype=COMPRESSED_HEADER_DTYPE)
+        header['magic'] = COMPRESSED_MAGIC
+        header['version'] = self.version
+        header['nb_zones'], header['nb_targets_per_zone'] = self.layout
+        header['record_size'] = record_dtype(*self.layout).itemsize
+        header['codec'] = CODECS[self.codec][0]
+        header['chunk_frames'] = self.chunk_frames
+        return header.tobytes().ljust(HEADER_SIZE, b'\0')
+
+    def flush(self):
+        """Writes the frames so far as a chunk. Only the last chunk may be short"""
+        if not self.records:
+            return
+        records = np.stack(self.records).astype(record_dtype(*self.layout), copy=False)
+        timestamps = np.array(self.timestamps, dtype='<i8') if self.version != UNTIMED_VERSION else None
+        self.file.write(encode_chunk(records, timestamps, self.compress))
+        self.records.clear()
+        self.timestamps.clear()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class CompressedLog:
+    """
+    Compressed log, decoded a chunk at a time. Opening reads the chunk headers and the timestamps,
+    the frames are decompressed on access. The last cache_chunks decoded chunks are kept, so that
+    stepping through a chunk, or back and forth across the end of one, decompresses it once.
+
+    timestamps holds the capture timestamps (None for version 1 logs), as in BinaryLog.
+    """
+    def __init__(self, path: str, cache_chunks: int = 4):
+        self.path = path
+        self.cache_chunks = cache_chunks
+        self.file = open(path, 'rb')
+        header = np.frombuffer(self.file.read(HEADER_SIZE).ljust(HEADER_SIZE, b'\0'), dtype=COMPRESSED_HEADER_DTYPE, count=1)[0]
+
+        if header['magic'] != COMPRESSED_MAGIC:
+            raise ValueError(f'{path} is not a compressed log')
+        if header['version'] not in (UNTIMED_VERSION, VERSION):
+            raise ValueError(f'{path} has unsupported version {header["version"]}')
+        if header['codec'] not in CODEC_NAMES:
+            raise ValueError(f'{path} has unknown codec {header["codec"]}')
+
+        self.version = int(header['version'])
+        self.nb_zones = int(header['nb_zones'])
+        self.nb_targets_per_zone = int(header['nb_targets_per_zone'])
+        self.dtype = record_dtype(self.nb_zones, self.nb_targets_per_zone)
+        if header['record_size'] != self.dtype.itemsize:
+            raise ValueError(f'{path} has a corrupt header')
+        self.codec = CODEC_NAMES[int(header['codec'])]
+        self.decompress = CODECS[self.codec][2]
+        self.chunk_frames = int(header['chunk_frames'])
+
+        self.chunks, timestamps = self.read_chunk_headers()
+        self.n_frames = sum(n_frames for _, _, n_frames in self.chunks)
+        if any(n_frames != self.chunk_frames for _, _, n_frames in self.chunks[:-1]):
+            raise ValueError(f'{path} has a corrupt chunk')
+        if self.version == UNTIMED_VERSION:
+            self.timestamps = None
+        else:
+            self.timestamps = np.concatenate(timestamps) if timestamps else np.empty(0, dtype=np.int64)
+
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def read_chunk_headers(self) -> tuple[list[tuple[int, int, int]], list[np.ndarray]]:
+        """
+        (offset of the frames, their size, number of frames) of every chunk, and the timestamps of
+        each. A chunk that was cut short (e.g. by a crash) is left out.
+        """
+        file_size = os.fstat(self.file.fileno()).st_size
+        chunks, timestamps = list(), list()
+        offset = HEADER_SIZE
+        while offset + CHUNK_HEADER_DTYPE.itemsize <= file_size:
+            self.file.seek(offset)
+            n_frames, timestamps_size, frames_size = np.frombuffer(self.file.read(CHUNK_HEADER_DTYPE.itemsize), dtype=CHUNK_HEADER_DTYPE)[0].tolist()
+            frames_offset = offset + CHUNK_HEADER_DTYPE.itemsize + timestamps_size
+            if frames_offset + frames_size > file_size:
+                break
+
+            if self.version != UNTIMED_VERSION:
+                chunk_timestamps = np.empty(n_frames, dtype='<i8')
+                decode_deltas(self.decompress(self.file.read(timestamps_size)), chunk_timestamps)
+                timestamps.append(chunk_timestamps)
+            chunks.append((frames_offset, frames_size, n_frames))
+            offset = frames_offset + frames_size
+        return chunks, timestamps
+
+    def chunk(self, chunk_ix: int) -> np.ndarray:
+        """The frame records of a chunk, decoded"""
+        with self.lock:
+            records = self.cache.get(chunk_ix)
+            if records is not None:
+                self.cache.move_to_end(chunk_ix)
+                return records
+
+            offset, size, n_frames = self.chunks[chunk_ix]
+            self.file.seek(offset)
+            records = decode_frames(self.decompress(self.file.read(size)), self.dtype, n_frames)
+            self.cache[chunk_ix] = records
+            if len(self.cache) > self.cache_chunks:
+                self.cache.popitem(last=False)
+            return records
+
+    def read(self, start: int, stop: int) -> np.ndarray:
+        """Frame records start to stop, decoding every chunk involved once"""
+        parts = list()
+        for chunk_ix in range(start // self.chunk_frames, (stop - 1) // self.chunk_frames + 1 if stop > start else 0):
+            first = chunk_ix * self.chunk_frames
+            parts.append(self.chunk(chunk_ix)[max(start - first, 0):stop - first])
+        return np.concatenate(parts) if parts else np.empty(0, dtype=self.dtype)
+
+    def __len__(self):
+        return self.n_frames
+
+    def __getitem__(self, ix: int) -> VL53L5CX_Reading:
+        if ix < 0:
+            ix += self.n_frames
+        if not 0 <= ix < self.n_frames:
+            raise IndexError(ix)
+
+        chunk_ix, row = divmod(ix, self.chunk_frames)
+        reading = VL53L5CX_Reading.from_record(self.chunk(chunk_ix)[row, ...])
+        if self.timestamps is not None:
+            reading.timestamp_ns = int(self.timestamps[ix])
+        return reading
+
+    def __iter__(self):
+        for ix in range(self.n_frames):
+            yield self[ix]
+
+    def close(self):
+        # Readings stay valid, they refer to decoded chunks rather than the file
+        with self.lock:
+            self.file.close()
+            self.cache.clear()
+
+
+# Sidecar file with frame byte offsets of a jsonpickle log, stored next to the log as <log>.idx
+INDEX_SUFFIX = '.idx'
+
+
+# Every frame in a jsonpickle log starts with this
+JSON_FRAME_MARKER = b'{"py/object": "VL53L5CX.VL53L5CX_Reading"'
+
+
+def scan_json_frames(buffer) -> np.ndarray:
+    """
+    Byte ranges [start, end) of the frames in a jsonpickle log, shaped (n_frames, 2).
+    A range may include the separator after the frame.
+    """
+    starts = list()
+    ix = buffer.find(JSON_FRAME_MARKER)
+    while ix != -1:
+        starts.append(ix)
+        ix = buffer.find(JSON_FRAME_MARKER, ix + len(JSON_FRAME_MARKER))
+
+    if not starts:
+        # Not written by jsonpickle as we know it, count braces instead
+        return scan_json_objects(buffer)
+
+    starts = np.array(starts, dtype=np.int64)
+    ends = np.append(starts[1:], len(buffer))
+    return np.stack((starts, ends), axis=1)
+
+
+def scan_json_objects(buffer, chunk_size: int = 1 << 24) -> np.ndarray:
+    """
+    Byte ranges [start, end) of the objects at the top level of a JSON array, shaped (n_objects, 2).
+    Braces are counted in vectorized chunks, skipping those inside strings.
+    """
+    starts, ends = list(), list()
+    depth, in_string, prev_byte = 0, 0, 0
+
+    for offset in range(0, len(buffer), chunk_size):
+        chunk = np.frombuffer(buffer, dtype=np.uint8, count=min(chunk_size, len(buffer) - offset), offset=offset)
+        preceding = np.concatenate(([prev_byte], chunk[:-1]))
+        is_quote = (chunk == ord('"')) & (preceding != ord('\\'))
+        inside = (np.cumsum(is_quote, dtype=np.int64) + in_string) % 2 == 1
+
+        delta = (chunk == ord('{')).astype(np.int32) - (chunk == ord('}'))
+        delta[inside] = 0
+        depth_after = np.cumsum(delta, dtype=np.int64) + depth
+
+        starts.append(np.flatnonzero((delta == 1) & (depth_after == 1)) + offset)
+        ends.append(np.flatnonzero((delta == -1) & (depth_after == 0)) + offset + 1)
+
+        depth, in_string, prev_byte = int(depth_after[-1]), int(inside[-1]), chunk[-1]
+
+    starts, ends = np.concatenate(starts or [[]]), np.concatenate(ends or [[]])
+    n_objects = min(len(starts), len(ends))
+    return np.stack((starts[:n_objects], ends[:n_objects]), axis=1).astype(np.int64)
+
+
+def load_json_index(path: str, buffer) -> np.ndarray:
+    """Frame byte ranges of a jsonpickle log, from the sidecar index if it is up to date, else scanned (and saved)"""
+    stat = os.stat(path)
+    signature = np.array([[stat.st_size, stat.st_mtime_ns]], dtype=np.int64)
+    index_path = path + INDEX_SUFFIX
+
+    try:
+        with open(index_path, 'rb') as f:
+            index = np.load(f)
+        if np.array_equal(index[:1], signature):
+            return index[1:]
+    except (OSError, ValueError):
+        pass
+
+    ranges = scan_json_frames(buffer)
+    try:
+        with open(index_path, 'wb') as f:
+            np.save(f, np.concatenate((signature, ranges)))
+    except OSError:
+        pass    # E.g. read-only location, index is rebuilt next time
+    return ranges
+
+
+class LazyJsonLog:
+    """
+    jsonpickle log that decodes frames on demand, using an index of frame byte offsets.
+
+    Decoded frames are kept in an LRU cache. After each access, a background thread decodes
+    the next read_ahead frames in the direction the log is being stepped through.
+    """
+    def __init__(self, path: str, cache_size: int = 64, read_ahead: int = 8):
+        self.path = path
+        self.cache_size = cache_size
+        self.read_ahead = read_ahead
+
+        self.file = open(path, 'rb')
+        self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.ranges = load_json_index(path, self.buffer)
+
+        self.decoder = json.JSONDecoder()
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.last_ix = 0
+        self.direction = 1
+
+        self.read_ahead_from = None
+        self.read_ahead_event = threading.Event()
+        self.closed = False
+        self.read_ahead_thread = threading.Thread(target=self._read_ahead_loop, daemon=True)
+        self.read_ahead_thread.start()
+
+    def __len__(self):
+        return len(self.ranges)
+
+    def __getitem__(self, ix: int) -> VL53L5CX_Reading:
+        n_frames = len(self.ranges)
+        if ix < 0:
+            ix += n_frames
+        if not 0 <= ix < n_frames:
+            raise IndexError(ix)
+
+        step = (ix - self.last_ix) % n_frames
+        if step == 1:
+            self.direction = 1
+        elif step == n_frames - 1:
+            self.direction = -1
+        self.last_ix = ix
+
+        reading = self._get(ix)
+        self.read_ahead_from = ix
+        self.read_ahead_event.set()
+        return reading
+
+    def __iter__(self):
+        for ix in range(len(self.ranges)):
+            yield self[ix]
+
+    def close(self):
+        # Decoded readings stay valid, they don't refer to the mapped file
+        self.closed = True
+        self.read_ahead_event.set()
+        self.read_ahead_thread.join()
+        self.buffer.close()
+        self.file.close()
+
+    def _get(self, ix: int) -> VL53L5CX_Reading:
+        with self.lock:
+            reading = self.cache.get(ix)
+            if reading is not None:
+                self.cache.move_to_end(ix)
+                return reading
+
+        start, end = self.ranges[ix]
+        obj, _ = self.decoder.raw_decode(self.buffer[start:end].decode())
+        reading = VL53L5CX_Reading.from_legacy_dict(obj)
+
+        with self.lock:
+            self.cache[ix] = reading
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return reading
+
+    def _read_ahead_loop(self):
+        while True:
+            self.read_ahead_event.wait()
+            self.read_ahead_event.clear()
+            if self.closed:
+                return
+
+            ix, direction = self.read_ahead_from, self.direction
+            for step in range(1, self.read_ahead + 1):
+                # Give up on this run if the reader has moved on
+                if self.read_ahead_event.is_set():
+                    break
+                self._get((ix + step * direction) % len(self.ranges))
+
+
+def save_readings_binary(readings: list[VL53L5CX_Reading], path: str):
+    with BinaryLogWriter(path) as writer:
+        for reading in readings:
+            writer.write(reading)
+
+
+def open_log(path: str):
+    """Opens a log of any format, as a sequence of readings. Nothing is decoded up front"""
+    magic = log_magic(path)
+    if magic == MAGIC:
+        return BinaryLog(path)
+    if magic == COMPRESSED_MAGIC:
+        return CompressedLog(path)
+    return LazyJsonLog(path)
+
+
+class TimeIndex:
+    """
+    Time of every frame of a log, in seconds from the first frame, and the frame shown at a given time.
+
+    Capture timestamps are used if the log has them (binary logs from version 2). Otherwise frames
+    are taken to be 1 / frequency apart. Both directions are O(1), except the frame at a time in a
+    timestamped log, which is a binary search over the (memory mapped) timestamps, O(log n).
+    """
+    def __init__(self, log, frequency: float):
+        self.n_frames = len(log)
+        self.period = 1 / frequency
+        self.timestamps = getattr(log, 'timestamps', None)
+        if self.timestamps is not None and self.n_frames == 0:
+            self.timestamps = None
+        self.timed = self.timestamps is not None
+
+        if self.timed:
+            self.start_ns = int(self.timestamps[0])
+            last = self.time(self.n_frames - 1)
+            # The last frame is shown for as long as an average frame. Frames that share one timestamp
+            # (read in the same chunk) take no time, a log of only those lasts a period
+            self.duration = last + (last / (self.n_frames - 1) if last > 0 else self.period)
+        else:
+            self.duration = self.n_frames * self.period
+
+    def time(self, ix: int) -> float:
+        if self.timed:
+            return (int(self.timestamps[ix]) - self.start_ns) * 1e-9
+        return ix * self.period
+
+    def times(self, start: int, stop: int) -> np.ndarray:
+        """time() of the frames start to stop"""
+        if self.timed:
+            return (np.asarray(self.timestamps[start:stop], dtype=np.int64) - self.start_ns) * 1e-9
+        return np.arange(start, stop) * self.period
+
+    def frame_at(self, seconds: float) -> int:
+        """The last frame at or before the time, clamped to the log"""
+        if self.timed:
+            time_ns = self.start_ns + round(seconds * 1e9)
+            ix = bisect_right(range(self.n_frames), time_ns, key=lambda ix: int(self.timestamps[ix])) - 1
+        else:
+            ix = int(seconds / self.period + 1e-9)    # time(ix) maps back to ix despite rounding
+        return min(max(ix, 0), self.n_frames - 1)
+
+
+def convert_log(path_in: str, path_out: str | None = None, codec: str | None = None) -> str:
+    """
+    Converts a log of any format to the format of path_out's suffix: a binary log (.vlog), a
+    compressed log (.vlz, with codec, zlib unless given) or a jsonpickle log (.json). Without
+    path_out, a binary or (with codec) compressed log is written next to path_in. Capture
+    timestamps are kept, except in jsonpickle logs, which have none. Returns the path written
+    """
+    if path_out is None:
+        path_out = str(Path(path_in).with_suffix(COMPRESSED_LOG_SUFFIX if codec else BINARY_LOG_SUFFIX))
+    suffix = Path(path_out).suffix
+    if suffix not in (BINARY_LOG_SUFFIX, COMPRESSED_LOG_SUFFIX, JSON_LOG_SUFFIX):
+        raise ValueError(f'Unknown log format {suffix!r} of {path_out}, expected one of {(BINARY_LOG_SUFFIX, COMPRESSED_LOG_SUFFIX, JSON_LOG_SUFFIX)}')
+    if suffix == COMPRESSED_LOG_SUFFIX:
+        codec = codec or 'zlib'
+    elif codec is not None:
+        raise ValueError(f'Compressed logs are written with the suffix {COMPRESSED_LOG_SUFFIX}, not {suffix!r}')
+    if os.path.exists(path_out) and os.path.samefile(path_in, path_out):
+        raise ValueError(f'{path_in} would be overwritten by its own conversion')
+
+    if log_magic(path_in) in (MAGIC, COMPRESSED_MAGIC):
+        readings = open_log(path_in)
+    else:
+        readings = read_json_file(path_in)      # Parsed all at once, much faster than frame by frame
+    timestamps = getattr(readings, 'timestamps', None) is not None
+
+    if suffix == JSON_LOG_SUFFIX:
+        save_readings_json(list(readings), path_out)
+        if hasattr(readings, 'close'):
+            readings.close()
+        return path_out
+
+    writer = CompressedLogWriter(path_out, codec, timestamps) if codec else BinaryLogWriter(path_out, timestamps)
+    with writer:
+        for reading in readings:
+            writer.write(reading)
+    if hasattr(readings, 'close'):
+        readings.close()
+    return path_out
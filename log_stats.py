@@ -0,0 +1,354 @@
+import csv
+import json
+import os
+import threading
+import numpy as np
+from pathlib import Path
+from log_files import open_log, TimeIndex
+from sensor_frame_3d import VALID_TARGET_STATUS
+from workers import DEFAULT_REPLAY_FREQUENCY
+
+"""
+Streaming statistics over logs, e.g. to qualify where a sensor is mounted
+
+    json    The whole report: per layout (resolution and targets per zone), for every zone and
+            target, the detection rates, the distribution of each field and the target_status
+            histogram, and for the log, silicon_temp_degc over time
+    csv     One row per zone and target, the detection rates and field distributions
+
+Logs are read CHUNK_FRAMES frames at a time and folded into accumulators whose size does not depend
+on the length of the log, so a log is never held in memory. Each accumulator is updated with array
+operations over all frames of a chunk at once.
+
+    detected_rate   Frames in which the target was detected (target < nb_target_detected)
+    valid_rate      Frames in which it was detected with a valid target_status (VALID_TARGET_STATUS)
+    fields          Count, mean, std, min, max and percentiles, over the valid targets (zones: every
+                    frame). Means and variances of chunks are merged as by Chan et al., percentiles
+                    come from a histogram per zone and target (see HISTOGRAM_EDGES), exact to a bin
+    target_status   Histogram over the detected targets
+    temperature     Mean, min and max of silicon_temp_degc per TREND_SECONDS of log time, and the
+                    slope of a least squares line through all frames
+
+Times are the capture timestamps of the log, or frames 1 / frequency apart (see TimeIndex). The
+viewer keeps the same statistics of the frames it shows, drawn as a heatmap, see stats_heatmap.py.
+"""
+
+REPORT_FORMATS = ('json', 'csv')
+CHUNK_FRAMES = 2048
+TREND_SECONDS = 10.0
+PERCENTILES = (5, 50, 95)
+
+TARGET_STAT_FIELDS = ('distance_mm', 'range_sigma_mm', 'signal_per_spad', 'reflectance')
+ZONE_STAT_FIELDS = ('ambient_per_spad',)
+
+# Histogram bin edges, values outside go to the first or last bin. Rates (kcps/SPAD) are binned
+# logarithmically, they span several orders of magnitude between scenes
+HISTOGRAM_EDGES = {
+    'distance_mm': np.arange(0, 4097, 16),
+    'range_sigma_mm': np.arange(0, 257, 2),
+    'signal_per_spad': np.concatenate(([0], np.geomspace(1, 1 << 20, 161))),
+    'reflectance': np.arange(0, 129),
+    'ambient_per_spad': np.concatenate(([0], np.geomspace(1, 1 << 20, 161))),
+}
+
+
+class FieldStats:
+    """Count, mean, variance, extremes and histogram of a field, for each of n_cells (zones or targets)"""
+    def __init__(self, n_cells: int, edges: np.ndarray):
+        self.edges = edges
+        # Evenly spaced bins are found by division, others by binary search
+        widths = np.diff(edges)
+        self.width = widths[0] if np.all(widths == widths[0]) else None
+        self.count = np.zeros(n_cells, dtype=np.int64)
+        self.mean = np.zeros(n_cells)
+        self.m2 = np.zeros(n_cells)                 # Sum of squared differences to the mean
+        self.min = np.full(n_cells, np.inf)
+        self.max = np.full(n_cells, -np.inf)
+        self.histogram = np.zeros((n_cells, len(edges) - 1), dtype=np.int64)
+
+    def update(self, values: np.ndarray, mask: np.ndarray | None = None):
+        """Adds a chunk of values shaped (n_frames, n_cells), those where mask is set"""
+        values = values.astype(np.float64)
+        if mask is None:
+            mask = np.ones(values.shape, dtype=bool)
+        count = np.count_nonzero(mask, axis=0)
+        if not count.any():
+            return
+
+        masked = np.where(mask, values, 0.0)
+        mean = np.divide(masked.sum(axis=0), count, out=np.zeros(len(count)), where=count > 0)
+        m2 = np.where(mask, (values - mean) ** 2, 0.0).sum(axis=0)
+
+        total = self.count + count
+        delta = mean - self.mean
+        weight = np.divide(count, total, out=np.zeros(len(count)), where=total > 0)
+        self.mean += delta * weight
+        self.m2 += m2 + delta ** 2 * self.count * weight
+        self.count = total
+
+        np.minimum(self.min, np.where(mask, values, np.inf).min(axis=0), out=self.min)
+        np.maximum(self.max, np.where(mask, values, -np.inf).max(axis=0), out=self.max)
+
+        n_bins = self.histogram.shape[1]
+        selected = values[mask]
+        if self.width is not None:
+            bins = ((selected - self.edges[0]) // self.width).astype(np.intp)
+        else:
+            bins = np.searchsorted(self.edges, selected, side='right') - 1
+        np.clip(bins, 0, n_bins - 1, out=bins)
+        cells = np.broadcast_to(np.arange(values.shape[1]) * n_bins, values.shape)[mask]
+        self.histogram += np.bincount(cells + bins, minlength=self.histogram.size).reshape(self.histogram.shape)
+
+    def std(self) -> np.ndarray:
+        return np.sqrt(np.divide(self.m2, self.count, out=np.full(len(self.count), np.nan), where=self.count > 0))
+
+    def percentile(self, q: float) -> np.ndarray:
+        """Interpolated within the histogram bin it falls in, clamped to the extremes seen"""
+        cumulative = self.histogram.cumsum(axis=1)
+        rank = q / 100 * self.count
+        bins = np.minimum((cumulative < rank[:, np.newaxis]).sum(axis=1), self.histogram.shape[1] - 1)
+        cells = np.arange(len(bins))
+        below = cumulative[cells, bins] - self.histogram[cells, bins]
+        fraction = np.divide(rank - below, self.histogram[cells, bins], out=np.zeros(len(bins)), where=self.histogram[cells, bins] > 0)
+        value = self.edges[bins] + fraction * (self.edges[bins + 1] - self.edges[bins])
+        return np.where(self.count > 0, np.clip(value, self.min, self.max), np.nan)
+
+    def summary(self) -> dict[str, np.ndarray]:
+        """Per cell, NaN where there were no values"""
+        seen = self.count > 0
+        summary = {
+            'count': self.count,
+            'mean': np.where(seen, self.mean, np.nan),
+            'std': self.std(),
+            'min': np.where(seen, self.min, np.nan),
+            'max': np.where(seen, self.max, np.nan),
+        }
+        for q in PERCENTILES:
+            summary[f'p{q}'] = self.percentile(q)
+        return summary
+
+
+class LayoutStats:
+    """Statistics of the frames of one layout, per zone and target"""
+    def __init__(self, nb_zones: int, nb_targets_per_zone: int):
+        self.nb_zones = nb_zones
+        self.nb_targets_per_zone = nb_targets_per_zone
+        n_targets = nb_zones * nb_targets_per_zone
+        self.n_frames = 0
+        self.detected = np.zeros(n_targets, dtype=np.int64)
+        self.valid = np.zeros(n_targets, dtype=np.int64)
+        self.zone_valid = np.zeros(nb_zones, dtype=np.int64)     # Frames with any valid target in the zone
+        self.target_status = np.zeros((n_targets, 256), dtype=np.int64)
+        self.fields = {name: FieldStats(n_targets, HISTOGRAM_EDGES[name]) for name in TARGET_STAT_FIELDS}
+        self.fields.update({name: FieldStats(nb_zones, HISTOGRAM_EDGES[name]) for name in ZONE_STAT_FIELDS})
+
+    def update(self, records: np.ndarray):
+        """Adds frame records of this layout, shaped (n_frames,)"""
+        n_frames = len(records)
+        detected = np.arange(self.nb_targets_per_zone) < records['nb_target_detected'][:, :, np.newaxis]
+        status = records['target_status']
+        valid = detected & np.isin(status, VALID_TARGET_STATUS)
+
+        self.n_frames += n_frames
+        self.detected += np.count_nonzero(detected, axis=0).reshape(-1)
+        self.valid += np.count_nonzero(valid, axis=0).reshape(-1)
+        self.zone_valid += np.count_nonzero(valid.any(axis=2), axis=0)
+
+        cells = np.broadcast_to(np.arange(self.detected.size).reshape(status.shape[1:]) * 256, status.shape)
+        self.target_status += np.bincount((cells + status)[detected], minlength=self.target_status.size).reshape(self.target_status.shape)
+
+        valid = valid.reshape(n_frames, -1)
+        for name in TARGET_STAT_FIELDS:
+            self.fields[name].update(records[name].reshape(n_frames, -1), valid)
+        for name in ZONE_STAT_FIELDS:
+            self.fields[name].update(records[name])
+
+    def rates(self) -> dict[str, np.ndarray]:
+        frames = max(self.n_frames, 1)
+        return {'detected_rate': self.detected / frames, 'valid_rate': self.valid / frames}
+
+    def report(self) -> dict:
+        shape = (self.nb_zones, self.nb_targets_per_zone)
+        report = {
+            'nb_zones': self.nb_zones,
+            'nb_targets_per_zone': self.nb_targets_per_zone,
+            'frames': self.n_frames,
+            'zone_valid_rate': json_values(self.zone_valid / max(self.n_frames, 1)),
+        }
+        report.update({name: json_values(rate.reshape(shape)) for name, rate in self.rates().items()})
+
+        for name, stats in self.fields.items():
+            cell_shape = shape if name in TARGET_STAT_FIELDS else shape[:1]
+            report[name] = {key: json_values(values.reshape(cell_shape)) for key, values in stats.summary().items()}
+
+        seen = np.flatnonzero(self.target_status.sum(axis=0))
+        report['target_status_total'] = {str(status): int(self.target_status[:, status].sum()) for status in seen}
+        report['target_status'] = {str(status): json_values(self.target_status[:, status].reshape(shape)) for status in seen}
+        return report
+
+    def rows(self) -> list[dict]:
+        """One per zone and target, for the CSV report"""
+        rates = self.rates()
+        summaries = {name: stats.summary() for name, stats in self.fields.items()}
+        rows = list()
+        for zone in range(self.nb_zones):
+            for target in range(self.nb_targets_per_zone):
+                cell = zone * self.nb_targets_per_zone + target
+                row = {'nb_zones': self.nb_zones, 'nb_targets_per_zone': self.nb_targets_per_zone, 'zone': zone, 'target': target,
+                       'frames': self.n_frames, **{name: rate[cell] for name, rate in rates.items()}}
+                for name, summary in summaries.items():
+                    ix = cell if name in TARGET_STAT_FIELDS else zone
+                    row.update({f'{name}_{key}': values[ix] for key, values in summary.items()})
+                rows.append(row)
+        return rows
+
+
+class TemperatureTrend:
+    """silicon_temp_degc per bucket_seconds of log time, and a least squares line through all frames"""
+    def __init__(self, bucket_seconds: float = TREND_SECONDS):
+        self.bucket_seconds = bucket_seconds
+        self.count = np.zeros(0, dtype=np.int64)
+        self.sum = np.zeros(0)
+        self.min = np.zeros(0)
+        self.max = np.zeros(0)
+        self.sums = np.zeros(5)     # n, t, T, t * t, t * T
+
+    def update(self, temperature: np.ndarray, seconds: np.ndarray):
+        temperature = temperature.astype(np.float64)
+        buckets = (seconds // self.bucket_seconds).astype(np.intp)
+        n_buckets = max(len(self.count), int(buckets.max()) + 1)
+        if n_buckets > len(self.count):
+            grow = n_buckets - len(self.count)
+            self.count = np.concatenate((self.count, np.zeros(grow, dtype=np.int64)))
+            self.sum = np.concatenate((self.sum, np.zeros(grow)))
+            self.min = np.concatenate((self.min, np.full(grow, np.inf)))
+            self.max = np.concatenate((self.max, np.full(grow, -np.inf)))
+
+        self.count += np.bincount(buckets, minlength=n_buckets)
+        self.sum += np.bincount(buckets, weights=temperature, minlength=n_buckets)
+        np.minimum.at(self.min, buckets, temperature)
+        np.maximum.at(self.max, buckets, temperature)
+        self.sums += (len(seconds), seconds.sum(), temperature.sum(), (seconds * seconds).sum(), (seconds * temperature).sum())
+
+    def report(self) -> dict:
+        n, t, temperature, tt, t_temperature = self.sums
+        if n == 0:
+            return {'mean': None, 'min': None, 'max': None, 'slope_degc_per_minute': None, 'trend': []}
+        variance = n * tt - t * t
+        slope = (n * t_temperature - t * temperature) / variance * 60 if variance > 0 else 0.0
+        seen = np.flatnonzero(self.count)
+        return {
+            'mean': round(temperature / n, 3),
+            'min': float(self.min[seen].min()),
+            'max': float(self.max[seen].max()),
+            'slope_degc_per_minute': round(slope, 4),
+            'bucket_seconds': self.bucket_seconds,
+            'trend': [
+                {'start_s': bucket * self.bucket_seconds, 'frames': int(self.count[bucket]),
+                 'mean': round(self.sum[bucket] / self.count[bucket], 3), 'min': float(self.min[bucket]), 'max': float(self.max[bucket])}
+                for bucket in seen
+            ],
+        }
+
+
+class LogStats:
+    """
+    Statistics of a log, or of the frames a sensor has shown in the viewer, fed any number of frames
+    at a time. Frames of each layout are kept apart. Updated by one thread and read by another.
+    """
+    def __init__(self, trend_seconds: float = TREND_SECONDS):
+        self.layouts = dict()       # (nb_zones, nb_targets_per_zone): LayoutStats
+        self.temperature = TemperatureTrend(trend_seconds)
+        self.n_frames = 0
+        self.lock = threading.Lock()
+
+    def update(self, records: np.ndarray, seconds: np.ndarray | None = None):
+        """Adds frame records sharing a layout, shaped (n_frames,), taken at seconds (None: no trend)"""
+        nb_zones, nb_targets = records.dtype['distance_mm'].shape
+        with self.lock:
+            layout = self.layouts.get((nb_zones, nb_targets))
+            if layout is None:
+                layout = self.layouts[nb_zones, nb_targets] = LayoutStats(nb_zones, nb_targets)
+            layout.update(records)
+            if seconds is not None:
+                self.temperature.update(records['silicon_temp_degc'], seconds)
+            self.n_frames += len(records)
+
+    def report(self) -> dict:
+        with self.lock:
+            return {
+                'frames': self.n_frames,
+                'silicon_temp_degc': self.temperature.report(),
+                'layouts': [layout.report() for layout in self.layouts.values()],
+            }
+
+    def rows(self) -> list[dict]:
+        with self.lock:
+            return [row for layout in self.layouts.values() for row in layout.rows()]
+
+
+def json_values(values: np.ndarray) -> list:
+    """Nested lists, rounded, with None where NaN (not valid JSON)"""
+    if values.dtype.kind in 'iu':
+        return values.tolist()
+    return np.where(np.isnan(values), None, np.round(values, 3)).tolist()
+
+
+def stream_log_stats(path: str, frequency: float = DEFAULT_REPLAY_FREQUENCY, trend_seconds: float = TREND_SECONDS) -> tuple[LogStats, float]:
+    """Statistics of a log, read CHUNK_FRAMES frames at a time. Also returns its duration in seconds"""
+    from point_cloud_export import record_runs     # Not needed by the viewer, which imports this module
+    log = open_log(path)
+    time_index = TimeIndex(log, frequency)
+    stats = LogStats(trend_seconds)
+    for start in range(0, len(log), CHUNK_FRAMES):
+        for first, records in record_runs(log, start, min(start + CHUNK_FRAMES, len(log))):
+            stats.update(records, time_index.times(first, first + len(records)))
+    log.close()
+    return stats, time_index.duration
+
+
+def write_report(path_out: str, fmt: str, path_in: str, stats: LogStats, duration: float):
+    if fmt == 'json':
+        report = {'log': path_in, 'duration_s': round(duration, 3), **stats.report()}
+        with open(path_out, 'w') as f:
+            json.dump(report, f, indent=1)
+        return
+
+    rows = stats.rows()
+    with open(path_out, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else ['zone', 'target'])
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({key: '' if isinstance(value, float) and np.isnan(value) else value for key, value in row.items()})
+
+
+def output_path(path_in: str, path_out: str | None, fmt: str, in_directory: bool) -> str:
+    """Report file, next to the log unless given"""
+    name = f'{Path(path_in).stem}_stats.{fmt}'
+    if path_out is None:
+        return str(Path(path_in).with_name(name))
+    if in_directory:
+        return str(Path(path_out) / name)
+    return path_out
+
+
+def stats_logs(path_in: str, path_out: str | None = None, fmt: str = 'json', frequency: float | None = None) -> list[str]:
+    """
+    Writes a statistics report of a log, or of every log in a directory. frequency is that of logs
+    without timestamps. Returns the paths written.
+    """
+    from point_cloud_export import log_paths
+    if fmt not in REPORT_FORMATS:
+        raise ValueError(f'Unknown report format {fmt!r}, expected one of {REPORT_FORMATS}')
+
+    in_directory = os.path.isdir(path_in)
+    if in_directory and path_out:
+        os.makedirs(path_out, exist_ok=True)
+
+    written = list()
+    for path in log_paths(path_in):
+        stats, duration = stream_log_stats(path, frequency or DEFAULT_REPLAY_FREQUENCY)
+        out = output_path(path, path_out, fmt, in_directory)
+        write_report(out, fmt, path, stats, duration)
+        written.append(out)
+    return written
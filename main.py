@@ -1,11 +1,24 @@
+import os
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')   # stdout may carry video frames, see video_render.py
 from object_3d import *
 from camera import *
 from projection import *
 import pygame as pg
 from workers import ReplayWorker, SerialPortWorker
-from surface_3d import CheckerBoard
+from surface_3d import CheckerBoard, StaticScene
+from sensor_rig import SensorRig, load_rig_config
 from command_args import run_arg_parse
+from log_files import convert_log
+from profiler import profiler
+from temporal_filter import TemporalFilter, FILTER_MODES
+from style_rules import Style, load_style
+from voxel_map import VoxelMap, DEFAULT_VOXEL_SIZE, DEFAULT_MAX_VOXELS
+from hud import draw_panel
+from log_stats import LogStats
+from stats_heatmap import StatsHeatmap, HEATMAP_STATS
 from datetime import datetime
+import sys
+import threading
 
 """
 Commands:
@@ -14,25 +27,115 @@ Commands:
     -l  --live          Open program with connection to sensor live via serial port
                         Parameters:
     -p                  Serial port e.g. 'COM3' or '/dev/TTY*' [String] (MANDATORY)
-    -o                  Output file path [String]                       (OPTIONAL)
+    -o                  Output file path, saved as .vlog [String]       (OPTIONAL)
+    --rotate-mb         Start a new log file every N megabytes [Int]    (OPTIONAL)
+    --rotate-min        Start a new log file every N minutes [Int]      (OPTIONAL)
 
     -rp --replay        Open program and and get input from file.
                         Parameters:
     -i                  Input file path [String]                        (MANDATORY)
-    -f                  Playback frequency [Int, Hz]                    (OPTIONAL)
+    -f                  Playback frequency of logs without timestamps [Int, Hz]  (OPTIONAL)
+                        Logs recorded in live view are played at their original timing
+    --video             Render the replay offscreen to video frames instead of a window, then exit:
+                        png or rgb [String]. See video_render.py         (OPTIONAL)
+    -o                  Output directory (png) or file, '-' for stdout (rgb) [String]  (OPTIONAL)
+    --fps               Video frames per second of log time, default 30 [Int]   (OPTIONAL)
+    -j  --jobs          Number of processes, default one per CPU [Int]  (OPTIONAL)
+
+    --convert           Convert a log to the binary log format (.vlog), or compressed (.vlz), then exit.
+                        Parameters:
+    -i                  Input file path [String]                        (MANDATORY)
+    -o                  Output file path, .vlog, .vlz or .json [String] (OPTIONAL)
+    --compress          Compress with zlib or lzma (.vlz) [String]      (OPTIONAL)
+
+    --stats             Write statistics of a log, or of every log in a directory, then exit:
+                        json or csv [String]. See log_stats.py
+                        Parameters:
+    -i                  Input file or directory [String]                (MANDATORY)
+    -o                  Output file, or directory [String]              (OPTIONAL)
+    -f                  Frequency of logs without timestamps [Int, Hz]  (OPTIONAL)
+
+    --export            Export a log, or every log in a directory, to point clouds, then exit:
+                        ply, npz or csv [String]. See point_cloud_export.py
+                        Parameters:
+    -i                  Input file or directory [String]                (MANDATORY)
+    -o                  Output file, or directory [String]              (OPTIONAL)
+    --per-frame         One file per frame instead of one merged file   (OPTIONAL)
+    -j  --jobs          Number of processes, default one per CPU [Int]  (OPTIONAL)
+    --style, --filter and --filter-window apply as in the viewer
+
+    --rig               Open program with several sensors, live and/or replayed, as configured in a
+                        rig configuration file (see sensor_rig.py) [String]
+                        Parameters:
+    -f                  Default playback frequency [Int, Hz]            (OPTIONAL)
+    --rotate-mb         Start a new log file every N megabytes [Int]    (OPTIONAL)
+    --rotate-min        Start a new log file every N minutes [Int]      (OPTIONAL)
+    --video, -o, --fps and -j render a rig of replayed sensors as in replay view
+
+    --filter            Smooth distances over the last frames: ema, median or outlier [String]  (OPTIONAL)
+                        Cycle with F while running. See temporal_filter.py
+    --filter-window     Number of frames the filter looks at, default 8 [Int]   (OPTIONAL)
+
+    --style             Style file (YAML) with the rules for which targets are drawn, their size and
+                        color, see style_rules.py. Reload with L while running [String]     (OPTIONAL)
+
+    --voxels            Accumulate the points into an occupancy map of voxels of this size, in meters
+                        [Float]. Toggle with V while running. See voxel_map.py         (OPTIONAL)
+    --voxel-max         Most voxels kept, the least recently hit are forgotten first [Int]  (OPTIONAL)
+    --voxel-max-age     Forget voxels not hit in this many frames [Int]            (OPTIONAL)
+
+    --heatmap           Show a heatmap of the zones: valid, distance, sigma, signal or ambient [String]
+                        Cycle with H while running. See stats_heatmap.py          (OPTIONAL)
+
+    --profile           Show per-stage timings (p50/p99) on screen, toggle with P   (OPTIONAL)
+    --trace             Record per-stage timings and write them as a Chrome trace
+                        (chrome://tracing, Perfetto) on exit [String]   (OPTIONAL)
 """
 
+# Posted by damage() to wake run() from waiting for events
+REDRAW_EVENT = pg.event.custom_type()
+
+# Longest run() sleeps with nothing to draw, damage() and input wake it earlier
+IDLE_WAIT_MS = 1000
+
+
+def damages(event: pg.event.Event) -> bool:
+    """Events that may change what is drawn: all but wake-ups and the mouse moving with no button held"""
+    if event.type in (pg.NOEVENT, REDRAW_EVENT):
+        return False
+    return event.type != pg.MOUSEMOTION or any(event.buttons)
+
+
 class Window3D:
-    def __init__(self):        
-        args = run_arg_parse()
+    def __init__(self, args, offscreen: bool = False):
         pg.init()
         self.RES = self.WIDTH, self.HEIGHT = 1920, 1080
         self.H_WIDTH, self.H_HEIGHT = self.WIDTH // 2, self.HEIGHT //2
         self.FPS = 60
-        self.screen = pg.display.set_mode(self.RES)
+        # Offscreen, the scene is drawn onto a plain surface and the workers are not started, the
+        # caller moves them on (see video_render.py)
+        self.offscreen = offscreen
+        self.screen = pg.Surface(self.RES) if offscreen else pg.display.set_mode(self.RES)
         self.clock = pg.time.Clock()
+
+        # A frame is only drawn when something has changed: input, camera movement, or damage() from
+        # any thread, e.g. a sensor with a new frame. See run()
+        self.damaged = True
+        self.damage_lock = threading.Lock()
+        self.camera_moving = False
+
         self.create_objects()
         self.workers = list()
+        self.rig = None
+
+        # Per-stage timings, see profiler.py
+        self.trace_path = getattr(args, 'trace', None)
+        if self.trace_path:
+            profiler.start_trace()
+        self.show_profiler = getattr(args, 'profile', False)
+        profiler.enabled = self.show_profiler or profiler.tracing
+        self.profiler_font = pg.font.SysFont("Source Code Pro", 14)
+        self.profiler_position = (self.WIDTH - 480, 20) # (x, y)
 
         if args.replay:
             self.workers.append(
@@ -48,7 +151,7 @@ class Window3D:
             save_path = ""
             if args.o == None:
                 file_timestamp = datetime.now().strftime("%d%m%Y_%H%M%S")
-                save_path = f'log_{file_timestamp}.json'
+                save_path = f'log_{file_timestamp}.vlog'
             else:
                 save_path = args.o
 
@@ -58,15 +161,130 @@ class Window3D:
                     com_port=args.p,
                     baud_rate=args.b,
                     path_to_save=save_path,
-                    point_color=pg.Color('magenta')
+                    point_color=pg.Color('magenta'),
+                    rotate_bytes=args.rotate_mb * 1024 * 1024 if args.rotate_mb else None,
+                    rotate_seconds=args.rotate_min * 60 if args.rotate_min else None,
                 )
             )
 
+        elif getattr(args, 'rig', None):
+            self.create_rig(args)
+
         else:
             pass
 
+        self.filter_window = getattr(args, 'filter_window', None) or 8
+        self.set_temporal_filter(getattr(args, 'filter', None))
+        self.style_path = getattr(args, 'style', None)
+        if self.style_path:
+            self.set_style(load_style(self.style_path))
+
+        # Occupancy map accumulated over time, see voxel_map.py
+        self.voxel_size = getattr(args, 'voxels', None) or DEFAULT_VOXEL_SIZE
+        self.voxel_max = getattr(args, 'voxel_max', None) or DEFAULT_MAX_VOXELS
+        self.voxel_max_age = getattr(args, 'voxel_max_age', None)
+        self.voxel_info_position = (self.WIDTH - 300, self.HEIGHT - 200) # (x, y)
+        self.set_voxel_map(getattr(args, 'voxels', None) is not None)
+
+        # Statistics of the frames shown, drawn as a heatmap per sensor, see stats_heatmap.py
+        self.heatmap = None
+        self.heatmap_position = (self.WIDTH - 360, 380) # (x, y), further sensors to the left
+        self.set_heatmap(getattr(args, 'heatmap', None))
+
+        if not offscreen:
+            for worker in self.workers:
+                worker.start()
+
+
+    def create_rig(self, args):
+        sources = load_rig_config(args.rig)
+        self.rig = SensorRig(self, [source['pose'] for source in sources])
+        file_timestamp = datetime.now().strftime("%d%m%Y_%H%M%S")
+
+        for ix, (source, sensor) in enumerate(zip(sources, self.rig.sensors)):
+            # Info boxes in a grid below the camera info
+            info_position = (20 + 360 * (ix % 5), 360 + 340 * (ix // 5))
+
+            if 'replay' in source:
+                self.workers.append(
+                    ReplayWorker(
+                        render=self,
+                        path_to_file=source['replay'],
+                        frequency=source.get('frequency', args.f or 5),
+                        point_color=pg.Color('magenta'),
+                        sensor=sensor,
+                        name=source['name'],
+                        info_position=info_position,
+                        scrubber_row=sum(isinstance(worker, ReplayWorker) for worker in self.workers),
+                    )
+                )
+            else:
+                self.workers.append(
+                    SerialPortWorker(
+                        render=self,
+                        com_port=source['port'],
+                        baud_rate=source['baud_rate'],
+                        path_to_save=source.get('output', f"log_{file_timestamp}_{source['name']}.vlog"),
+                        point_color=pg.Color('magenta'),
+                        rotate_bytes=args.rotate_mb * 1024 * 1024 if args.rotate_mb else None,
+                        rotate_seconds=args.rotate_min * 60 if args.rotate_min else None,
+                        sensor=sensor,
+                        name=source['name'],
+                        info_position=info_position,
+                    )
+                )
+
+
+    def set_temporal_filter(self, mode: str | None):
+        self.filter_mode = mode
+        for worker in self.workers:
+            worker.sensor.temporal_filter = TemporalFilter(mode, self.filter_window) if mode else None
+
+
+    def cycle_temporal_filter(self):
+        modes = [None, *FILTER_MODES]
+        self.set_temporal_filter(modes[(modes.index(self.filter_mode) + 1) % len(modes)])
+
+
+    def set_voxel_map(self, enabled: bool):
+        """Starts a new, empty map, or stops accumulating"""
+        self.voxel_map = VoxelMap(self, self.voxel_size, self.voxel_max, self.voxel_max_age) if enabled else None
         for worker in self.workers:
-            worker.start()
+            worker.sensor.voxel_map = self.voxel_map
+
+
+    def set_heatmap(self, stat: str | None):
+        """Shows a statistic, or none. Statistics are kept while the heatmap is shown, from when it was turned on"""
+        if stat is not None and self.heatmap is None:
+            for worker in self.workers:
+                worker.sensor.stats = LogStats()
+        elif stat is None:
+            for worker in self.workers:
+                worker.sensor.stats = None
+        self.heatmap = StatsHeatmap(self, stat) if stat else None
+
+
+    def cycle_heatmap(self):
+        stats = [None, *HEATMAP_STATS]
+        self.set_heatmap(stats[(stats.index(self.heatmap and self.heatmap.stat) + 1) % len(stats)])
+
+
+    def set_style(self, style: Style):
+        if self.rig is not None:
+            self.rig.set_style(style)
+        else:
+            for worker in self.workers:
+                worker.sensor.style = style
+
+
+    def reload_style(self):
+        if not self.style_path:
+            return
+        try:
+            self.set_style(load_style(self.style_path))
+            print(f'Style reloaded from {self.style_path}')
+        except (OSError, ValueError) as e:
+            print(f'Style not reloaded: {e}')
 
 
     def create_objects(self):
@@ -81,49 +299,130 @@ class Window3D:
         self.rear_wall = CheckerBoard(self, (2.0, 1.5), (0.1, 0.1), pg.Color('gray25'))
         self.rear_wall.translate((-1.0, -0.5, 1.6))
 
+        # The room never moves, it is rendered to a cached background
+        self.static_scene = StaticScene(self, [self.floor, self.rear_wall], pg.Color('gray8'))
+
+
+    def damage(self):
+        """Asks for the next frame to be drawn, from any thread. Wakes run() if it is waiting"""
+        with self.damage_lock:
+            if self.damaged:
+                return
+            self.damaged = True
+        if not self.offscreen:
+            pg.event.post(pg.event.Event(REDRAW_EVENT))
+
+
+    def take_damage(self) -> bool:
+        with self.damage_lock:
+            damaged, self.damaged = self.damaged, False
+        return damaged
+
 
     def draw(self):
-        self.screen.fill(pg.Color('gray8'))
+        # Draw static objects, this also clears the screen
+        self.static_scene.draw()
 
-        # Draw static objects
-        self.floor.draw()
-        self.rear_wall.draw()
+        if self.voxel_map is not None:
+            self.voxel_map.draw()
+            self.voxel_map.draw_info(self.voxel_info_position)
 
-        # Draw foreground
+        # Draw foreground. All sensors of a rig are drawn at once, their workers only draw info
+        if self.rig is not None:
+            self.rig.draw()
         for worker in self.workers:
             worker.draw()
         
         self.camera.draw()  # Has info box, draw it.
 
+        if self.heatmap is not None:
+            for ix, worker in enumerate(self.workers):
+                x, y = self.heatmap_position
+                self.heatmap.draw(worker.sensor.stats, (x - 360 * ix, y), worker.sensor_name)
+
+        if self.show_profiler:
+            self.draw_profiler_info()
+
+
+    def draw_profiler_info(self):
+        panel_rows = [
+            # (text string,                    px linespace )
+            ("Profiler:                 p50 ms   p99 ms",  0),
+        ]
+        for name, p50, p99, _ in profiler.summary():
+            panel_rows.append((f'{name:<24} {p50:8.3f} {p99:8.3f}', 20))
+        draw_panel(self.screen, self.profiler_font, pg.Color('yellow'), self.profiler_position, panel_rows)
+
 
     def quit(self):
         for worker in self.workers:
             worker.kill()
             worker.join() # the worker in the afterlife
+        if self.trace_path:
+            profiler.export_trace(self.trace_path)
+            print(f'Trace saved to {self.trace_path}')
         exit()
 
 
     def run(self):
+        pg.display.set_caption("RemoteViewer")
         while True:
-            # Event loop
-            events = pg.event.get()
+            # Event loop. With nothing to draw and no camera key held, sleep until there is
+            if self.damaged or self.camera_moving:
+                events = pg.event.get()
+            else:
+                events = [pg.event.wait(IDLE_WAIT_MS), *pg.event.get()]
             for worker in self.workers:
                 worker.control(events)
 
             for event in events:
                 if event.type == pg.QUIT:
                     self.quit()
+                if event.type == pg.KEYDOWN and event.key == pg.K_f:
+                    self.cycle_temporal_filter()
+                if event.type == pg.KEYDOWN and event.key == pg.K_l:
+                    self.reload_style()
+                if event.type == pg.KEYDOWN and event.key == pg.K_v:
+                    self.set_voxel_map(self.voxel_map is None)
+                if event.type == pg.KEYDOWN and event.key == pg.K_h:
+                    self.cycle_heatmap()
+                if event.type == pg.KEYDOWN and event.key == pg.K_p:
+                    # Timing is only paid for while shown, or while recording a trace
+                    self.show_profiler = not self.show_profiler
+                    profiler.enabled = self.show_profiler or profiler.tracing
 
-            # Screen
-            self.draw()
-            self.camera.control()
-            pg.display.set_caption("RemoteViewer")
-            pg.display.flip()
+            # Screen, only if anything has changed
+            self.camera_moving = self.camera.control()
+            damaged = self.take_damage()
+            if damaged or self.camera_moving or any(damages(event) for event in events):
+                with profiler.span('frame'):
+                    self.draw()
+                    with profiler.span('flip'):
+                        pg.display.flip()
 
             # Tick
             self.clock.tick(self.FPS)
 
 
 if __name__ == '__main__':
-    app = Window3D()
-    app.run()
+    args = run_arg_parse()
+
+    # Modules only one mode needs are imported by it, so that the viewer starts sooner
+    if args.convert:
+        print(f'Converted log saved to {convert_log(args.i, args.o, args.compress)}')
+    elif args.export:
+        from point_cloud_export import export_logs
+        for path in export_logs(args.i, args.o, args.export, args.per_frame, args.style, args.filter, args.filter_window or 8, args.jobs):
+            print(f'Exported to {path}')
+    elif args.stats:
+        from log_stats import stats_logs
+        for path in stats_logs(args.i, args.o, args.stats, args.f):
+            print(f'Statistics saved to {path}')
+    elif args.video:
+        # stdout may carry the video
+        from video_render import render_video, DEFAULT_FPS
+        path, n_frames = render_video(args, args.fps or DEFAULT_FPS, args.jobs)
+        print(f'{n_frames} video frames written to {path}', file=sys.stderr)
+    else:
+        app = Window3D(args)
+        app.run()
@@ -1,5 +1,4 @@
 import math
-from tkinter import N
 import numpy as np
 
 
@@ -1,12 +1,7 @@
 import pygame as pg
 import numpy as np
 from matrix_operations import *
-from numba import njit
-
-
-@njit(fastmath=True)
-def any_func(arr, a, b):
-    return np.any((arr == a) | (arr == b))
+from profiler import profiler
 
 
 class Object3D:
@@ -25,44 +20,80 @@ class Object3D:
         self.vertex_size = 3
         self.edge_color = None
 
+        # Reused by project_vertices()
+        self.projection_buffer = None
+
     def draw(self):
         self.screen_projection()
 
 
     def screen_projection(self):
-        vertices = self.vertices @ self.render.camera.camera_matrix()
-        vertices = vertices @self.render.projection.projection_matrix
-        vertices /= vertices[:, -1].reshape(-1, 1)
-        vertices[(vertices > 1) | (vertices < -1)] = 0
-        vertices = vertices @ self.render.projection.to_screen_matrix
-        vertices = vertices[:, :2]
+        with profiler.span('projection'):
+            vertices = self.project_vertices()
 
         if self.faces_enabled:
-            self.draw_faces(vertices)
+            with profiler.span('faces'):
+                self.draw_faces(vertices)
 
         if self.vertices_enabled:
-            self.draw_vertices(vertices)
+            with profiler.span('points'):
+                self.draw_vertices(vertices)
+
+
+    def project_vertices(self):
+        """
+        Screen coordinates of all vertices, shaped (n, 2). Coordinates outside the view are
+        put at the center of the screen. Returns a buffer that is reused by the next call.
+        """
+        n_vertices = len(self.vertices)
+        if self.projection_buffer is None or len(self.projection_buffer) != n_vertices:
+            self.projection_buffer = np.empty((n_vertices, 4))
+            self.w_buffer = np.empty((n_vertices, 1))
+            self.abs_buffer = np.empty((n_vertices, 4))
+            self.outside_buffer = np.empty((n_vertices, 4), dtype=bool)
+            self.screen_buffer = np.empty((n_vertices, 2))
+
+        # Camera and projection in one matmul, then perspective divide
+        vertices = self.projection_buffer
+        np.matmul(self.vertices, self.render.camera.view_projection_matrix(), out=vertices)
+        np.copyto(self.w_buffer, vertices[:, 3:])
+        np.divide(vertices, self.w_buffer, out=vertices)
+
+        np.abs(vertices, out=self.abs_buffer)
+        np.greater(self.abs_buffer, 1, out=self.outside_buffer)
+        vertices[self.outside_buffer] = 0
+
+        # Only x and y are needed on screen
+        np.matmul(vertices, self.render.projection.to_screen_matrix[:, :2], out=self.screen_buffer)
+        return self.screen_buffer
 
 
     def draw_vertices(self, vertices):
-        for vertex in vertices:
-            if not any_func(vertex, self.render.H_WIDTH, self.render.H_HEIGHT):
-                pg.draw.circle(self.render.screen, self.vertex_color, vertex, self.vertex_size)
-
-
-    def draw_faces(self, vertices):
-        for index, color_face in enumerate(self.color_faces):
-            color, face = color_face
-            polygon = vertices[face]
-            if not any_func(polygon, self.render.H_WIDTH, self.render.H_HEIGHT):
-                try:
-                    pg.draw.polygon(self.render.screen, color, polygon, width=0)
-                except(TypeError):
-                    pass
-                    # print(polygon)
-                if self.label and self.labels_enabled:
-                    text = self.font.render(self.label[index], True, pg.Color('white'))
-                    self.render.screen.blit(text, polygon[-1])
+        # Skip clipped vertices, see project_vertices()
+        clipped = np.any((vertices == self.render.H_WIDTH) | (vertices == self.render.H_HEIGHT), axis=1)
+        for vertex in vertices[~clipped]:
+            pg.draw.circle(self.render.screen, self.vertex_color, vertex, self.vertex_size)
+
+
+    def draw_faces(self, vertices, surface=None):
+        if surface is None:
+            surface = self.render.screen
+
+        # Skip faces with a clipped vertex, see project_vertices()
+        polygons = vertices[self.faces]
+        clipped = np.any((polygons == self.render.H_WIDTH) | (polygons == self.render.H_HEIGHT), axis=(1, 2))
+
+        for index in np.flatnonzero(~clipped):
+            color, face = self.color_faces[index]
+            polygon = polygons[index]
+            try:
+                pg.draw.polygon(surface, color, polygon, width=0)
+            except(TypeError):
+                pass
+                # print(polygon)
+            if self.label and self.labels_enabled:
+                text = self.font.render(self.label[index], True, pg.Color('white'))
+                surface.blit(text, polygon[-1])
 
 
     def translate(self, pos):
@@ -0,0 +1,287 @@
+import io
+import os
+import shutil
+import zipfile
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import groupby
+from pathlib import Path
+from log_files import BinaryLog, CompressedLog, open_log, BINARY_LOG_SUFFIX, COMPRESSED_LOG_SUFFIX
+from sensor_frame_3d import DEFAULT_STYLE
+from style_rules import Style, load_style, frame_field, n_targets
+from temporal_filter import TemporalFilter
+from VL53L5CX import VL53L5CX_Reading, ZONE_DIRECTIONS
+
+"""
+Headless export of logs to point cloud files
+
+    ply     Binary little-endian PLY, one vertex per point, the fields below as properties
+    npz     NumPy archive holding one structured array, 'points'
+    csv     One point per line, after a line with the field names
+
+Points are the targets the viewer would draw: the style (see style_rules.py) and temporal filter
+apply as in the viewer, and the color of a point is its color in the style. Coordinates are in
+meters, as drawn for a single sensor.
+
+Logs are exported in chunks of CHUNK_FRAMES frames by a pool of processes. A chunk is read, filtered
+and converted with array operations over all of its frames, and written as soon as it is done, either
+as one file per frame or as a part of the merged file. The parts are appended to the merged file in
+order, so memory use is bounded by the chunks in flight however long the log.
+"""
+
+FORMATS = ('ply', 'npz', 'csv')
+LOG_SUFFIXES = (BINARY_LOG_SUFFIX, COMPRESSED_LOG_SUFFIX, '.json')
+CHUNK_FRAMES = 2048
+
+POINT_DTYPE = np.dtype([
+    ('frame', '<u4'),
+    ('x', '<f4'),
+    ('y', '<f4'),
+    ('z', '<f4'),
+    ('zone', 'u1'),
+    ('target', 'u1'),
+    ('distance_mm', '<i2'),
+    ('range_sigma_mm', '<u2'),
+    ('signal_per_spad', '<u4'),
+    ('reflectance', 'u1'),
+    ('target_status', 'u1'),
+    ('red', 'u1'),
+    ('green', 'u1'),
+    ('blue', 'u1'),
+])
+FRAME_FIELDS = ('range_sigma_mm', 'signal_per_spad', 'reflectance', 'target_status')
+PLY_TYPES = {'u1': 'uchar', 'i2': 'short', 'u2': 'ushort', 'u4': 'uint', 'f4': 'float'}
+CSV_ROW = ','.join('%.4f' if POINT_DTYPE[name].kind == 'f' else '%d' for name in POINT_DTYPE.names) + '\n'
+
+
+def ply_header(n_points: int) -> bytes:
+    properties = ''.join(
+        f'property {PLY_TYPES[POINT_DTYPE[name].str[1:]]} {name}\n' for name in POINT_DTYPE.names
+    )
+    return f'ply\nformat binary_little_endian 1.0\nelement vertex {n_points}\n{properties}end_header\n'.encode()
+
+
+def npy_header(n_points: int) -> bytes:
+    with io.BytesIO() as f:
+        np.lib.format.write_array_header_1_0(f, {
+            'descr': np.lib.format.dtype_to_descr(POINT_DTYPE),
+            'fortran_order': False,
+            'shape': (n_points,),
+        })
+        return f.getvalue()
+
+
+def csv_header(n_points: int) -> bytes:
+    return (','.join(POINT_DTYPE.names) + '\n').encode()
+
+
+HEADERS = {'ply': ply_header, 'npz': npy_header, 'csv': csv_header}
+
+
+def write_body(f, points: np.ndarray, fmt: str):
+    if fmt == 'csv':
+        # Rows as tuples straight from the structured array, several times faster than np.savetxt
+        f.write(''.join(map(CSV_ROW.__mod__, points.tolist())).encode())
+    else:
+        f.write(points.tobytes())
+
+
+def write_points(path: str, points: np.ndarray, fmt: str):
+    """One complete point cloud file"""
+    if fmt == 'npz':
+        np.savez(path, points=points)
+        return
+    with open(path, 'wb') as f:
+        f.write(HEADERS[fmt](len(points)))
+        write_body(f, points, fmt)
+
+
+def write_merged(path: str, fmt: str, parts: list[str], n_points: int):
+    """Writes the header, then appends the parts in order and removes them"""
+    if fmt == 'npz':
+        with zipfile.ZipFile(path, 'w') as archive, archive.open('points.npy', 'w', force_zip64=True) as f:
+            append_parts(f, HEADERS[fmt](n_points), parts)
+    else:
+        with open(path, 'wb') as f:
+            append_parts(f, HEADERS[fmt](n_points), parts)
+
+
+def append_parts(f, header: bytes, parts: list[str]):
+    f.write(header)
+    for part in parts:
+        with open(part, 'rb') as part_file:
+            shutil.copyfileobj(part_file, f, 1 << 20)
+        os.remove(part)
+
+
+def record_runs(log, start: int, stop: int):
+    """(first frame, records) for frames start to stop, in runs of frames that share a layout"""
+    if isinstance(log, BinaryLog):
+        yield start, log.records[start:stop]
+        return
+    if isinstance(log, CompressedLog):
+        yield start, log.read(start, stop)
+        return
+
+    first = start
+    for _, run in groupby((log[ix].record for ix in range(start, stop)), key=lambda record: record.dtype):
+        records = np.stack(list(run))
+        yield first, records
+        first += len(records)
+
+
+def run_points(first: int, records: np.ndarray, style: Style, temporal_filter: TemporalFilter | None) -> np.ndarray:
+    """Points of consecutive frames sharing a layout, as the viewer would draw them"""
+    frames = VL53L5CX_Reading.from_record(records)
+    nb_zones, nb_targets = frames.nb_zones, frames.nb_targets_per_zone
+    per_frame = nb_zones * nb_targets
+
+    distance_mm = frames.distance_mm.reshape(-1)
+    draw = np.ones(n_targets(frames), dtype=bool)
+    if temporal_filter is not None:
+        # The filter carries state from frame to frame, the rest is done for all frames at once
+        distance_mm = distance_mm.astype(np.int32)
+        for ix in range(len(records)):
+            frame = VL53L5CX_Reading.from_record(records[ix, ...])
+            rows = slice(ix * per_frame, (ix + 1) * per_frame)
+            distance_mm[rows], draw[rows] = temporal_filter.update(frame, style.status_valid(frame))
+
+    color_ix = np.zeros(len(draw), dtype=np.intp)
+    size = np.zeros(len(draw), dtype=np.int32)
+    style.apply(frames, distance_mm, draw, color_ix, size)
+
+    ix = np.flatnonzero(draw)
+    zone, target = np.divmod(ix % per_frame, nb_targets)
+    points = np.empty(len(ix), dtype=POINT_DTYPE)
+    points['frame'] = first + ix // per_frame
+    points['zone'] = zone
+    points['target'] = target
+    points['distance_mm'] = distance_mm[ix]
+    xyz = (distance_mm[ix] / 1000)[:, np.newaxis] * ZONE_DIRECTIONS[nb_zones][zone]
+    points['x'], points['y'], points['z'] = xyz.T
+    for name in FRAME_FIELDS:
+        points[name] = frame_field(frames, name)[ix]
+
+    rgb = palette_rgb(style)[color_ix[ix]]
+    points['red'], points['green'], points['blue'] = rgb.T
+    return points
+
+
+def palette_rgb(style: Style) -> np.ndarray:
+    return np.array([(color.r, color.g, color.b) for color in style.palette], dtype=np.uint8)
+
+
+# Opened once per worker process
+@lru_cache(maxsize=8)
+def worker_log(path: str):
+    return open_log(path)
+
+
+@lru_cache(maxsize=8)
+def worker_style(path: str | None) -> Style:
+    return load_style(path) if path else Style(DEFAULT_STYLE)
+
+
+class ChunkExporter:
+    """Exports one chunk of frames of a log, in a worker process. Must be picklable"""
+    def __init__(self, path_in: str, path_out: str, fmt: str, per_frame: bool, style_path: str | None, filter_mode: str | None, filter_window: int):
+        self.path_in = path_in
+        self.path_out = path_out
+        self.fmt = fmt
+        self.per_frame = per_frame
+        self.style_path = style_path
+        self.filter_mode = filter_mode
+        self.filter_window = filter_window
+
+    def part_path(self, start: int) -> str:
+        return f'{self.path_out}.{start:09d}.part'
+
+    def points(self, start: int, stop: int) -> np.ndarray:
+        log = worker_log(self.path_in)
+        style = worker_style(self.style_path)
+
+        temporal_filter = None
+        if self.filter_mode:
+            # Frames before the chunk fill the filter's window, as if the log had been played from the start
+            temporal_filter = TemporalFilter(self.filter_mode, self.filter_window)
+            for ix in range(max(start - self.filter_window + 1, 0), start):
+                frame = log[ix]
+                temporal_filter.update(frame, style.status_valid(frame))
+
+        runs = [run_points(first, records, style, temporal_filter) for first, records in record_runs(log, start, stop)]
+        return np.concatenate(runs) if runs else np.empty(0, dtype=POINT_DTYPE)
+
+    def __call__(self, chunk: tuple[int, int]) -> int:
+        """Writes the points of frames start to stop, returns the number of points"""
+        start, stop = chunk
+        points = self.points(start, stop)
+
+        if self.per_frame:
+            bounds = np.searchsorted(points['frame'], np.arange(start, stop + 1))
+            for frame, (low, high) in enumerate(zip(bounds[:-1], bounds[1:]), start):
+                write_points(os.path.join(self.path_out, f'frame_{frame:06d}.{self.fmt}'), points[low:high], self.fmt)
+        else:
+            with open(self.part_path(start), 'wb') as f:
+                write_body(f, points, self.fmt)
+        return len(points)
+
+
+def log_paths(path: str) -> list[str]:
+    """A log, or the logs in a directory"""
+    if os.path.isdir(path):
+        return sorted(str(p) for p in Path(path).iterdir() if p.suffix in LOG_SUFFIXES)
+    return [path]
+
+
+def output_path(path_in: str, path_out: str | None, fmt: str, per_frame: bool, in_directory: bool) -> str:
+    """Merged file, or directory of frame files. Next to the log unless given"""
+    name = Path(path_in).stem + ('_frames' if per_frame else f'.{fmt}')
+    if path_out is None:
+        return str(Path(path_in).with_name(name))
+    if in_directory:
+        return str(Path(path_out) / name)
+    return path_out
+
+
+def export_logs(
+    path_in: str,
+    path_out: str | None = None,
+    fmt: str = 'ply',
+    per_frame: bool = False,
+    style_path: str | None = None,
+    filter_mode: str | None = None,
+    filter_window: int = 8,
+    jobs: int | None = None,
+) -> list[str]:
+    """
+    Exports a log, or every log in a directory, to point clouds. Returns the paths written: the
+    merged files, or with per_frame, the directories of frame files.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown format {fmt!r}, expected one of {FORMATS}')
+    if style_path:
+        load_style(style_path)      # Fail here rather than in every worker
+
+    in_directory = os.path.isdir(path_in)
+    if in_directory and path_out:
+        os.makedirs(path_out, exist_ok=True)
+
+    written = list()
+    with ProcessPoolExecutor(jobs) as pool:
+        for path in log_paths(path_in):
+            log = open_log(path)
+            n_frames = len(log)
+            log.close()
+
+            out = output_path(path, path_out, fmt, per_frame, in_directory)
+            if per_frame:
+                os.makedirs(out, exist_ok=True)
+            exporter = ChunkExporter(path, out, fmt, per_frame, style_path, filter_mode, filter_window)
+            chunks = [(start, min(start + CHUNK_FRAMES, n_frames)) for start in range(0, n_frames, CHUNK_FRAMES)]
+            n_points = sum(pool.map(exporter, chunks))
+
+            if not per_frame:
+                write_merged(out, fmt, [exporter.part_path(start) for start, _ in chunks], n_points)
+            written.append(out)
+    return written
@@ -0,0 +1,55 @@
+import pygame as pg
+import numpy as np
+
+
+class PointRenderer:
+    """
+    Draws many filled circles in one Surface.blits call.
+
+    Each (color, radius) combination is rendered once to a small sprite ("stamp"). Stamps are
+    kept in a (color, radius) lookup table, so picking the stamp for every point is one
+    fancy-indexing operation and no per-point Python work remains besides the blit itself.
+    """
+    def __init__(self, palette: list[pg.Color]):
+        self.palette = palette
+        self.stamps = np.empty((len(palette), 0), dtype=object)   # [color index, radius] -> surface
+
+    def make_stamp(self, color: pg.Color, radius: int) -> pg.Surface:
+        colorkey = pg.Color('white') if color == pg.Color('black') else pg.Color('black')
+        surface = pg.Surface((2 * radius + 1, 2 * radius + 1))
+        surface.fill(colorkey)
+        pg.draw.circle(surface, color, (radius, radius), radius)
+        surface.set_colorkey(colorkey, pg.RLEACCEL)
+        return surface
+
+    def ensure_stamps(self, max_radius: int):
+        n_radii = self.stamps.shape[1]
+        if max_radius < n_radii:
+            return
+
+        stamps = np.empty((len(self.palette), max_radius + 1), dtype=object)
+        stamps[:, :n_radii] = self.stamps
+        for color_ix, color in enumerate(self.palette):
+            for radius in range(n_radii, max_radius + 1):
+                stamps[color_ix, radius] = self.make_stamp(color, radius)
+        self.stamps = stamps
+
+    def draw(self, screen: pg.Surface, points: np.ndarray, visible: np.ndarray, color_ix: np.ndarray, radius: np.ndarray):
+        """
+        points      Screen coordinates, shaped (n, 2)
+        visible     Bool mask, shaped (n,). Points at the center lines of the screen (i.e. clipped) are skipped as well
+        color_ix    Index into palette, shaped (n,)
+        radius      Circle radius in pixels, shaped (n,)
+        """
+        h_width, h_height = screen.get_width() // 2, screen.get_height() // 2
+        clipped = np.any((points == h_width) | (points == h_height), axis=1)
+        ix = np.flatnonzero(visible[:len(points)] & ~clipped)
+        if len(ix) == 0:
+            return
+
+        radius = np.maximum(radius[ix], 0)
+        self.ensure_stamps(int(radius.max()))
+
+        stamps = self.stamps[color_ix[ix], radius]
+        top_left = np.rint(points[ix]).astype(np.int32) - radius[:, np.newaxis]
+        screen.blits(zip(stamps.tolist(), top_left.tolist()), doreturn=False)
@@ -0,0 +1,110 @@
+import json
+import threading
+import time
+from collections import deque
+import numpy as np
+
+"""
+Lightweight timing of named spans, e.g.
+
+    with profiler.span('projection'):
+        ...
+
+When disabled, span() returns a shared no-op context manager, so instrumentation can stay in
+hot paths. When enabled, the last ROLLING_WINDOW durations of every span are kept for p50/p99
+figures, and if tracing, every span is also kept as a Chrome trace event (chrome://tracing, Perfetto).
+"""
+
+ROLLING_WINDOW = 300
+MAX_TRACE_EVENTS = 2_000_000
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('profiler', 'name', 'start_ns')
+
+    def __init__(self, profiler, name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.record(self.name, self.start_ns, time.perf_counter_ns())
+        return False
+
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.tracing = False
+        self.durations = dict()     # name -> deque of durations in ns
+        self.trace_events = list()  # (name, start ns, end ns, thread id)
+        self.thread_names = dict()
+        self.origin_ns = time.perf_counter_ns()
+
+    def span(self, name: str):
+        if not self.enabled:
+            return NULL_SPAN
+        return _Span(self, name)
+
+    def start_trace(self):
+        self.enabled = True
+        self.tracing = True
+
+    def record(self, name: str, start_ns: int, end_ns: int):
+        durations = self.durations.get(name)
+        if durations is None:
+            durations = self.durations.setdefault(name, deque(maxlen=ROLLING_WINDOW))
+        durations.append(end_ns - start_ns)
+
+        if self.tracing and len(self.trace_events) < MAX_TRACE_EVENTS:
+            thread_id = threading.get_ident()
+            if thread_id not in self.thread_names:
+                self.thread_names[thread_id] = threading.current_thread().name
+            self.trace_events.append((name, start_ns, end_ns, thread_id))
+
+    def summary(self) -> list[tuple[str, float, float, int]]:
+        """(name, p50 ms, p99 ms, number of samples) per span, over the rolling window"""
+        rows = list()
+        for name, durations in sorted(self.durations.items()):
+            samples = np.array(durations) / 1e6
+            if len(samples):
+                p50, p99 = np.percentile(samples, [50, 99])
+                rows.append((name, p50, p99, len(samples)))
+        return rows
+
+    def export_trace(self, path: str):
+        """Writes the recorded spans in the Chrome trace event format"""
+        events = [
+            {'name': 'thread_name', 'ph': 'M', 'pid': 0, 'tid': thread_id, 'args': {'name': thread_name}}
+            for thread_id, thread_name in self.thread_names.items()
+        ]
+        events += [
+            {
+                'name': name,
+                'ph': 'X',
+                'pid': 0,
+                'tid': thread_id,
+                'ts': (start_ns - self.origin_ns) / 1e3,
+                'dur': (end_ns - start_ns) / 1e3,
+            }
+            for name, start_ns, end_ns, thread_id in self.trace_events
+        ]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+# Shared by the main loop and the workers
+profiler = Profiler()
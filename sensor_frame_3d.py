@@ -1,8 +1,11 @@
-from object_3d import Object3D, any_func
+from object_3d import Object3D
+from style_rules import Style
+from profiler import profiler
 import numpy as np
 import pygame as pg
 from copy import copy
-from VL53L5CX import calc_3d_point, get_theta_x, get_theta_y, VL53L5CX_Reading
+import threading
+from VL53L5CX import ZONE_DIRECTIONS, VL53L5CX_Reading
 
 COLOR_FIRST_TARGET  = pg.Color('magenta')
 COLOR_SECOND_TARGET = pg.Color('aqua')
@@ -38,78 +41,182 @@ MAX_TARGETS = 256
 # 255   No target detected (only if number of target detected is enabled)
 VALID_TARGET_STATUS = [5, 9, 10]
 
+# Point size by distance: closer than 0.2 m is drawn with size 10, closer than 0.5 m with 9, ...
+# Targets at DRAW_DISTANCE_MM or further away are not drawn.
+SIZE_EDGES_MM = [200, 500, 700, 1000]
+SIZE_BY_EDGE = [10, 9, 8, 7, 6]
+DRAW_DISTANCE_MM = 1700
+
+# Used unless a style file is given, see style_rules.py
+DEFAULT_STYLE = {
+    'filter': {
+        'target_status': VALID_TARGET_STATUS,
+        'distance_mm': {'max': DRAW_DISTANCE_MM},
+    },
+    'size': {'field': 'distance_mm', 'edges': SIZE_EDGES_MM, 'values': SIZE_BY_EDGE},
+    'color': {'field': 'target_index', 'colors': COLOR_SELECT},
+}
+
+class PointCloud:
+    """Everything needed to draw one sensor frame"""
+    def __init__(self):
+        self.vertices = np.zeros((MAX_TARGETS, 4))
+        self.vertices[:, 3] = 1
+
+        # Allocate for variations in drawing color, size, etc.
+        # Color is an index into the palette of the style
+        self.vertex_color = np.zeros(MAX_TARGETS, dtype=np.intp)
+        self.target_draw_size = np.zeros(MAX_TARGETS, dtype=np.int32)
+
+        # Filter - Are conditions for drawing this point fulfilled?
+        self.target_draw_filter = np.zeros(MAX_TARGETS, dtype=bool)
+
+        # What the above was made from, so that it can be restyled without a new frame
+        self.frame = None
+        self.distance_mm = np.zeros(MAX_TARGETS, dtype=np.int32)
+        self.keep = np.ones(MAX_TARGETS, dtype=bool)
+        self.style = None
+
+
 class Sensor3D(Object3D):
+    """
+    Point cloud of one sensor, updated by a worker thread and drawn by the render thread.
+
+    Frames are triple buffered: update_pointcloud() fills the back buffer and publishes it by
+    swapping it with the ready buffer. The render thread swaps the ready buffer with the front
+    buffer when a new frame has been published, and only ever reads the front buffer. Neither side
+    holds a lock while filling or drawing, the swap lock only covers exchanging two references.
+    """
     def __init__(self, render, color):
         super().__init__(render)
-        
-        self.vertices = np.zeros((MAX_TARGETS, 4))
+
+        self.front, self.ready, self.back = PointCloud(), PointCloud(), PointCloud()
+        self.swap_lock = threading.Lock()
+        self.new_frame = False
+        # Serializes writers, e.g. the replay thread and frame stepping by key press
+        self.update_lock = threading.Lock()
+
+        self.vertices = self.front.vertices
         self.vertices_enabled = True
 
-        # Allocate for variations in drawing color, size, etc.
-        self.vertex_color = [COLOR_FIRST_TARGET] * MAX_TARGETS
-        self.target_draw_size = [0] * MAX_TARGETS
-        
-        # Filter - Are conditions for drawing this point fulfilled?
-        self.target_draw_filter = [False] * MAX_TARGETS
+        # Scratch buffer, so that updates don't allocate
+        self.distance_m = np.zeros(MAX_TARGETS)
+
+        # Which targets are drawn and how (see style_rules.py), and optional smoothing over the
+        # last frames (see temporal_filter.py). Either may be replaced at any time.
+        self.style = Style(DEFAULT_STYLE)
+        self.temporal_filter = None
+
+        # Optional occupancy map the drawn points are added to (see voxel_map.py), and where the
+        # sensor sits in it (4x4, row vectors), e.g. its pose in a rig
+        self.voxel_map = None
+        self.pose = np.identity(4)
+
+        # Optional statistics of the frames shown, e.g. for a heatmap (see log_stats.py)
+        self.stats = None
+
+        # Screen coordinates of the front buffer, reprojected on a new frame or camera movement
+        self.screen_vertices = None
+        self.camera_version = None
+
 
-    
     def update_pointcloud(self, sensor_frame: VL53L5CX_Reading):
-        # Only 8x8 resolution
-        if sensor_frame.nb_zones != 64:
-            # TODO: Implement support for 4*4 configurations
-            return None
-        
-        
-        points = np.empty([0, 4])
-        draw_cond_fulfilled = [True] * MAX_TARGETS
-        self.target_draw_size = [0] * MAX_TARGETS
-        for ix_z, zone in enumerate(sensor_frame.zones):
-
-            # Get thetas for zone position
-            theta_x = get_theta_x(ix_z % 8)
-            theta_y = get_theta_y(ix_z // 8)
-
-            for ix_t, target in enumerate(zone.targets):
-                hypothenuse = target.distance_mm / 1000
-                points = np.concatenate((points, calc_3d_point(hypothenuse, theta_x, theta_y)), axis=0)
-
-                # calculate ix of resulting target (point/vertex + filter)
-                target_arr_ix = (ix_z * sensor_frame.nb_targets_per_zone) + ix_t
-
-                # Select color for vertex
-                self.vertex_color[target_arr_ix] = COLOR_SELECT[ix_t]
-
-                # Apply filter "Target status"
-                if target.target_status not in VALID_TARGET_STATUS:
-                    draw_cond_fulfilled[target_arr_ix] = False
-
-                # Apply other filters below...
-                distance = float(target.distance_mm / 1000)
-                if distance < 0.2:
-                    self.target_draw_size[target_arr_ix] = 10
-                elif distance < 0.5:
-                    self.target_draw_size[target_arr_ix] = 9
-                elif distance < 0.7:
-                    self.target_draw_size[target_arr_ix] = 8
-                elif distance < 1.0:
-                    self.target_draw_size[target_arr_ix] = 7
-                elif distance < 1.70:
-                    self.target_draw_size[target_arr_ix] = 6
-                else:
-                    draw_cond_fulfilled[target_arr_ix] = False
-                    self.target_draw_size[target_arr_ix] = 1
-
-        
-        self.vertices = points
-        self.target_draw_filter = draw_cond_fulfilled
+        with self.update_lock:
+            self.fill(self.back, sensor_frame)
+            self.publish()
+
+
+    def fill(self, cloud: PointCloud, sensor_frame: VL53L5CX_Reading):
+        nb_zones, nb_targets = sensor_frame.nb_zones, sensor_frame.nb_targets_per_zone
+        n = nb_zones * nb_targets
+        style = self.style
+
+        distance_mm = sensor_frame.distance_mm.reshape(-1)
+        keep = cloud.keep[:n]
+        keep[:] = True
+        temporal_filter = self.temporal_filter
+        if temporal_filter is not None:
+            distance_mm, filter_keep = temporal_filter.update(sensor_frame, style.status_valid(sensor_frame))
+            keep &= filter_keep
+        cloud.frame = sensor_frame
+        cloud.distance_mm[:n] = distance_mm
+
+        # Point = distance * direction of the zone, written straight into the vertex buffer
+        distance_m = self.distance_m[:n]
+        np.multiply(distance_mm, 1 / 1000, out=distance_m)
+        points = cloud.vertices[:n].reshape(nb_zones, nb_targets, 4)
+        np.multiply(
+            distance_m.reshape(nb_zones, nb_targets, 1),
+            ZONE_DIRECTIONS[nb_zones][:, np.newaxis, :],
+            out=points[:, :, :3]
+        )
+
+        self.apply_style(cloud, style)
+
+        voxel_map = self.voxel_map
+        if voxel_map is not None:
+            with profiler.span('voxels'):
+                drawn = cloud.vertices[:n][cloud.target_draw_filter[:n]] @ self.pose
+                voxel_map.insert(drawn[:, :3], self.pose[3, :3])
+
+        stats = self.stats
+        if stats is not None:
+            with profiler.span('stats'):
+                stats.update(sensor_frame.record.reshape(1))
+
+
+    def apply_style(self, cloud: PointCloud, style: Style):
+        n = cloud.frame.nb_zones * cloud.frame.nb_targets_per_zone
+        target_draw_filter = cloud.target_draw_filter[:n]
+        np.copyto(target_draw_filter, cloud.keep[:n])
+        style.apply(cloud.frame, cloud.distance_mm[:n], target_draw_filter, cloud.vertex_color[:n], cloud.target_draw_size[:n])
+        cloud.target_draw_filter[n:] = False
+        cloud.style = style
+
+
+    def publish(self):
+        with self.swap_lock:
+            self.back, self.ready = self.ready, self.back
+            self.new_frame = True
+        self.render.damage()
+
+
+    def acquire_frame(self) -> bool:
+        """Makes the latest published frame the front buffer, False if there was none since last time"""
+        with self.swap_lock:
+            if not self.new_frame:
+                return False
+            self.front, self.ready = self.ready, self.front
+            self.new_frame = False
+
+        self.vertices = self.front.vertices
+        return True
+
+
+    def restyle(self) -> bool:
+        """Applies a changed style to the front buffer, True if it did"""
+        front = self.front
+        if front.frame is None or front.style is self.style:
+            return False
+        self.apply_style(front, self.style)
+        return True
 
 
     def draw(self):
-        super().screen_projection()
+        new_frame = self.acquire_frame()
+        self.restyle()
+
+        self.render.camera.view_projection_matrix()    # Brings camera.version up to date
+        if new_frame or self.screen_vertices is None or self.camera_version != self.render.camera.version:
+            with profiler.span('projection'):
+                self.screen_vertices = self.project_vertices()
+            self.camera_version = self.render.camera.version
+
+        with profiler.span('points'):
+            self.draw_vertices(self.screen_vertices)
 
 
     def draw_vertices(self, vertices):
-        for ix, vertex in enumerate(vertices):
-            if self.target_draw_filter[ix]:
-                if not any_func(vertex, self.render.H_WIDTH, self.render.H_HEIGHT):
-                    pg.draw.circle(self.render.screen, self.vertex_color[ix], vertex, self.target_draw_size[ix])
+        cloud = self.front
+        style = cloud.style or self.style
+        style.point_renderer.draw(self.render.screen, vertices, cloud.target_draw_filter, cloud.vertex_color, cloud.target_draw_size)
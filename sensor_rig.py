@@ -0,0 +1,141 @@
+import json
+import math
+import numpy as np
+from pathlib import Path
+from matrix_operations import rotate_x, rotate_y, rotate_z, translate
+from object_3d import Object3D
+from profiler import profiler
+from sensor_frame_3d import Sensor3D, COLOR_SELECT, MAX_TARGETS, DEFAULT_STYLE
+from style_rules import Style
+
+"""
+Rig configuration file (JSON), one entry per sensor:
+
+    {
+        "sensors": [
+            {"name": "front", "replay": "logs/front.vlog", "frequency": 15,
+             "pose": {"rotate_deg": [0, 0, 0], "translate": [0.0, 0.0, 0.0]}},
+            {"name": "left", "port": "/dev/ttyUSB1", "baud_rate": 115200, "output": "left.vlog",
+             "pose": {"matrix": [[1, 0, 0, 0], [0, 1, 0, 0], [0, 0, 1, 0], [0, 0, 0, 1]]}}
+        ]
+    }
+
+A source is either a log to replay ("replay", optionally "frequency" in Hz) or a serial port
+("port", "baud_rate", optionally "output"). Paths are relative to the configuration file.
+
+The pose places the sensor in the rig, either as a 4x4 matrix (row vectors, as in
+matrix_operations) or as rotations about x, y and z in degrees, applied in that order, followed
+by a translation in meters. Without a pose the sensor sits at the origin, looking along +z.
+"""
+
+
+def pose_matrix(pose: dict | None) -> np.ndarray:
+    if not pose:
+        return np.identity(4)
+    if 'matrix' in pose:
+        matrix = np.array(pose['matrix'], dtype=np.float64)
+        if matrix.shape != (4, 4):
+            raise ValueError(f'Pose matrix must be 4x4, got {matrix.shape}')
+        return matrix
+
+    rx, ry, rz = (math.radians(angle) for angle in pose.get('rotate_deg', (0, 0, 0)))
+    return rotate_x(rx) @ rotate_y(ry) @ rotate_z(rz) @ translate(pose.get('translate', (0, 0, 0)))
+
+
+def load_rig_config(path: str) -> list[dict]:
+    """Sensors of a rig configuration file, with 'pose' replaced by its matrix and paths resolved"""
+    with open(path) as f:
+        config = json.load(f)
+
+    base = Path(path).parent
+    sensors = list()
+    for ix, entry in enumerate(config['sensors']):
+        sensor = dict(entry)
+        sensor.setdefault('name', f'sensor{ix}')
+        if ('replay' in sensor) == ('port' in sensor):
+            raise ValueError(f"Sensor {sensor['name']!r} must have either 'replay' or 'port'")
+        if 'port' in sensor and 'baud_rate' not in sensor:
+            raise ValueError(f"Sensor {sensor['name']!r} has no 'baud_rate'")
+
+        for key in ('replay', 'output'):
+            if key in sensor:
+                sensor[key] = str(base / sensor[key])
+        sensor['pose'] = pose_matrix(sensor.get('pose'))
+        sensors.append(sensor)
+
+    if not sensors:
+        raise ValueError(f'No sensors in {path}')
+    return sensors
+
+
+class SensorRig(Object3D):
+    """
+    Several sensors drawn as one point cloud.
+
+    Each sensor is a Sensor3D, updated by its worker as usual. When a sensor has a new frame, its
+    points are moved to their place in the rig (one matmul with the sensor's pose) and written to
+    its slice of a preallocated fused buffer. The fused buffer is projected with a single matmul
+    and drawn with a single blits call, however many sensors there are.
+    """
+    def __init__(self, render, poses: list[np.ndarray]):
+        super().__init__(render)
+
+        n_sensors = len(poses)
+        self.sensors = [Sensor3D(render, COLOR_SELECT[0]) for _ in poses]
+        self.poses = np.stack(poses).astype(np.float64)
+        for sensor, pose in zip(self.sensors, self.poses):
+            sensor.pose = pose
+
+        self.vertices = np.zeros((n_sensors * MAX_TARGETS, 4))
+        self.vertices[:, 3] = 1
+        self.vertices_enabled = True
+        self.vertex_color = np.zeros(n_sensors * MAX_TARGETS, dtype=np.intp)
+        self.target_draw_size = np.zeros(n_sensors * MAX_TARGETS, dtype=np.int32)
+        self.target_draw_filter = np.zeros(n_sensors * MAX_TARGETS, dtype=bool)
+
+        self.screen_vertices = None
+        self.camera_version = None
+
+        # All sensors share one style, so that their palette indices can be drawn at once
+        self.set_style(Style(DEFAULT_STYLE))
+
+
+    def set_style(self, style: Style):
+        self.style = style
+        for sensor in self.sensors:
+            sensor.style = style
+
+
+    def gather(self) -> bool:
+        """Copies new or restyled frames into the fused buffer, False if no sensor had one"""
+        new_frame = False
+        for ix, sensor in enumerate(self.sensors):
+            acquired = sensor.acquire_frame()
+            if not (sensor.restyle() or acquired):
+                continue
+            new_frame = True
+
+            cloud = sensor.front
+            rows = slice(ix * MAX_TARGETS, (ix + 1) * MAX_TARGETS)
+            np.matmul(cloud.vertices, self.poses[ix], out=self.vertices[rows])
+            self.vertex_color[rows] = cloud.vertex_color
+            self.target_draw_size[rows] = cloud.target_draw_size
+            self.target_draw_filter[rows] = cloud.target_draw_filter
+        return new_frame
+
+
+    def draw(self):
+        new_frame = self.gather()
+
+        self.render.camera.view_projection_matrix()    # Brings camera.version up to date
+        if new_frame or self.screen_vertices is None or self.camera_version != self.render.camera.version:
+            with profiler.span('projection'):
+                self.screen_vertices = self.project_vertices()
+            self.camera_version = self.render.camera.version
+
+        with profiler.span('points'):
+            self.draw_vertices(self.screen_vertices)
+
+
+    def draw_vertices(self, vertices):
+        self.style.point_renderer.draw(self.render.screen, vertices, self.target_draw_filter, self.vertex_color, self.target_draw_size)
@@ -0,0 +1,132 @@
+import threading
+import time
+from binary_protocol import BinaryDecoder
+from frame_buffer import FrameRing
+from profiler import profiler
+from VL53L5CX import VL53L5CX_Reading, parse_lines
+
+# Bytes asked for per read when the port has nothing waiting, the read blocks until the first byte arrives
+MIN_READ = 1
+
+# A partial line longer than this can not be a frame (8x8 zones, 4 targets is ~4 kB), it is discarded
+MAX_LINE_BYTES = 64 * 1024
+
+# Wire formats, see AutoDecoder
+ASCII = 'ascii'
+BINARY = 'binary'
+
+
+class LineSplitter:
+    """Splits a byte stream, fed in arbitrary chunks, into complete lines"""
+    def __init__(self, max_line_bytes: int = MAX_LINE_BYTES):
+        self.buffer = bytearray()
+        self.max_line_bytes = max_line_bytes
+        self.discarded_bytes = 0
+
+    def feed(self, chunk: bytes) -> list[bytes]:
+        self.buffer += chunk
+
+        end = self.buffer.rfind(b'\n')
+        if end == -1:
+            if len(self.buffer) > self.max_line_bytes:
+                self.discarded_bytes += len(self.buffer)
+                self.buffer.clear()
+            return list()
+
+        lines = bytes(self.buffer[:end]).split(b'\n')
+        del self.buffer[:end + 1]
+        return lines
+
+
+class AsciiDecoder:
+    """Decodes ';' separated text lines from a byte stream fed in arbitrary chunks"""
+    def __init__(self):
+        self.splitter = LineSplitter()
+        self.frames = 0
+        self.errors = 0     # Truncated or malformed lines
+
+    @property
+    def discarded_bytes(self) -> int:
+        return self.splitter.discarded_bytes
+
+    def feed(self, chunk: bytes) -> list[VL53L5CX_Reading]:
+        lines = [line for line in self.splitter.feed(chunk) if line.strip()]
+        if not lines:
+            return list()
+
+        readings = parse_lines(lines)
+        self.errors += len(lines) - len(readings)
+        self.frames += len(readings)
+        return readings
+
+
+class AutoDecoder:
+    """
+    Tells the text format from the binary protocol by feeding the first chunks to both decoders.
+    The first one to decode a frame is used from then on.
+    """
+    def __init__(self):
+        self.candidates = {ASCII: AsciiDecoder(), BINARY: BinaryDecoder()}
+        self.format = None
+        self.decoder = None
+
+    frames = property(lambda self: self.decoder.frames if self.decoder else 0)
+    errors = property(lambda self: self.decoder.errors if self.decoder else 0)
+    discarded_bytes = property(lambda self: self.decoder.discarded_bytes if self.decoder else 0)
+
+    def feed(self, chunk: bytes) -> list[VL53L5CX_Reading]:
+        if self.decoder is not None:
+            return self.decoder.feed(chunk)
+
+        for wire_format, decoder in self.candidates.items():
+            readings = decoder.feed(chunk)
+            if readings:
+                self.format, self.decoder = wire_format, decoder
+                self.candidates = None
+                return readings
+        return list()
+
+
+class SerialReader(threading.Thread):
+    """
+    Reads a serial port (or anything with read() and in_waiting) as fast as data arrives.
+
+    The read blocks until data is available, then takes everything waiting in one chunk. The
+    decoder (by default the wire format is detected) turns chunks into readings, and every
+    reading is put in each of the sinks. The port should have a read timeout, so that stop() is noticed.
+
+    Readings are stamped with time.monotonic_ns() when their chunk was read. Frames that arrive in
+    the same chunk share a timestamp.
+    """
+    def __init__(self, port, sinks: list[FrameRing], decoder=None):
+        threading.Thread.__init__(self, daemon=True)
+
+        self.port = port
+        self.sinks = sinks
+        self.decoder = decoder if decoder is not None else AutoDecoder()
+        self.stop_event = threading.Event()
+        self.bytes_read = 0
+
+    def stop(self):
+        self.stop_event.set()
+        if self.is_alive():
+            self.join()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            with profiler.span('serial.read'):
+                chunk = self.port.read(max(self.port.in_waiting, MIN_READ))
+            if chunk:
+                self.feed(chunk, time.monotonic_ns())
+
+    def feed(self, chunk: bytes, timestamp_ns: int | None = None):
+        self.bytes_read += len(chunk)
+        if timestamp_ns is None:
+            timestamp_ns = time.monotonic_ns()
+        with profiler.span('parse'):
+            readings = self.decoder.feed(chunk)
+
+        for reading in readings:
+            reading.timestamp_ns = timestamp_ns
+            for sink in self.sinks:
+                sink.put(reading)
@@ -0,0 +1,91 @@
+import math
+import numpy as np
+import pygame as pg
+from hud import draw_panel, render_text
+from log_stats import LogStats
+
+"""
+Heatmap of a sensor's zones over the scene, colored by a statistic of the frames the sensor has
+shown since the heatmap was turned on (see log_stats.py). The zones are laid out as numbered, row by
+row, zone 0 top left. Colors span the lowest to the highest value of the zones, zones without a
+value are left dark.
+
+    valid       Frames with a valid target in the zone (%)
+    distance    Mean distance of the first target (mm)
+    sigma       Mean range sigma of the first target (mm)
+    signal      Mean signal per SPAD of the first target (kcps)
+    ambient     Mean ambient rate per SPAD of the zone (kcps)
+"""
+
+HEATMAP_STATS = ('valid', 'distance', 'sigma', 'signal', 'ambient')
+STAT_FIELDS = {'distance': 'distance_mm', 'sigma': 'range_sigma_mm', 'signal': 'signal_per_spad', 'ambient': 'ambient_per_spad'}
+STAT_LABELS = {
+    'valid': 'Valid target, % of frames',
+    'distance': 'Mean distance, mm',
+    'sigma': 'Mean range sigma, mm',
+    'signal': 'Mean signal per SPAD, kcps',
+    'ambient': 'Mean ambient per SPAD, kcps',
+}
+
+GRID_SIZE = 320         # px, the grid is square whatever the resolution
+COLOR_LOW = pg.Color('navy')
+COLOR_HIGH = pg.Color('orangered')
+COLOR_EMPTY = pg.Color('gray15')
+
+
+def zone_values(stats: LogStats, stat: str) -> np.ndarray | None:
+    """The statistic per zone, of the layout most frames had, NaN where there is none. None before any frame"""
+    with stats.lock:
+        if not stats.layouts:
+            return None
+        layout = max(stats.layouts.values(), key=lambda layout: layout.n_frames)
+        if stat == 'valid':
+            return layout.zone_valid / max(layout.n_frames, 1) * 100
+
+        field = layout.fields[STAT_FIELDS[stat]]
+        mean = np.where(field.count > 0, field.mean, np.nan)
+    if len(mean) == layout.nb_zones:
+        return mean
+    return mean.reshape(layout.nb_zones, layout.nb_targets_per_zone)[:, 0]
+
+
+class StatsHeatmap:
+    """Draws the heatmap of a sensor's statistics, one of HEATMAP_STATS"""
+    def __init__(self, render, stat: str):
+        if stat not in HEATMAP_STATS:
+            raise ValueError(f'Unknown heatmap statistic {stat!r}, expected one of {HEATMAP_STATS}')
+        self.render = render
+        self.stat = stat
+        self.text_color = pg.Color('aqua')
+        self.font = pg.font.SysFont("Source Code Pro", 14)
+        self.value_font = pg.font.SysFont("Source Code Pro", 12)
+
+
+    def draw(self, stats: LogStats, position: tuple[int, int], name: str | None = None):
+        screen = self.render.screen
+        panel_rows = [
+            # (text string,                    px linespace )
+            (f'Heatmap{f" {name}" if name else ""}: {STAT_LABELS[self.stat]}', 0),
+            (f'Frames                  - {stats.n_frames}', 20),
+        ]
+        draw_panel(screen, self.font, self.text_color, position, panel_rows)
+
+        values = zone_values(stats, self.stat)
+        if values is None:
+            return
+        row_len = math.isqrt(len(values))
+        cell = GRID_SIZE // row_len
+        left, top = position[0], position[1] + 50
+
+        seen = ~np.isnan(values)
+        low, high = (values[seen].min(), values[seen].max()) if seen.any() else (0, 0)
+        span = high - low or 1
+        text_color = tuple(pg.Color('white'))
+        for zone, value in enumerate(values):
+            rect = pg.Rect(left + (zone % row_len) * cell, top + (zone // row_len) * cell, cell - 1, cell - 1)
+            if np.isnan(value):
+                pg.draw.rect(screen, COLOR_EMPTY, rect)
+                continue
+            pg.draw.rect(screen, COLOR_LOW.lerp(COLOR_HIGH, (value - low) / span), rect)
+            text = render_text(self.value_font, f'{value:.0f}', text_color)
+            screen.blit(text, text.get_rect(center=rect.center))
@@ -0,0 +1,228 @@
+import numpy as np
+import pygame as pg
+from functools import lru_cache
+from point_renderer import PointRenderer
+from VL53L5CX import VL53L5CX_Reading, ZONE_FIELDS, TARGET_FIELDS
+
+"""
+Which targets are drawn, and how, as configured in a style file (YAML), e.g.
+
+    filter:                             # A target is drawn if it passes all predicates
+      target_status: [5, 9, 10]         # One of these values
+      distance_mm: {min: 0, max: 1700}  # min <= value < max, either bound may be left out
+      range_sigma_mm: {max: 40}
+    size:                               # Point radius in pixels, a number or by field:
+      field: distance_mm                # values[i] for edges[i - 1] <= value < edges[i]
+      edges: [200, 500, 700, 1000]
+      values: [10, 9, 8, 7, 6]
+    color:                              # One color per value (values past the end get the last color)
+      field: target_index
+      colors: [magenta, aqua, greenyellow, lightcoral]
+
+Colors can also be mapped from chosen values, with a default for the rest
+
+    color:
+      field: target_status
+      colors: {5: green, 9: yellow, 10: orange}
+      default: red
+
+or follow a colormap, interpolated in steps between min and max
+
+    color:
+      field: reflectance
+      colormap: {min: 0, max: 100, colors: [blue, green, yellow, red], steps: 32}
+
+Fields are the per-target and per-zone fields of VL53L5CX_Reading, plus target_index (the
+target's index within its zone) and zone_index. Colors are anything pygame.Color accepts.
+
+A style is compiled once into lookup tables, comparisons and a palette. Applying it to a frame is a
+few array operations over all targets at once, however many rules there are.
+"""
+
+DERIVED_FIELDS = ('target_index', 'zone_index')
+FIELD_DTYPES = {name: np.dtype(dtype) for name, dtype in ZONE_FIELDS + TARGET_FIELDS}
+FIELD_DTYPES.update({name: np.dtype(np.intp) for name in DERIVED_FIELDS})
+
+DEFAULT_SIZE = 6
+DEFAULT_COLOR = 'magenta'
+COLORMAP_STEPS = 32
+
+
+@lru_cache(maxsize=None)
+def index_fields(nb_zones: int, nb_targets_per_zone: int) -> dict[str, np.ndarray]:
+    zone_index, target_index = np.divmod(np.arange(nb_zones * nb_targets_per_zone), nb_targets_per_zone)
+    return {'zone_index': zone_index, 'target_index': target_index}
+
+
+def frame_field(sensor_frame: VL53L5CX_Reading, name: str) -> np.ndarray:
+    """
+    A field of every target, flattened to zone * nb_targets_per_zone + target. The reading may also
+    wrap several records (e.g. a slice of a log), the field is then flattened frame by frame.
+    """
+    n_frames = sensor_frame.record.size
+    if name in DERIVED_FIELDS:
+        values = index_fields(sensor_frame.nb_zones, sensor_frame.nb_targets_per_zone)[name]
+        return np.tile(values, n_frames) if n_frames > 1 else values
+    values = sensor_frame.record[name]
+    if values.ndim == sensor_frame.record.ndim + 1:
+        # Per-zone field, the same for all targets in the zone
+        return np.repeat(values, sensor_frame.nb_targets_per_zone, axis=-1).reshape(-1)
+    return values.reshape(-1)
+
+
+def n_targets(sensor_frame: VL53L5CX_Reading) -> int:
+    return sensor_frame.record.size * sensor_frame.nb_zones * sensor_frame.nb_targets_per_zone
+
+
+def check_field(name: str):
+    if name not in FIELD_DTYPES:
+        raise ValueError(f'Unknown field {name!r}, expected one of {sorted(FIELD_DTYPES)}')
+
+
+def lookup_table(field: str) -> bool:
+    """Fields that are single bytes are mapped through 256 entry lookup tables"""
+    dtype = FIELD_DTYPES[field]
+    return dtype.kind == 'u' and dtype.itemsize == 1
+
+
+class Predicate:
+    def __init__(self, field: str, spec):
+        check_field(field)
+        self.field = field
+        self.lut = None
+        self.values = None
+        self.bounds = None
+
+        if isinstance(spec, (list, tuple)):
+            if lookup_table(field):
+                self.lut = np.isin(np.arange(256), spec)
+            else:
+                self.values = np.array(spec)
+        elif isinstance(spec, dict) and set(spec) <= {'min', 'max'}:
+            self.bounds = (spec.get('min'), spec.get('max'))
+        else:
+            raise ValueError(f'Filter on {field!r} must be a list of values or {{min, max}}, got {spec!r}')
+
+    def mask(self, values: np.ndarray, out: np.ndarray):
+        """out &= predicate(values)"""
+        if self.lut is not None:
+            out &= self.lut[values]
+        elif self.values is not None:
+            out &= np.isin(values, self.values)
+        else:
+            low, high = self.bounds
+            if low is not None:
+                out &= values >= low
+            if high is not None:
+                out &= values < high
+
+
+class SizeRule:
+    def __init__(self, spec):
+        if isinstance(spec, (int, float)):
+            spec = {'field': 'distance_mm', 'edges': [], 'values': [spec]}
+        check_field(spec['field'])
+        self.field = spec['field']
+        self.edges = np.array(spec.get('edges', []))
+        self.values = np.array(spec['values'], dtype=np.int32)
+        if len(self.values) != len(self.edges) + 1:
+            raise ValueError(f'Size needs one more value than edges, got {len(self.values)} values and {len(self.edges)} edges')
+
+    def sizes(self, values: np.ndarray, out: np.ndarray):
+        if len(self.edges):
+            np.take(self.values, np.searchsorted(self.edges, values, side='right'), out=out)
+        else:
+            out[:] = self.values[0]
+
+
+class ColorRule:
+    """Maps a field to indices into self.palette"""
+    def __init__(self, spec):
+        check_field(spec['field'])
+        self.field = spec['field']
+        self.lut = None
+        self.keys = None
+        self.scale = None
+
+        if 'colormap' in spec:
+            colormap = spec['colormap']
+            stops = [pg.Color(color) for color in colormap['colors']]
+            steps = int(colormap.get('steps', COLORMAP_STEPS))
+            positions = np.linspace(0, len(stops) - 1, steps)
+            self.palette = [stops[int(p)].lerp(stops[min(int(p) + 1, len(stops) - 1)], p - int(p)) for p in positions]
+            low, high = colormap['min'], colormap['max']
+            if not high > low:
+                raise ValueError(f'Colormap on {self.field!r} needs max greater than min, got min {low} and max {high}')
+            self.scale = (low, (steps - 1) / (high - low))
+
+        elif isinstance(spec['colors'], dict):
+            keys = sorted(spec['colors'])
+            self.palette = [pg.Color(spec['colors'][key]) for key in keys] + [pg.Color(spec.get('default', DEFAULT_COLOR))]
+            if lookup_table(self.field):
+                self.lut = np.full(256, len(keys), dtype=np.intp)
+                self.lut[keys] = np.arange(len(keys))
+            else:
+                self.keys = np.array(keys)
+
+        else:
+            self.palette = [pg.Color(color) for color in spec['colors']]
+
+    def color_indices(self, values: np.ndarray, out: np.ndarray):
+        if self.scale is not None:
+            low, scale = self.scale
+            np.clip(np.rint((values.astype(np.float64) - low) * scale), 0, len(self.palette) - 1, out=out, casting='unsafe')
+        elif self.lut is not None:
+            np.take(self.lut, values, out=out)
+        elif self.keys is not None:
+            ix = np.minimum(np.searchsorted(self.keys, values), len(self.keys) - 1)
+            np.copyto(out, np.where(self.keys[ix] == values, ix, len(self.keys)))
+        else:
+            np.clip(values, 0, len(self.palette) - 1, out=out)
+
+
+class Style:
+    def __init__(self, spec: dict):
+        spec = spec or dict()
+        unknown = set(spec) - {'filter', 'size', 'color'}
+        if unknown:
+            raise ValueError(f'Unknown style sections {sorted(unknown)}, expected filter, size and color')
+
+        try:
+            self.predicates = [Predicate(field, predicate) for field, predicate in (spec.get('filter') or dict()).items()]
+            self.size = SizeRule(spec.get('size', DEFAULT_SIZE))
+            self.color = ColorRule(spec.get('color', {'field': 'target_index', 'colors': [DEFAULT_COLOR]}))
+        except KeyError as e:
+            raise ValueError(f'Missing {e} in style') from e
+        self.palette = self.color.palette
+        self.point_renderer = PointRenderer(self.palette)
+
+    def status_valid(self, sensor_frame: VL53L5CX_Reading) -> np.ndarray:
+        """Targets passing the target_status predicates, i.e. those that carry a measurement"""
+        valid = np.ones(n_targets(sensor_frame), dtype=bool)
+        for predicate in self.predicates:
+            if predicate.field == 'target_status':
+                predicate.mask(frame_field(sensor_frame, 'target_status'), valid)
+        return valid
+
+    def apply(self, sensor_frame: VL53L5CX_Reading, distance_mm: np.ndarray, draw_filter: np.ndarray, color_ix: np.ndarray, size: np.ndarray):
+        """
+        Writes which targets to draw, their palette index and size. distance_mm replaces the
+        frame's distances, e.g. after temporal filtering. draw_filter is and-ed, not overwritten.
+        """
+        def field(name: str) -> np.ndarray:
+            return distance_mm if name == 'distance_mm' else frame_field(sensor_frame, name)
+
+        for predicate in self.predicates:
+            predicate.mask(field(predicate.field), draw_filter)
+        self.size.sizes(field(self.size.field), size)
+        self.color.color_indices(field(self.color.field), color_ix)
+
+
+def load_style(path: str) -> Style:
+    import yaml
+
+    try:
+        with open(path) as f:
+            return Style(yaml.safe_load(f))
+    except yaml.YAMLError as e:
+        raise ValueError(f'{path} is not valid YAML: {e}') from e
@@ -1,5 +1,6 @@
 from object_3d import Object3D
 import numpy as np
+import pygame as pg
 
 class CheckerBoard(Object3D):
     
@@ -10,44 +11,58 @@ class CheckerBoard(Object3D):
 
         self.edge_color = cell_color
 
-        self.vertices = np.empty([0, 4])
-        self.faces = np.empty([0, 4], dtype=np.int32)
-
         # Each cell in the checkerboard has 4 vertices and makes up one face.
         # Number of cols per row
         n_rows = int(board_size[0] / cell_size[0])
         # number of columns of cells
         n_cols = int(board_size[1] / cell_size[1])
 
-        # Helps constructing the np.array for the vertice, which is quite verbose
-        def cell_vertices(r, c, offsets, cell_size):
-            return np.array([(
-                (r + offsets[0]) * cell_size[0],
-                (c + offsets[1]) * cell_size[1],
-                0, 
-                1
-            )], dtype=np.float64)
-
         # Assume only even-numbered rows and columns. Create cells in pars (2*2 diagonal)
-        for r in range(0, n_rows, 2):
-            for c in range(0, n_cols, 2):
-                
-                cell_offsets = [
-                    [(0, 0), (0, 1), (1, 1), (1, 0)],
-                    [(1, 1), (1, 2), (2, 2), (2, 1)]
-                ]
-                for v_offsets in cell_offsets:
-                    for v_offset in v_offsets:
-                        self.vertices = np.concatenate(
-                            (self.vertices, cell_vertices(r, c, v_offset, cell_size))
-                        )
-
-                    # Construct a face from the vertix indices of the last cell
-                    v_len = len(self.vertices)
-                    self.faces = np.concatenate(
-                        (self.faces, np.array([(v_len - 4, v_len - 3, v_len - 2, v_len - 1)]))
-                        , axis=0
-                        )
+        cell_offsets = np.array([
+            [(0, 0), (0, 1), (1, 1), (1, 0)],
+            [(1, 1), (1, 2), (2, 2), (2, 1)]
+        ])
+        rows, cols = np.meshgrid(np.arange(0, n_rows, 2), np.arange(0, n_cols, 2), indexing='ij')
+        pair_origins = np.stack((rows, cols), axis=-1).reshape(-1, 1, 1, 2)
+
+        # (pair, cell, vertex, r/c) -> one row per vertex, four consecutive vertices per face
+        corners = (pair_origins + cell_offsets).reshape(-1, 2) * np.array(cell_size)
+        self.vertices = np.column_stack((corners, np.zeros(len(corners)), np.ones(len(corners))))
+        self.faces = np.arange(len(self.vertices), dtype=np.int32).reshape(-1, 4)
 
         self.colors = [self.edge_color] * len(self.faces)
         self.color_faces = [(color, face) for color, face in zip(self.colors, self.faces)]
+
+
+class StaticScene(Object3D):
+    """
+    Objects that never move, merged into one mesh and rasterized into a cached background.
+    The background is only redrawn when the camera has moved, otherwise drawing is a single blit.
+    """
+    def __init__(self, render, objects: list[Object3D], background_color: pg.Color):
+        super().__init__(render)
+
+        self.faces_enabled = True
+        self.background_color = background_color
+
+        vertex_offsets = np.cumsum([0] + [len(obj.vertices) for obj in objects[:-1]])
+        self.vertices = np.concatenate([obj.vertices for obj in objects])
+        self.faces = np.concatenate([obj.faces + offset for obj, offset in zip(objects, vertex_offsets)]).astype(np.int32)
+        colors = [color for obj in objects for color, _ in obj.color_faces]
+        self.color_faces = list(zip(colors, self.faces))
+
+        self.background = None
+        self.camera_version = None
+
+    def draw(self):
+        self.render.camera.view_projection_matrix()    # Brings camera.version up to date
+        if self.background is None or self.background.get_size() != self.render.screen.get_size():
+            self.background = pg.Surface(self.render.screen.get_size())
+            self.camera_version = None
+
+        if self.camera_version != self.render.camera.version:
+            self.background.fill(self.background_color)
+            self.draw_faces(self.project_vertices(), self.background)
+            self.camera_version = self.render.camera.version
+
+        self.render.screen.blit(self.background, (0, 0))
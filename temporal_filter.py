@@ -0,0 +1,101 @@
+import numpy as np
+from VL53L5CX import VL53L5CX_Reading
+
+"""
+Temporal filtering of target distances, per zone and target, over the last frames of a sensor.
+
+    ema         Exponential moving average, every sample also weighted by 1 / range_sigma_mm^2
+    median      Median of the valid samples
+    outlier     Samples further than rejection_sigmas * range_sigma_mm from the median are rejected
+                (and a rejected current sample is not drawn), the rest are averaged as in ema
+
+Only samples with a valid target status take part. A target without any usable sample in the
+window keeps its raw distance.
+"""
+
+FILTER_MODES = ('ema', 'median', 'outlier')
+
+# Matches sensor_frame_3d.MAX_TARGETS, 64 zones * 4 targets
+MAX_TARGETS = 256
+
+
+class TemporalFilter:
+    def __init__(self, mode: str = 'ema', window: int = 8, alpha: float = 0.3, rejection_sigmas: float = 3.0):
+        if mode not in FILTER_MODES:
+            raise ValueError(f'Unknown filter {mode!r}, expected one of {FILTER_MODES}')
+        if window < 1:
+            raise ValueError(f'Window must be at least 1 frame, got {window}')
+
+        self.mode = mode
+        self.window = window
+        self.rejection_sigmas = rejection_sigmas
+        self.age_weights = (1 - alpha) ** np.arange(window)
+
+        # Ring of the last frames, slot head is written next
+        self.distance = np.zeros((window, MAX_TARGETS))
+        self.sigma = np.ones((window, MAX_TARGETS))
+        self.valid = np.zeros((window, MAX_TARGETS), dtype=bool)
+        self.head = 0
+        self.layout = None
+
+        # Output buffers
+        self.distance_mm = np.zeros(MAX_TARGETS, dtype=np.int32)
+        self.keep = np.zeros(MAX_TARGETS, dtype=bool)
+
+    def reset(self):
+        """Forgets all frames, e.g. after seeking in a log"""
+        self.valid[...] = False
+        self.head = 0
+
+    def update(self, sensor_frame: VL53L5CX_Reading, status_valid: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Adds a frame and returns (filtered distance_mm, keep), both flattened to zone * nb_targets_per_zone + target.
+        status_valid tells which targets of the frame have a valid status.
+        """
+        layout = (sensor_frame.nb_zones, sensor_frame.nb_targets_per_zone)
+        n = layout[0] * layout[1]
+        if layout != self.layout:
+            self.reset()
+            self.layout = layout
+
+        slot = self.head
+        self.distance[slot, :n] = sensor_frame.distance_mm.reshape(-1)
+        np.maximum(sensor_frame.range_sigma_mm.reshape(-1), 1, out=self.sigma[slot, :n])
+        self.valid[slot, :n] = status_valid[:n]
+        self.head = (slot + 1) % self.window
+
+        distance, sigma, valid = self.distance[:, :n], self.sigma[:, :n], self.valid[:, :n]
+        keep = self.keep[:n]
+        keep[:] = valid[slot]
+
+        if self.mode == 'ema':
+            estimate = self.weighted_mean(distance, sigma, valid, slot)
+        elif self.mode == 'median':
+            estimate = self.median(distance, valid)
+        else:
+            median = self.median(distance, valid)
+            inlier = valid & (np.abs(distance - median) <= self.rejection_sigmas * sigma)
+            estimate = self.weighted_mean(distance, sigma, inlier, slot)
+            keep &= inlier[slot]
+
+        # No usable sample, keep the raw distance
+        estimate = np.where(np.isnan(estimate), distance[slot], estimate)
+        np.rint(estimate, out=estimate)
+        self.distance_mm[:n] = estimate
+        return self.distance_mm[:n], keep
+
+    def weighted_mean(self, distance: np.ndarray, sigma: np.ndarray, use: np.ndarray, slot: int) -> np.ndarray:
+        """Mean over the ring weighted by age and 1 / sigma^2, NaN where no sample is used"""
+        ages = (slot - np.arange(self.window)) % self.window
+        weights = (self.age_weights[ages, np.newaxis] * use) / (sigma * sigma)
+        total = weights.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return (weights * distance).sum(axis=0) / total
+
+    def median(self, distance: np.ndarray, use: np.ndarray) -> np.ndarray:
+        """Median over the ring of the used samples, NaN where no sample is used"""
+        values = np.sort(np.where(use, distance, np.inf), axis=0)
+        counts = use.sum(axis=0)
+        low = np.take_along_axis(values, np.maximum((counts - 1) // 2, 0)[np.newaxis], axis=0)[0]
+        high = np.take_along_axis(values, np.minimum(counts // 2, self.window - 1)[np.newaxis], axis=0)[0]
+        return np.where(counts > 0, (low + high) / 2, np.nan)
@@ -0,0 +1,96 @@
+import os
+import sys
+import numpy as np
+import pytest
+from binary_protocol import BinaryDecoder, encode_packet
+from serial_reader import AutoDecoder, BINARY
+from test_vl53l5cx import synthetic_reading
+
+
+def assert_same_reading(decoded, reading):
+    assert (decoded.nb_zones, decoded.nb_targets_per_zone) == (reading.nb_zones, reading.nb_targets_per_zone)
+    assert decoded.record.tobytes() == reading.record.tobytes()
+
+
+def test_roundtrip():
+    readings = [synthetic_reading(64, 4, seed) for seed in range(3)]
+    decoder = BinaryDecoder()
+    decoded = decoder.feed(b''.join(encode_packet(reading) for reading in readings))
+
+    assert len(decoded) == decoder.frames == 3
+    for decoded_reading, reading in zip(decoded, readings):
+        assert_same_reading(decoded_reading, reading)
+    assert decoder.errors == decoder.discarded_bytes == 0
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 100])
+def test_packets_split_over_chunks(chunk_size):
+    readings = [synthetic_reading(16, 2, seed) for seed in range(3)]
+    stream = b''.join(encode_packet(reading) for reading in readings)
+
+    decoder = BinaryDecoder()
+    decoded = list()
+    for start in range(0, len(stream), chunk_size):
+        decoded += decoder.feed(stream[start:start + chunk_size])
+
+    assert len(decoded) == 3
+    for decoded_reading, reading in zip(decoded, readings):
+        assert_same_reading(decoded_reading, reading)
+    assert decoder.buffer == b''
+
+
+def test_resync_after_bad_crc():
+    readings = [synthetic_reading(16, 2, seed) for seed in range(3)]
+    packets = [bytearray(encode_packet(reading)) for reading in readings]
+    packets[1][20] ^= 0xff
+
+    decoder = BinaryDecoder()
+    decoded = decoder.feed(b'garbage' + b''.join(packets))
+
+    assert [reading.record.tobytes() for reading in decoded] == [readings[0].record.tobytes(), readings[2].record.tobytes()]
+    assert decoder.errors == 1
+    assert decoder.discarded_bytes >= len(b'garbage') + len(packets[1])
+
+
+def test_decoded_readings_rotate():
+    reading = synthetic_reading(16, 2)
+    decoded = BinaryDecoder().feed(encode_packet(reading))[0]
+    assert not decoded.record.flags.writeable
+
+    decoded.rotate_ccw()
+    reading.rotate_ccw()
+    assert_same_reading(decoded, reading)
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='needs a pty')
+def test_auto_decoder_over_pty():
+    import pty
+    import tty
+
+    readings = [synthetic_reading(64, 2, seed) for seed in range(4)]
+    packets = [bytearray(encode_packet(reading)) for reading in readings]
+    packets[2][-1] ^= 0xff
+
+    master, slave = pty.openpty()
+    tty.setraw(slave)
+    try:
+        stream = b''.join(packets)
+        decoder = AutoDecoder()
+        decoded = list()
+        received = 0
+        for start in range(0, len(stream), 1000):
+            os.write(master, stream[start:start + 1000])
+            while received < min(start + 1000, len(stream)):
+                chunk = os.read(slave, 4096)
+                received += len(chunk)
+                decoded += decoder.feed(chunk)
+    finally:
+        os.close(master)
+        os.close(slave)
+
+    assert decoder.format == BINARY
+    assert decoder.frames == 3 and decoder.errors == 1
+    for decoded_reading, reading in zip(decoded, [readings[0], readings[1], readings[3]]):
+        assert_same_reading(decoded_reading, reading)
+        decoded_reading.rotate_ccw()
+        np.testing.assert_array_equal(decoded_reading.distance_mm.reshape(8, 8, 2)[0, :, 0], reading.distance_mm.reshape(8, 8, 2)[:, -1, 0])
@@ -0,0 +1,138 @@
+import os
+import shutil
+import numpy as np
+import pytest
+from log_files import (HEADER_SIZE, BinaryLogWriter, CompressedLog, CompressedLogWriter, LazyJsonLog, StreamingLogWriter,
+                       TimeIndex, decode_deltas, encode_deltas, open_log, read_json_file)
+from test_vl53l5cx import synthetic_reading
+
+EXAMPLE_LOG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'example_logs', 'multitarget2_5Hz.json')
+
+
+def test_lazy_json_log_close(tmp_path):
+    path = str(tmp_path / 'log.json')
+    shutil.copy(EXAMPLE_LOG, path)
+    expected = read_json_file(EXAMPLE_LOG)
+
+    log = LazyJsonLog(path)
+    assert len(log) == len(expected)
+    readings = [log[ix] for ix in (0, 1, 2, -1)]
+    log.close()
+
+    assert log.buffer.closed and log.file.closed
+    assert not log.read_ahead_thread.is_alive()
+    # Decoded readings stay valid
+    for reading, ix in zip(readings, (0, 1, 2, -1)):
+        assert reading.record.tobytes() == expected[ix].record.tobytes()
+
+
+def write_timed_log(path: str, timestamps_ns: list[int]):
+    with BinaryLogWriter(path, timestamps=True) as writer:
+        for seed, timestamp_ns in enumerate(timestamps_ns):
+            reading = synthetic_reading(seed=seed)
+            reading.timestamp_ns = timestamp_ns
+            writer.write(reading)
+
+
+def test_time_index(tmp_path):
+    path = str(tmp_path / 'log.vlog')
+    write_timed_log(path, [10**9, 10**9 + 100_000_000, 10**9 + 300_000_000])
+    log = open_log(path)
+    time_index = TimeIndex(log, 5)
+
+    assert time_index.timed
+    assert time_index.duration == pytest.approx(0.45)
+    assert [time_index.frame_at(seconds) for seconds in (-1, 0, 0.099, 0.1, 0.25, 0.3, 10)] == [0, 0, 0, 1, 1, 2, 2]
+    log.close()
+
+
+def test_time_index_one_timestamp(tmp_path):
+    # Frames read in the same chunk share a timestamp
+    path = str(tmp_path / 'log.vlog')
+    write_timed_log(path, [10**9] * 3)
+    log = open_log(path)
+    time_index = TimeIndex(log, 5)
+
+    assert time_index.duration == pytest.approx(0.2)
+    assert time_index.frame_at(0.1) == 2
+    log.close()
+
+
+@pytest.mark.parametrize('dtype', ['<i1', '<u1', '<i2', '<u2', '<u4', '<i8'])
+def test_deltas_roundtrip_extremes(dtype):
+    info = np.iinfo(dtype)
+    # Frames along the first axis, jumping between the extremes of the type
+    values = np.array([[info.min, info.max, 0], [info.max, info.min, 1], [info.max, info.max, info.min], [0, info.min, info.max]], dtype=dtype)
+    out = np.empty_like(values)
+    decode_deltas(encode_deltas(values), out)
+    np.testing.assert_array_equal(out, values)
+
+
+def write_compressed_log(path: str, n_frames: int, timed: bool, chunk_frames: int = 4) -> list:
+    readings = [synthetic_reading(seed=seed) for seed in range(n_frames)]
+    with CompressedLogWriter(path, timestamps=timed, chunk_frames=chunk_frames) as writer:
+        for ix, reading in enumerate(readings):
+            reading.timestamp_ns = 10**9 + ix * 66_666_667 if timed else None
+            writer.write(reading)
+    return readings
+
+
+@pytest.mark.parametrize('timed', [False, True])
+def test_compressed_log_roundtrip(tmp_path, timed):
+    path = str(tmp_path / 'log.vlz')
+    readings = write_compressed_log(path, 10, timed)
+
+    log = open_log(path)
+    assert isinstance(log, CompressedLog) and len(log) == 10 and len(log.chunks) == 3
+    for reading, expected in zip(log, readings):
+        assert reading.record.tobytes() == expected.record.tobytes()
+        assert reading.timestamp_ns == expected.timestamp_ns
+    log.close()
+
+
+def test_compressed_log_read_across_chunks(tmp_path):
+    path = str(tmp_path / 'log.vlz')
+    readings = write_compressed_log(path, 10, timed=True)
+    expected = np.stack([reading.record for reading in readings])
+
+    log = CompressedLog(path)
+    for start, stop in ((0, 10), (3, 5), (3, 9), (4, 8), (9, 10), (5, 5)):
+        assert log.read(start, stop).tobytes() == expected[start:stop].tobytes()
+    log.close()
+
+
+def test_compressed_log_truncated(tmp_path):
+    path = str(tmp_path / 'log.vlz')
+    readings = write_compressed_log(path, 10, timed=True)
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 1)
+
+    log = CompressedLog(path)
+    assert len(log) == 8 and len(log.timestamps) == 8
+    assert log[-1].record.tobytes() == readings[7].record.tobytes()
+    log.close()
+
+
+def test_streaming_log_writer_rotation(tmp_path):
+    readings = [synthetic_reading(seed=seed) for seed in range(10)] + [synthetic_reading(16, 1, seed) for seed in range(3)]
+    for ix, reading in enumerate(readings):
+        reading.timestamp_ns = 10**9 + ix * 10**8
+
+    record_bytes = 8 + readings[0].record.nbytes
+    recorder = StreamingLogWriter(str(tmp_path / 'capture.vlog'), max_bytes=HEADER_SIZE + 4 * record_bytes, flush_interval=0.01)
+    recorder.start()
+    for reading in readings:
+        recorder.append(reading)
+    recorder.close()
+
+    # 4 frames per file, then a new file for the frames with one target per zone
+    assert [os.path.basename(path) for path in recorder.paths] == [f'capture_{part:03d}.vlog' for part in range(4)]
+    assert recorder.frames_written == len(readings) and recorder.error is None
+    logs = [open_log(path) for path in recorder.paths]
+    assert [len(log) for log in logs] == [4, 4, 2, 3]
+    read_back = [reading for log in logs for reading in log]
+    for reading, expected in zip(read_back, readings):
+        assert reading.record.tobytes() == expected.record.tobytes()
+        assert reading.timestamp_ns == expected.timestamp_ns
+    for log in logs:
+        log.close()
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+from log_stats import HISTOGRAM_EDGES, FieldStats, LayoutStats
+from sensor_frame_3d import VALID_TARGET_STATUS
+from VL53L5CX import frame_dtype
+
+# Uneven chunks, one of them a single frame
+CHUNKS = (1, 7, 30, 2, 20)
+
+
+def chunked(n_frames: int):
+    start = 0
+    for size in CHUNKS:
+        yield slice(start, start + size)
+        start += size
+    assert start == n_frames
+
+
+def test_field_stats_chunks():
+    rng = np.random.default_rng(0)
+    n_frames, n_cells = sum(CHUNKS), 6
+    values = rng.normal(1000, 200, (n_frames, n_cells)).round().clip(0, 4000).astype(np.uint16)
+    mask = rng.random((n_frames, n_cells)) < 0.7
+    mask[:, 4] = False          # Never valid
+    mask[:, 5] = True
+
+    stats = FieldStats(n_cells, HISTOGRAM_EDGES['distance_mm'])
+    for rows in chunked(n_frames):
+        stats.update(values[rows], mask[rows])
+    summary = stats.summary()
+
+    for cell in range(n_cells):
+        used = values[mask[:, cell], cell].astype(np.float64)
+        assert summary['count'][cell] == len(used)
+        if not len(used):
+            assert all(np.isnan(summary[key][cell]) for key in ('mean', 'std', 'min', 'max', 'p50'))
+            continue
+        assert summary['mean'][cell] == pytest.approx(used.mean())
+        assert summary['std'][cell] == pytest.approx(used.std())
+        assert (summary['min'][cell], summary['max'][cell]) == (used.min(), used.max())
+        # Percentiles are exact to a histogram bin
+        assert abs(summary['p50'][cell] - np.percentile(used, 50, method='inverted_cdf')) <= 16
+
+
+def test_field_stats_without_mask():
+    values = np.array([[1, 100], [3, 100], [8, 100]], dtype=np.uint32)
+    stats = FieldStats(2, HISTOGRAM_EDGES['signal_per_spad'])
+    stats.update(values[:1])
+    stats.update(values[1:])
+    np.testing.assert_allclose(stats.mean, [4, 100])
+    np.testing.assert_allclose(stats.std(), [values[:, 0].std(), 0])
+
+
+def test_layout_stats_chunks():
+    rng = np.random.default_rng(1)
+    n_frames = sum(CHUNKS)
+    records = np.zeros(n_frames, dtype=frame_dtype(16, 2))
+    records['nb_target_detected'] = rng.integers(0, 3, records['nb_target_detected'].shape)
+    records['target_status'] = rng.choice([5, 4, 9, 255], records['target_status'].shape)
+    records['distance_mm'] = rng.integers(0, 4000, records['distance_mm'].shape)
+    records['ambient_per_spad'] = rng.integers(0, 50, records['ambient_per_spad'].shape)
+
+    stats = LayoutStats(16, 2)
+    for rows in chunked(n_frames):
+        stats.update(records[rows])
+
+    detected = np.arange(2) < records['nb_target_detected'][:, :, np.newaxis]
+    valid = detected & np.isin(records['target_status'], VALID_TARGET_STATUS)
+    assert stats.n_frames == n_frames
+    np.testing.assert_array_equal(stats.detected, detected.sum(axis=0).reshape(-1))
+    np.testing.assert_array_equal(stats.valid, valid.sum(axis=0).reshape(-1))
+    np.testing.assert_array_equal(stats.zone_valid, valid.any(axis=2).sum(axis=0))
+    assert stats.target_status[:, 255].sum() == np.count_nonzero(detected & (records['target_status'] == 255))
+
+    # Distances only over valid targets, ambient over every frame
+    distance = stats.fields['distance_mm']
+    for cell, (zone, target) in enumerate(np.ndindex(16, 2)):
+        used = records['distance_mm'][valid[:, zone, target], zone, target]
+        assert distance.count[cell] == len(used)
+        if len(used):
+            assert distance.mean[cell] == pytest.approx(used.mean())
+    np.testing.assert_allclose(stats.fields['ambient_per_spad'].mean, records['ambient_per_spad'].mean(axis=0))
@@ -0,0 +1,97 @@
+import threading
+import numpy as np
+from frame_buffer import FrameRing, KEEP_LATEST, LOSSLESS
+from serial_reader import ASCII, LineSplitter, SerialReader
+from VL53L5CX import VL53L5CX_Reading, frame_len
+
+
+def text_line(seed: int, nb_zones: int = 16, nb_targets_per_zone: int = 2) -> tuple[bytes, VL53L5CX_Reading]:
+    """A frame as the sensor sends it, and the reading it should parse to"""
+    values = np.random.default_rng(seed).integers(0, 100, frame_len(nb_zones, nb_targets_per_zone))
+    values[:2] = nb_zones, nb_targets_per_zone
+    return ';'.join(str(value) for value in values).encode() + b';\r\n', VL53L5CX_Reading.from_values(values)
+
+
+def test_line_splitter():
+    splitter = LineSplitter(max_line_bytes=16)
+    assert splitter.feed(b'1;2') == []
+    assert splitter.feed(b';3\n4;5\n6') == [b'1;2;3', b'4;5']
+    assert splitter.feed(b'\n') == [b'6']
+    # A partial line longer than max_line_bytes is dropped
+    assert splitter.feed(b'7' * 17) == []
+    assert splitter.discarded_bytes == 17
+    assert splitter.feed(b'8\n') == [b'8']
+
+
+def test_feed_lines_split_over_chunks():
+    lines, readings = zip(*(text_line(seed) for seed in range(5)))
+    stream = b''.join(lines)
+    ring = FrameRing(16, LOSSLESS)
+    reader = SerialReader(None, [ring])
+
+    # Chunk boundaries fall inside numbers, between ';' and '\r\n', and between lines
+    for start in range(0, len(stream), 37):
+        reader.feed(stream[start:start + 37], timestamp_ns=start)
+
+    assert reader.decoder.format == ASCII
+    assert reader.bytes_read == len(stream)
+    received = ring.drain()
+    assert [reading.record.tobytes() for reading in received] == [reading.record.tobytes() for reading in readings]
+    assert reader.decoder.errors == 0
+    # Stamped with the time of the chunk that completed the line
+    assert all(reading.timestamp_ns is not None for reading in received)
+    assert received[0].timestamp_ns < received[-1].timestamp_ns
+
+
+def test_feed_malformed_line():
+    line, reading = text_line(0)
+    ring = FrameRing(4)
+    reader = SerialReader(None, [ring])
+    reader.feed(line + line[:len(line) // 2] + b'\n' + line)
+    assert [frame.record.tobytes() for frame in ring.drain()] == [reading.record.tobytes()] * 2
+    assert reader.decoder.errors == 1
+
+
+def test_keep_latest_ring_overfull():
+    lines, readings = zip(*(text_line(seed) for seed in range(5)))
+    display = FrameRing(2, KEEP_LATEST)
+    reader = SerialReader(None, [display])
+    reader.feed(b''.join(lines))
+
+    # The oldest frames are dropped, the newest are kept in order
+    assert (display.received, display.dropped) == (5, 3)
+    assert [reading.record.tobytes() for reading in display.drain()] == [reading.record.tobytes() for reading in readings[3:]]
+
+
+def test_lossless_ring_overfull():
+    lines, readings = zip(*(text_line(seed) for seed in range(5)))
+    recorder = FrameRing(2, LOSSLESS)
+    display = FrameRing(1, KEEP_LATEST)
+    reader = SerialReader(None, [display, recorder])
+
+    # The reader blocks on the full lossless ring until the consumer takes frames
+    feeder = threading.Thread(target=reader.feed, args=(b''.join(lines),))
+    feeder.start()
+    received = list()
+    while len(received) < len(readings):
+        frame = recorder.get(timeout=5)
+        assert frame is not None
+        received.append(frame)
+    feeder.join(timeout=5)
+
+    assert not feeder.is_alive()
+    assert recorder.dropped == 0
+    assert [reading.record.tobytes() for reading in received] == [reading.record.tobytes() for reading in readings]
+    assert display.drain()[0].record.tobytes() == readings[-1].record.tobytes()
+
+
+def test_lossless_ring_closed():
+    ring = FrameRing(1, LOSSLESS)
+    assert ring.put(1)
+    # Still full after the timeout, the frame is dropped rather than blocking for ever
+    assert not ring.put(2, timeout=0.01)
+    ring.close()
+    # Closed, puts return at once
+    assert not ring.put(3)
+    assert (ring.received, ring.dropped) == (3, 2)
+    assert ring.get() == 1 and ring.get() is None
@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+from style_rules import ColorRule
+
+
+def colormap_rule(low, high, steps=5) -> ColorRule:
+    return ColorRule({'field': 'distance_mm', 'colormap': {'colors': ['blue', 'red'], 'min': low, 'max': high, 'steps': steps}})
+
+
+def test_colormap_indices():
+    rule = colormap_rule(0, 400)
+    out = np.zeros(5, dtype=np.intp)
+    rule.color_indices(np.array([-50, 0, 100, 400, 1000]), out)
+    np.testing.assert_array_equal(out, [0, 0, 1, 4, 4])
+
+
+@pytest.mark.parametrize('low, high', [(100, 100), (400, 0)])
+def test_colormap_needs_max_above_min(low, high):
+    with pytest.raises(ValueError, match="'distance_mm'"):
+        colormap_rule(low, high)
+
+
+@pytest.mark.parametrize('field, dtype, low, high, steps', [('reflectance', np.uint8, 10, 90, 5), ('signal_per_spad', np.uint32, 100, 800, 8)])
+def test_colormap_unsigned_below_min(field, dtype, low, high, steps):
+    rule = ColorRule({'field': field, 'colormap': {'colors': ['blue', 'red'], 'min': low, 'max': high, 'steps': steps}})
+    out = np.zeros(4, dtype=np.intp)
+    rule.color_indices(np.array([0, low // 2, low, high * 2], dtype=dtype), out)
+    np.testing.assert_array_equal(out, [0, 0, 0, steps - 1])
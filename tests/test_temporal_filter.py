@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+from temporal_filter import TemporalFilter
+from VL53L5CX import VL53L5CX_Reading, frame_dtype
+
+
+def make_frame(distances: list[int], sigmas: list[int] | None = None, nb_zones: int = 16) -> VL53L5CX_Reading:
+    """A frame with one target per zone, the first zones at the given distances and range sigmas"""
+    record = np.zeros((), dtype=frame_dtype(nb_zones, 1))
+    record['distance_mm'][:len(distances), 0] = distances
+    record['range_sigma_mm'][:, 0] = 10
+    if sigmas is not None:
+        record['range_sigma_mm'][:len(sigmas), 0] = sigmas
+    return VL53L5CX_Reading.from_record(record)
+
+
+def feed(temporal_filter: TemporalFilter, samples: list[tuple[int, int, bool]], nb_zones: int = 16):
+    """Feeds (distance, sigma, valid) of zone 0 frame by frame, returns the last (distance, keep) of zone 0"""
+    for distance, sigma, valid in samples:
+        status_valid = np.zeros(nb_zones, dtype=bool)
+        status_valid[0] = valid
+        distance_mm, keep = temporal_filter.update(make_frame([distance], [sigma], nb_zones), status_valid)
+    return int(distance_mm[0]), bool(keep[0])
+
+
+def test_ema():
+    temporal_filter = TemporalFilter('ema', window=4, alpha=0.5)
+    # Age weights 1, 0.5: (200 * 1 + 100 * 0.5) / 1.5
+    assert feed(temporal_filter, [(100, 10, True), (200, 10, True)]) == (167, True)
+
+    temporal_filter = TemporalFilter('ema', window=4, alpha=0.5)
+    # Also weighted by 1 / sigma^2: (200 * 1 / 400 + 100 * 0.5 / 100) / (1 / 400 + 0.5 / 100)
+    assert feed(temporal_filter, [(100, 10, True), (200, 20, True)]) == (133, True)
+
+
+def test_ema_invalid_samples():
+    temporal_filter = TemporalFilter('ema', window=4, alpha=0.5)
+    # The invalid sample takes no part and is not drawn, the estimate is that of the valid ones
+    assert feed(temporal_filter, [(100, 10, True), (200, 10, True), (900, 10, False)]) == (167, False)
+
+    temporal_filter = TemporalFilter('ema', window=4)
+    # No valid sample at all, the raw distance is kept
+    assert feed(temporal_filter, [(100, 10, False), (300, 10, False)]) == (300, False)
+
+
+def test_median():
+    temporal_filter = TemporalFilter('median', window=3)
+    assert feed(temporal_filter, [(100, 10, True), (300, 10, True), (200, 10, True)]) == (200, True)
+    # The ring holds the last 3 samples: 300, 200, 120
+    assert feed(temporal_filter, [(120, 10, True)]) == (200, True)
+    # Even number of valid samples: the mean of the middle two of 200, 120
+    assert feed(temporal_filter, [(5000, 10, False)]) == (160, False)
+
+
+def test_outlier_rejected():
+    temporal_filter = TemporalFilter('outlier', window=4, alpha=0.3, rejection_sigmas=3)
+    assert feed(temporal_filter, [(100, 10, True), (102, 10, True), (98, 10, True)]) == (100, True)
+    # Median 101, 500 is further than 3 sigma from it: not drawn, and the estimate is the weighted
+    # mean of the rest, (98 * 0.7 + 102 * 0.49 + 100 * 0.343) / (0.7 + 0.49 + 0.343)
+    assert feed(temporal_filter, [(500, 10, True)]) == (100, False)
+    # The ring holds 102, 98, 500, 120, median 111. 500 is still rejected, 120 is drawn:
+    # (120 * 1 + 98 * 0.49 + 102 * 0.343) / (1 + 0.49 + 0.343)
+    assert feed(temporal_filter, [(120, 10, True)]) == (111, True)
+
+
+def test_layout_change_resets():
+    temporal_filter = TemporalFilter('median', window=4)
+    feed(temporal_filter, [(100, 10, True), (100, 10, True)])
+    # 8x8 frames after 4x4 ones, the 4x4 samples are forgotten
+    assert feed(temporal_filter, [(400, 10, True)], nb_zones=64) == (400, True)
+    assert temporal_filter.valid[:, :64].sum() == 1
+
+
+def test_reset():
+    temporal_filter = TemporalFilter('ema', window=4)
+    feed(temporal_filter, [(100, 10, True), (100, 10, True)])
+    temporal_filter.reset()
+    assert feed(temporal_filter, [(400, 10, True)]) == (400, True)
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        TemporalFilter('mean')
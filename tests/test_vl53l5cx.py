@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+from log_files import open_log, save_readings_binary
+from VL53L5CX import VL53L5CX_Reading, frame_len, parse_line, parse_lines, parse_values
+
+
+def synthetic_reading_values(nb_zones: int = 16, nb_targets_per_zone: int = 2, seed: int = 0) -> np.ndarray:
+    """A frame in wire order"""
+    values = np.random.default_rng(seed).integers(0, 100, frame_len(nb_zones, nb_targets_per_zone))
+    values[:2] = nb_zones, nb_targets_per_zone
+    return values
+
+
+def synthetic_reading(nb_zones: int = 16, nb_targets_per_zone: int = 2, seed: int = 0) -> VL53L5CX_Reading:
+    return VL53L5CX_Reading.from_values(synthetic_reading_values(nb_zones, nb_targets_per_zone, seed))
+
+
+def rotated_zones(values: np.ndarray, row_len: int) -> np.ndarray:
+    """Reference: the zones as a row_len x row_len image, rotated a quarter turn counterclockwise"""
+    image = values.reshape(row_len, row_len, *values.shape[1:])
+    return np.rot90(image, 1, axes=(0, 1)).reshape(values.shape)
+
+
+def test_rotate_ccw():
+    reading = synthetic_reading()
+    original = reading.record.copy()
+
+    reading.rotate_ccw()
+    for name in original.dtype.names[1:]:
+        np.testing.assert_array_equal(reading.record[name], rotated_zones(original[name], reading.row_len))
+    assert reading.silicon_temp_degc == int(original['silicon_temp_degc'])
+
+
+def test_rotate_ccw_four_times_is_identity():
+    reading = synthetic_reading(64, 4)
+    original = reading.record.copy()
+    for _ in range(4):
+        reading.rotate_ccw()
+    assert reading.record.tobytes() == original.tobytes()
+
+
+def test_rotate_ccw_memory_mapped(tmp_path):
+    path = str(tmp_path / 'log.vlog')
+    readings = [synthetic_reading(seed=seed) for seed in range(3)]
+    save_readings_binary(readings, path)
+
+    log = open_log(path)
+    reading = log[1]
+    assert not reading.record.flags.writeable
+    reading.rotate_ccw()
+
+    np.testing.assert_array_equal(reading.distance_mm, rotated_zones(readings[1].distance_mm, reading.row_len))
+    # The log itself is untouched
+    assert log[1].record.tobytes() == readings[1].record.tobytes()
+    log.close()
+
+
+def text_line(values: np.ndarray) -> bytes:
+    return ';'.join(str(value) for value in values).encode() + b';'
+
+
+def test_parse_line():
+    values = synthetic_reading_values()
+    values[2], values[3 + 3 + 2] = -5, -20     # silicon_temp_degc, distance_mm of zone 0, target 0
+    reading = parse_line(b' ' + text_line(values) + b'\r\n')
+    assert reading.record.tobytes() == VL53L5CX_Reading.from_values(values).record.tobytes()
+    assert reading.silicon_temp_degc == values[2]
+
+
+@pytest.mark.parametrize('token', [b'+', b'-', b'+5', b'1e3', b'0x10', b'5-3', b'--5', b'5 3', b'', b'1.5', b'a'])
+def test_parse_line_malformed_token(token):
+    line = text_line(synthetic_reading_values()).split(b';')
+    line[10] = token
+    assert parse_values(b';'.join(line)) is None
+    assert parse_line(b';'.join(line)) is None
+
+
+@pytest.mark.parametrize('position, value', [
+    (2, 128),                       # silicon_temp_degc, int8
+    (3, -1),                        # ambient_per_spad of zone 0, uint32
+    (3, 1 << 32),
+    (4, 256),                       # nb_target_detected, uint8
+    (3 + 3 + 2, 40000),             # distance_mm of zone 0, target 0, int16
+    (3 + 3 + 2, -40000),
+    (3 + 3 + 4, 300),               # target_status
+])
+def test_parse_line_out_of_range(position, value):
+    values = synthetic_reading_values()
+    values[position] = value
+    assert parse_line(text_line(values)) is None
+    # In a batch, only the bad line is dropped
+    assert len(parse_lines([text_line(synthetic_reading_values()), text_line(values)])) == 1
+
+
+def test_parse_line_extremes():
+    values = synthetic_reading_values()
+    values[2], values[3], values[3 + 3 + 2] = -128, (1 << 32) - 1, -32768
+    reading = parse_line(text_line(values))
+    assert (reading.silicon_temp_degc, reading.ambient_per_spad[0], reading.distance_mm[0, 0]) == (-128, (1 << 32) - 1, -32768)
@@ -0,0 +1,79 @@
+import numpy as np
+import pygame as pg
+import pytest
+from voxel_map import LOG_ODDS_HIT, LOG_ODDS_MAX, LOG_ODDS_MISS, VoxelMap, voxel_keys
+
+pg.font.init()
+
+
+def voxel_map(**kwargs) -> VoxelMap:
+    # insert() does not draw, the map needs no render
+    return VoxelMap(None, voxel_size=1.0, **kwargs)
+
+
+def key(x: int, y: int, z: int) -> int:
+    return int(voxel_keys(np.array([[x + 0.5, y + 0.5, z + 0.5]]), 1.0)[0])
+
+
+def insert_next_to(voxels: VoxelMap, x: int, y: int, z: int):
+    """Hits voxel (x, y, z) from the voxel below it, i.e. with no voxels passed through on the way"""
+    voxels.insert(np.array([[x + 0.5, y + 0.5, z + 0.5]]), np.array([x + 0.5, y + 0.5, z - 0.5]))
+
+
+def test_hits_raise_log_odds():
+    voxels = voxel_map()
+    for n_hits in range(1, 3):
+        insert_next_to(voxels, 0, 0, 5)
+        assert voxels.keys.tolist() == [key(0, 0, 5)]
+        assert voxels.log_odds[0] == pytest.approx(n_hits * LOG_ODDS_HIT)
+
+    for _ in range(10):
+        insert_next_to(voxels, 0, 0, 5)
+    assert voxels.log_odds[0] == pytest.approx(LOG_ODDS_MAX)
+
+
+def test_misses_lower_only_known_voxels():
+    voxels = voxel_map()
+    insert_next_to(voxels, 0, 0, 3)
+
+    # The ray from z 0 to 5 passes through voxels 1 - 4, of which only 3 is known
+    origin = np.array([0.5, 0.5, 0.5])
+    voxels.insert(np.array([[0.5, 0.5, 5.5]]), origin)
+    assert voxels.keys.tolist() == sorted([key(0, 0, 3), key(0, 0, 5)])
+    assert voxels.log_odds[voxels.keys == key(0, 0, 3)][0] == pytest.approx(LOG_ODDS_HIT + LOG_ODDS_MISS)
+
+    # Seen through until certainly free, then forgotten
+    for _ in range(10):
+        voxels.insert(np.array([[0.5, 0.5, 5.5]]), origin)
+    assert voxels.keys.tolist() == [key(0, 0, 5)]
+
+
+def test_max_voxels():
+    voxels = voxel_map(max_voxels=10)
+    for i in range(12):
+        insert_next_to(voxels, 2 * i, 0, 1)
+        assert len(voxels) <= 10
+    # At 11 voxels the 2 least recently hit were evicted, down to 90 %, then one more was hit
+    assert len(voxels) == 10
+    assert voxels.keys.tolist() == sorted(key(2 * i, 0, 1) for i in range(2, 12))
+
+
+def test_max_voxels_fixed_points():
+    voxels = voxel_map(max_voxels=3)
+    points = np.array([[2 * i + 0.5, 0.5, 1.5] for i in range(5)])
+    for _ in range(20):
+        voxels.insert(points, np.array([4.5, 0.5, -10]))
+        assert len(voxels) <= 3
+        assert set(voxels.keys.tolist()) <= {key(2 * i, 0, 1) for i in range(5)}
+
+
+def test_max_age():
+    voxels = voxel_map(max_age=3)
+    for i in range(6):
+        insert_next_to(voxels, 2 * i, 0, 1)
+    assert voxels.keys.tolist() == sorted(key(2 * i, 0, 1) for i in range(3, 6))
+
+    # Hit again, a voxel stays
+    insert_next_to(voxels, 6, 0, 1)
+    insert_next_to(voxels, 6, 0, 1)
+    assert voxels.keys.tolist() == sorted([key(6, 0, 1), key(10, 0, 1)])
@@ -0,0 +1,202 @@
+import os
+import sys
+import pygame as pg
+from argparse import Namespace
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from functools import lru_cache
+from pathlib import Path
+from log_files import open_log, TimeIndex
+from log_stats import LogStats
+from sensor_rig import load_rig_config
+from workers import DEFAULT_REPLAY_FREQUENCY
+
+"""
+Offscreen rendering of replays to video frames
+
+    png     One PNG file per video frame, frame_000000.png and on, in the output directory
+    rgb     Raw RGB24 frames (1920 x 1080 x 3 bytes), back to back, to a file or pipe ('-' is
+            stdout), e.g. python main.py --replay -i log.vlog --video rgb -o - |
+            ffmpeg -f rawvideo -pix_fmt rgb24 -s 1920x1080 -r 30 -i - clip.mp4
+
+The scene is the viewer's (room, sensor points, voxel map, HUD), drawn by Window3D onto a
+pygame.Surface instead of the window. Video frame k shows the log at k / fps seconds. Frames are
+rendered as fast as the CPU allows, neither -f nor the viewer's 60 FPS clock holds them back. Every
+log frame up to that time is fed to the sensors, none skipped, so the temporal filter and the voxel
+map see the whole log.
+
+With several jobs, the video is split in ranges of CHUNK_FRAMES frames, each rendered by one of a
+pool of processes, each with its own Window3D and surface. A range that does not follow the one the
+process rendered last starts over, feeding the filter's window of log frames before it without
+drawing them. The voxel map and the heatmap's statistics build on every frame since the first, so
+with either a process instead feeds all log frames up to the range, which as ranges are handed out
+in order is every log frame once per process.
+"""
+
+VIDEO_FORMATS = ('png', 'rgb')
+DEFAULT_FPS = 30
+CHUNK_FRAMES = 64
+
+
+def replay_sources(args: Namespace) -> list[tuple[str, int]]:
+    """(log path, playback frequency) of every replayed sensor"""
+    if not args.rig:
+        return [(args.i, args.f or DEFAULT_REPLAY_FREQUENCY)]
+
+    sources = load_rig_config(args.rig)
+    live = [source['name'] for source in sources if 'port' in source]
+    if live:
+        raise ValueError(f'Only replayed sensors can be rendered to video, {live} are live')
+    return [(source['replay'], source.get('frequency', args.f or DEFAULT_REPLAY_FREQUENCY)) for source in sources]
+
+
+def video_frames(args: Namespace, fps: int) -> int:
+    """Number of video frames, covering the longest of the logs"""
+    duration = 0.0
+    for path, frequency in replay_sources(args):
+        log = open_log(path)
+        duration = max(duration, TimeIndex(log, frequency).duration)
+        log.close()
+    return max(int(duration * fps + 1e-9), 1)
+
+
+class VideoScene:
+    """Window3D drawing offscreen, moved on by a fixed timestep"""
+    def __init__(self, options: tuple, fps: int):
+        from main import Window3D   # main imports this module
+        self.window = Window3D(Namespace(**dict(options)), offscreen=True)
+        self.fps = fps
+        self.next_frame = 0         # The video frame that follows on what the sensors have been fed
+        self.fed = [-1] * len(self.window.workers)
+
+        for worker in self.window.workers:
+            worker.replay_state = "Playing"
+
+    def seek(self, frame: int):
+        """Gets ready for a video frame that does not follow on the last one rendered"""
+        window = self.window
+        full_history = window.voxel_map is not None or window.heatmap is not None
+        if full_history:
+            if frame > self.next_frame:
+                return  # render() feeds the log frames in between
+            if window.voxel_map is not None:
+                window.voxel_map.clear()
+            if window.heatmap is not None:
+                for worker in window.workers:
+                    worker.sensor.stats = LogStats()
+
+        for ix, worker in enumerate(window.workers):
+            if worker.sensor.temporal_filter is not None:
+                worker.sensor.temporal_filter.reset()
+            if full_history:
+                first = 0
+            else:
+                first = max(worker.time_index.frame_at(frame / self.fps) - window.filter_window, 0)
+            self.fed[ix] = first - 1
+
+    def render(self, frame: int) -> pg.Surface:
+        """Draws video frame 'frame', after feeding the sensors the log frames up to its time"""
+        if frame != self.next_frame:
+            self.seek(frame)
+
+        for ix, worker in enumerate(self.window.workers):
+            seconds = min(frame / self.fps, worker.time_index.duration)
+            for log_ix in range(self.fed[ix] + 1, worker.time_index.frame_at(seconds) + 1):
+                worker.show_frame(log_ix)
+                self.fed[ix] = log_ix
+            worker.log_time = seconds
+
+        self.window.draw()
+        self.next_frame = frame + 1
+        return self.window.screen
+
+
+# One scene per worker process
+@lru_cache(maxsize=1)
+def worker_scene(options: tuple, fps: int) -> VideoScene:
+    return VideoScene(options, fps)
+
+
+class ChunkRenderer:
+    """Renders a range of video frames, in a worker process or in this one. Must be picklable"""
+    def __init__(self, options: tuple, fmt: str, path_out: str, fps: int):
+        self.options = options
+        self.fmt = fmt
+        self.path_out = path_out
+        self.fps = fps
+
+    def __call__(self, chunk: tuple[int, int]) -> bytes | None:
+        """Writes the frames start to stop as PNG files, or returns them as raw RGB"""
+        start, stop = chunk
+        scene = worker_scene(self.options, self.fps)
+        frames = list()
+        with redirect_stdout(sys.stderr):   # stdout may carry the video
+            for frame in range(start, stop):
+                screen = scene.render(frame)
+                if self.fmt == 'png':
+                    pg.image.save(screen, os.path.join(self.path_out, f'frame_{frame:06d}.png'))
+                else:
+                    frames.append(pg.image.tostring(screen, 'RGB'))
+        return b''.join(frames) if self.fmt == 'rgb' else None
+
+
+def output_path(args: Namespace, fmt: str) -> str:
+    """Directory of PNG files, or raw video file. Next to the log (rig file) unless given"""
+    if args.o:
+        return args.o
+    path = Path(args.rig or args.i)
+    return str(path.with_name(path.stem + ('_video' if fmt == 'png' else '.rgb')))
+
+
+def render_video(args: Namespace, fps: int = DEFAULT_FPS, jobs: int | None = None) -> tuple[str, int]:
+    """
+    Renders the replay (args.replay or args.rig, as for Window3D) to video frames in the format
+    args.video. Returns the path written and the number of frames.
+    """
+    fmt = args.video
+    if fmt not in VIDEO_FORMATS:
+        raise ValueError(f'Unknown video format {fmt!r}, expected one of {VIDEO_FORMATS}')
+
+    n_frames = video_frames(args, fps)
+    path_out = output_path(args, fmt)
+    if fmt == 'png':
+        os.makedirs(path_out, exist_ok=True)
+
+    options = tuple(sorted(vars(args).items()))
+    renderer = ChunkRenderer(options, fmt, path_out, fps)
+    chunks = [(start, min(start + CHUNK_FRAMES, n_frames)) for start in range(0, n_frames, CHUNK_FRAMES)]
+
+    if fmt == 'rgb' and path_out == '-':
+        out = sys.stdout.buffer
+    elif fmt == 'rgb':
+        out = open(path_out, 'wb')
+    else:
+        out = None
+
+    try:
+        jobs = jobs or os.cpu_count() or 1
+        if jobs == 1:
+            for chunk in chunks:
+                write_chunk(out, renderer(chunk))
+        else:
+            # Chunks are written in order, at most two per process are in flight (or held in memory)
+            with ProcessPoolExecutor(jobs) as pool:
+                pending = deque()
+                for chunk in chunks:
+                    pending.append(pool.submit(renderer, chunk))
+                    if len(pending) >= 2 * jobs:
+                        write_chunk(out, pending.popleft().result())
+                while pending:
+                    write_chunk(out, pending.popleft().result())
+    finally:
+        if out is sys.stdout.buffer:
+            out.flush()
+        elif out is not None:
+            out.close()
+    return path_out, n_frames
+
+
+def write_chunk(out, frames: bytes | None):
+    if out is not None:
+        out.write(frames)
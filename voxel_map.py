@@ -0,0 +1,223 @@
+import threading
+import numpy as np
+import pygame as pg
+from object_3d import Object3D
+from point_renderer import PointRenderer
+from profiler import profiler
+from hud import draw_panel
+
+"""
+Occupancy map accumulated over frames, as a sparse grid of voxels.
+
+A voxel is known by its integer coordinates floor(position / voxel_size), packed into one int64
+key (KEY_BITS per axis). The map keeps the keys in sorted arrays, next to each voxel's log-odds of
+being occupied and the update it was last hit in. Only voxels that have been hit are stored.
+
+Every frame, for all of its points at once:
+    hit     The voxels of the points, made unique (sorting) and looked up with np.searchsorted.
+            Known voxels gain LOG_ODDS_HIT, new ones are inserted.
+    miss    The voxels the rays pass through on their way from the sensor to the points, sampled
+            every voxel_size. Known voxels lose LOG_ODDS_MISS, unknown ones are left unknown.
+
+Log-odds are clamped, so that a voxel can change its mind. A voxel is drawn while its log-odds are
+above zero. Voxels are forgotten when they are certainly free (at the lower clamp), when not hit in
+max_age updates, and, least recently hit first, when there are more than max_voxels (down to
+EVICT_TO of it at once). Memory is bounded by max_voxels however long the map is fed.
+"""
+
+KEY_BITS = 21
+KEY_OFFSET = 1 << (KEY_BITS - 1)
+KEY_MASK = (1 << KEY_BITS) - 1
+
+# As in OctoMap, probabilities 0.7 (hit) and 0.4 (miss), clamped to 0.12 - 0.97
+LOG_ODDS_HIT = 0.85
+LOG_ODDS_MISS = -0.4
+LOG_ODDS_MIN = -2.0
+LOG_ODDS_MAX = 3.5
+
+DEFAULT_VOXEL_SIZE = 0.05
+DEFAULT_MAX_VOXELS = 100_000
+EVICT_TO = 0.9
+
+# Occupied voxels are colored by how certain they are
+COLOR_STEPS = 8
+COLOR_UNCERTAIN = pg.Color('darkslateblue')
+COLOR_CERTAIN = pg.Color('gold')
+VOXEL_DRAW_SIZE = 3
+
+
+def voxel_keys(points: np.ndarray, voxel_size: float) -> np.ndarray:
+    """Keys of the voxels holding the points, which are shaped (n, 3)"""
+    coordinates = np.floor(points / voxel_size).astype(np.int64) + KEY_OFFSET
+    np.clip(coordinates, 0, KEY_MASK, out=coordinates)
+    return (coordinates[:, 0] << (2 * KEY_BITS)) | (coordinates[:, 1] << KEY_BITS) | coordinates[:, 2]
+
+
+def voxel_centers(keys: np.ndarray, voxel_size: float) -> np.ndarray:
+    """Centers of the voxels as homogeneous vertices, shaped (n, 4)"""
+    centers = np.ones((len(keys), 4))
+    for axis, shift in enumerate((2 * KEY_BITS, KEY_BITS, 0)):
+        centers[:, axis] = ((keys >> shift) & KEY_MASK) - KEY_OFFSET + 0.5
+    centers[:, :3] *= voxel_size
+    return centers
+
+
+def ray_samples(points: np.ndarray, origin: np.ndarray, step: float) -> np.ndarray:
+    """Points every step along the rays from origin to each point, short of the point's own voxel"""
+    rays = points - origin
+    lengths = np.linalg.norm(rays, axis=1)
+    n_steps = np.maximum(np.floor(lengths / step).astype(np.int64) - 1, 0)
+
+    ray_ix = np.repeat(np.arange(len(points)), n_steps)
+    first = np.cumsum(n_steps) - n_steps
+    step_ix = np.arange(len(ray_ix)) - np.repeat(first, n_steps)
+    fractions = (step_ix + 0.5) * step / lengths[ray_ix]
+    return origin + rays[ray_ix] * fractions[:, np.newaxis]
+
+
+def unique_keys(keys: np.ndarray) -> np.ndarray:
+    """Sorted unique keys. Sorting is several times faster than np.unique (hashing) for these"""
+    keys = np.sort(keys)
+    return keys[np.concatenate((keys[:1] == keys[:1], keys[1:] != keys[:-1]))]
+
+
+def lookup(keys: np.ndarray, values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Where the values are, or would be inserted, in the sorted keys, and which of them are there"""
+    ix = np.searchsorted(keys, values)
+    found = np.zeros(len(values), dtype=bool)
+    inside = ix < len(keys)
+    found[inside] = keys[ix[inside]] == values[inside]
+    return ix, found
+
+
+class VoxelMap(Object3D):
+    """Occupancy map fed by the workers' threads (insert()) and drawn by the render thread"""
+    def __init__(self, render, voxel_size: float = DEFAULT_VOXEL_SIZE, max_voxels: int = DEFAULT_MAX_VOXELS, max_age: int | None = None):
+        super().__init__(render)
+        self.voxel_size = voxel_size
+        self.max_voxels = max_voxels
+        self.max_age = max_age
+
+        self.keys = np.empty(0, dtype=np.int64)         # Sorted
+        self.log_odds = np.empty(0, dtype=np.float32)
+        self.last_hit = np.empty(0, dtype=np.int64)
+        self.updates = 0
+        self.lock = threading.Lock()
+
+        # Occupied voxels as drawn, rebuilt when the map has changed
+        self.version = 0
+        self.vertices_version = None
+        self.vertex_color = np.empty(0, dtype=np.intp)
+        self.target_draw_size = np.empty(0, dtype=np.int32)
+        self.target_draw_filter = np.empty(0, dtype=bool)
+        self.vertices_enabled = True
+        self.screen_vertices = None
+        self.camera_version = None
+
+        palette = [COLOR_UNCERTAIN.lerp(COLOR_CERTAIN, step / (COLOR_STEPS - 1)) for step in range(COLOR_STEPS)]
+        self.point_renderer = PointRenderer(palette)
+
+        # For infobox:
+        self.text_color = pg.Color('aqua')
+        self.font = pg.font.SysFont("Source Code Pro", 14)
+
+
+    def __len__(self):
+        return len(self.keys)
+
+
+    def clear(self):
+        with self.lock:
+            self.keys, self.log_odds, self.last_hit = self.keys[:0], self.log_odds[:0], self.last_hit[:0]
+            self.version += 1
+
+
+    def insert(self, points: np.ndarray, origin: np.ndarray):
+        """Adds the hits of one frame, points shaped (n, 3), seen from origin, shaped (3,)"""
+        hits = unique_keys(voxel_keys(points, self.voxel_size))
+        misses = unique_keys(voxel_keys(ray_samples(points, origin, self.voxel_size), self.voxel_size))
+        misses = misses[~np.isin(misses, hits, assume_unique=True)]
+
+        with self.lock:
+            self.updates += 1
+            keys, log_odds, last_hit = self.keys, self.log_odds, self.last_hit
+
+            # Only known voxels can be missed
+            ix, known = lookup(keys, misses)
+            missed = ix[known]
+            log_odds[missed] = np.maximum(log_odds[missed] + LOG_ODDS_MISS, LOG_ODDS_MIN)
+
+            ix, known = lookup(keys, hits)
+            hit = ix[known]
+            log_odds[hit] = np.minimum(log_odds[hit] + LOG_ODDS_HIT, LOG_ODDS_MAX)
+            last_hit[hit] = self.updates
+
+            new = ~known
+            keys = np.insert(keys, ix[new], hits[new])
+            log_odds = np.insert(log_odds, ix[new], LOG_ODDS_HIT)
+            last_hit = np.insert(last_hit, ix[new], self.updates)
+
+            self.keys, self.log_odds, self.last_hit = self.evict(keys, log_odds, last_hit)
+            self.version += 1
+
+
+    def evict(self, keys: np.ndarray, log_odds: np.ndarray, last_hit: np.ndarray):
+        """Drops free and stale voxels, then the least recently hit ones if above max_voxels"""
+        keep = log_odds > LOG_ODDS_MIN
+        if self.max_age is not None:
+            keep &= last_hit > self.updates - self.max_age
+
+        n_kept = np.count_nonzero(keep)
+        if n_kept > self.max_voxels:
+            kept = np.flatnonzero(keep)
+            n_evict = n_kept - int(self.max_voxels * EVICT_TO)
+            keep[kept[np.argpartition(last_hit[kept], n_evict - 1)[:n_evict]]] = False
+
+        if keep.all():
+            return keys, log_odds, last_hit
+        return keys[keep], log_odds[keep], last_hit[keep]
+
+
+    def update_vertices(self):
+        """Centers and colors of the occupied voxels, if the map changed since last time"""
+        with self.lock:
+            if self.vertices_version == self.version:
+                return False
+            occupied = self.log_odds > 0
+            keys, log_odds = self.keys[occupied], self.log_odds[occupied]
+            self.vertices_version = self.version
+
+        self.vertices = voxel_centers(keys, self.voxel_size)
+        self.vertex_color = np.minimum((log_odds * (COLOR_STEPS / LOG_ODDS_MAX)).astype(np.intp), COLOR_STEPS - 1)
+        self.target_draw_size = np.full(len(keys), VOXEL_DRAW_SIZE, dtype=np.int32)
+        self.target_draw_filter = np.ones(len(keys), dtype=bool)
+        return True
+
+
+    def draw(self):
+        changed = self.update_vertices()
+
+        self.render.camera.view_projection_matrix()    # Brings camera.version up to date
+        if changed or self.screen_vertices is None or self.camera_version != self.render.camera.version:
+            with profiler.span('projection'):
+                self.screen_vertices = self.project_vertices()
+            self.camera_version = self.render.camera.version
+
+        with profiler.span('points'):
+            self.draw_vertices(self.screen_vertices)
+
+
+    def draw_vertices(self, vertices):
+        self.point_renderer.draw(self.render.screen, vertices, self.target_draw_filter, self.vertex_color, self.target_draw_size)
+
+
+    def draw_info(self, position: tuple[int, int]):
+        panel_rows = [
+            # (text string,                    px linespace )
+            ("Voxel map:", 0),
+            (f'Voxel size              - {self.voxel_size * 100:g} cm', 20),
+            (f'Voxels                  - {len(self)} / {self.max_voxels}', 20),
+            (f'Occupied                - {len(self.vertices)}', 20),
+        ]
+
+        draw_panel(self.render.screen, self.font, self.text_color, position, panel_rows)
@@ -1,177 +1,406 @@
 
 from sensor_frame_3d import Sensor3D
 import pygame as pg
-from VL53L5CX import read_json_file, save_readings_json, VL53L5CX_Reading
+from log_files import open_log, StreamingLogWriter, TimeIndex, BINARY_LOG_SUFFIX
+from frame_buffer import FrameRing, KEEP_LATEST
+from serial_reader import SerialReader
+from temporal_filter import TemporalFilter
+from collections import deque
+from pathlib import Path
+from profiler import profiler
+from hud import draw_panel
 import threading
-import serial
+import time
 from datetime import datetime
 import pygame as pg
 
 
+# Replay speeds, changed with - and +
+REPLAY_SPEEDS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 25, 50, 100)
+DEFAULT_REPLAY_FREQUENCY = 5
+
+# Bounds on how long the replay thread sleeps between frames. It is woken by key presses as well
+MIN_REPLAY_WAIT = 0.001
+MAX_REPLAY_WAIT = 0.1
+
+
+def format_time(seconds: float) -> str:
+    minutes, seconds = divmod(round(seconds, 1), 60)
+    return f'{int(minutes)}:{seconds:04.1f}'
+
+
+def filter_name(temporal_filter: TemporalFilter | None) -> str:
+    return 'Off' if temporal_filter is None else f'{temporal_filter.mode} ({temporal_filter.window} frames)'
+
+
 class ReplayWorker(threading.Thread):
-    def __init__(self, render, path_to_file: str, frequency: int, point_color: pg.Color):
+    """
+    Replays a log at its original timing if it has capture timestamps, otherwise at frequency Hz,
+    in both cases scaled by the replay speed.
+
+    Playback follows a clock: the log time moves on with the wall clock times the speed, and the
+    frame at the log time is shown. Frames that come faster than they can be shown are skipped.
+    Jumps to a frame or time, and the scrubber bar, look the frame up in the log's time index.
+    """
+    def __init__(
+        self,
+        render,
+        path_to_file: str,
+        frequency: int | None,
+        point_color: pg.Color,
+        sensor: Sensor3D | None = None,
+        name: str | None = None,
+        info_position: tuple[int, int] = (20, 360),
+        scrubber_row: int = 0,
+        ):
         threading.Thread.__init__(self)
 
         self.killed = False
-        self.clock = pg.time.Clock()
 
-        self.sensor = Sensor3D(render, point_color)
-        self.update_frequency = frequency
-        self.frames = read_json_file(path_to_file)
+        # A sensor that is part of a rig is drawn by the rig
+        self.draws_sensor = sensor is None
+        self.sensor = Sensor3D(render, point_color) if sensor is None else sensor
+        self.sensor_name = name    # Not self.name, Thread.name is always a string
+        self.update_frequency = frequency or DEFAULT_REPLAY_FREQUENCY
+        self.frames = open_log(path_to_file)
+        self.time_index = TimeIndex(self.frames, self.update_frequency)
 
         self.ix = 0
         self.ix_max = len(self.frames)
         self.replay_state = "Paused"
         self.replay_dir = "Forward"
+        self.speed = 1
+
+        # Playback position in seconds from the first frame, moved on by the replay thread. Key
+        # presses change it too, the lock keeps both sides consistent.
+        self.log_time = 0.0
+        self.last_tick = time.monotonic()
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+
+        # Frame number or time typed after J, None when not jumping
+        self.jump_text = None
+
+        # Scrubber bar along the bottom of the screen, one row per replayed sensor
+        screen_width, screen_height = render.screen.get_size()
+        self.scrubber_rect = pg.Rect(20, screen_height - 40 - 30 * scrubber_row, screen_width - 40, 12)
+        self.scrubbing = False
 
         # For infobox:
-        self.info_position = (20, 300)
+        self.info_position = info_position
         self.bg_color = pg.Color('magenta')
         self.text_color = pg.Color('aqua')
         self.font = pg.font.SysFont("Source Code Pro", 14)
 
-        self.next_frame()
+        self.show_frame(0)
         
     def draw(self):
-        self.sensor.draw()
+        if self.draws_sensor:
+            self.sensor.draw()
         self.draw_info()
+        self.draw_scrubber()
 
     def kill(self):
         self.killed = True
+        self.wake.set()
+        self.frames.close()
 
-    def update(self):
+    def advance(self):
+        """Moves the log time on by the wall time since the last call, wrapping around at the ends"""
+        now = time.monotonic()
         if self.replay_state == "Playing":
+            step = (now - self.last_tick) * self.speed
+            self.log_time += step if self.replay_dir == "Forward" else -step
+            self.log_time %= self.time_index.duration
+        self.last_tick = now
+
+    def update(self) -> float:
+        """Shows the frame at the log time. Returns the seconds until the next frame is due"""
+        with self.lock:
+            self.advance()
+            if self.replay_state != "Playing":
+                return MAX_REPLAY_WAIT
+
+            ix = self.time_index.frame_at(self.log_time)
+            if ix != self.ix:
+                self.show_frame(ix)
+            self.sensor.render.damage()     # The time shown moves on between frames too
+
             if self.replay_dir == "Forward":
-                self.next_frame()
+                next_time = self.time_index.time(ix + 1) if ix + 1 < self.ix_max else self.time_index.duration
+                wait = next_time - self.log_time
             else:
-                self.previous_frame()
+                wait = self.log_time - self.time_index.time(ix)
+            return min(max(wait / self.speed, MIN_REPLAY_WAIT), MAX_REPLAY_WAIT)
 
     # To be called by main event loop
     def control(self, events):
         for event in events:
+            if event.type == pg.MOUSEBUTTONDOWN and event.button == 1 and self.scrubber_rect.inflate(0, 16).collidepoint(event.pos):
+                self.scrubbing = True
+            if event.type == pg.MOUSEBUTTONUP and event.button == 1:
+                self.scrubbing = False
+            if self.scrubbing and event.type in (pg.MOUSEBUTTONDOWN, pg.MOUSEMOTION):
+                self.scrub(event.pos[0])
+
             if event.type == pg.KEYDOWN:
                 key = event.key
+                if self.jump_text is not None:
+                    self.jump_control(event)
+                    continue
+
                 if key == pg.K_SPACE:
-                    if self.replay_state == "Paused":
-                        self.replay_state = "Playing"
-                    else:
-                        self.replay_state = "Paused"
+                    with self.lock:
+                        self.advance()
+                        if self.replay_state == "Paused":
+                            self.replay_state = "Playing"
+                        else:
+                            self.replay_state = "Paused"
+                    self.wake.set()
                 
                 if key == pg.K_x:
-                    if self.replay_dir == "Forward":
-                        self.replay_dir = "Reverse"
-                    else:
-                        self.replay_dir = "Forward"
+                    with self.lock:
+                        self.advance()
+                        if self.replay_dir == "Forward":
+                            self.replay_dir = "Reverse"
+                        else:
+                            self.replay_dir = "Forward"
+                    self.wake.set()
                 
                 if key == pg.K_z:
                     self.previous_frame()
 
                 if key == pg.K_c:
                     self.next_frame()
-    
+
+                if key in (pg.K_MINUS, pg.K_KP_MINUS):
+                    self.change_speed(-1)
+
+                if key in (pg.K_PLUS, pg.K_EQUALS, pg.K_KP_PLUS):
+                    self.change_speed(1)
+
+                if key == pg.K_j:
+                    self.jump_text = ""
+
+    def jump_control(self, event):
+        """Keys while typing a frame number or time"""
+        if event.key in (pg.K_RETURN, pg.K_KP_ENTER):
+            self.jump(self.jump_text)
+            self.jump_text = None
+        elif event.key == pg.K_ESCAPE:
+            self.jump_text = None
+        elif event.key == pg.K_BACKSPACE:
+            self.jump_text = self.jump_text[:-1]
+        elif event.unicode and event.unicode in "0123456789.:":
+            self.jump_text += event.unicode
+
+    def jump(self, text: str):
+        """'120' jumps to frame 120, '1:30' and '90.0' to 90 seconds from the first frame"""
+        try:
+            if ':' in text:
+                minutes, seconds = text.split(':')
+                self.seek_time(int(minutes or 0) * 60 + float(seconds or 0))
+            elif '.' in text:
+                self.seek_time(float(text))
+            elif text:
+                self.seek(min(int(text), self.ix_max - 1))
+        except ValueError:
+            pass    # Not a frame number or time, nothing to jump to
+
     def draw_info(self):
-        cursor_x, cursor_y = self.info_position
+        if self.time_index.timed:
+            speed = f'{self.speed}x, original timing'
+        else:
+            speed = f'{self.speed}x of {self.update_frequency} Hz'
+        if self.jump_text is not None:
+            state = f'Jump to {self.jump_text}_  (frame, m:ss or s.s, Enter)'
+        else:
+            state = self.replay_state
         panel_rows = [
             # (text string,                    px linespace )
-            ("Replay control:"                          ,  0),
+            ("Replay control:" if self.sensor_name is None else f'Replay control ({self.sensor_name}):', 0),
             ("Space                   - Pause/Play"     , 20),
             ("X                       - Toggle reverse" , 20),
             ("Z                       - Previous frame" , 20),
             ("C                       - Next frame"     , 20),
+            ("- / +                   - Replay speed"   , 20),
+            ("J                       - Jump to frame or time", 20),
+            ("Mouse on bar at bottom  - Seek"           , 20),
             ("Key Left / Key Right    - Yaw"            , 20),
-            (f'Frame #                 - {self.ix}'     , 40),
+            (f'Frame #                 - {self.ix} / {self.ix_max - 1}', 40),
+            (f'Time                    - {format_time(self.log_time)} / {format_time(self.time_index.duration)}', 20),
+            (f'Replay speed            - {speed}', 20),
             (f'Replay direction        - {self.replay_dir}', 20),
-            (f'Replay state            - {self.replay_state}', 20),
+            (f'Replay state            - {state}', 20),
+            (f'Temporal filter         - {filter_name(self.sensor.temporal_filter)}', 20),
         ]
 
-        for row in panel_rows:
-            cursor_y += row[1]
-            tmp_surface = self.font.render(row[0], True, self.text_color, None)
-            self.sensor.render.screen.blit(tmp_surface, (cursor_x, cursor_y))
+        draw_panel(self.sensor.render.screen, self.font, self.text_color, self.info_position, panel_rows)
 
-    def next_frame(self):
-        self.ix += 1
-        
-        if self.ix >= self.ix_max:
-            self.ix = 0 # Replay from 0
+    def draw_scrubber(self):
+        screen = self.sensor.render.screen
+        played = self.scrubber_rect.copy()
+        played.width = round(played.width * min(self.log_time / self.time_index.duration, 1))
+        pg.draw.rect(screen, self.bg_color, played)
+        pg.draw.rect(screen, self.text_color, self.scrubber_rect, 1)
 
-        # self.sensor.vertices = self.frames[self.ix].get_point_cloud()
-        self.sensor.update_pointcloud(self.frames[self.ix])
+    def scrub(self, x: int):
+        fraction = min(max((x - self.scrubber_rect.x) / self.scrubber_rect.width, 0), 1)
+        self.seek_time(fraction * self.time_index.duration)
+
+    def change_speed(self, steps: int):
+        with self.lock:
+            self.advance()
+            ix = REPLAY_SPEEDS.index(self.speed) + steps
+            self.speed = REPLAY_SPEEDS[min(max(ix, 0), len(REPLAY_SPEEDS) - 1)]
+        self.wake.set()
+
+    def show_frame(self, ix: int):
+        self.ix = ix
+        with profiler.span('pointcloud'):
+            self.sensor.update_pointcloud(self.frames[self.ix])
+
+    def seek(self, ix: int, seconds: float | None = None):
+        """
+        Jumps to a frame, and to a time within it (default the frame's own). A temporal filter
+        starts over, the frames before are not the ones it has seen.
+        """
+        with self.lock:
+            self.log_time = self.time_index.time(ix) if seconds is None else seconds
+            self.last_tick = time.monotonic()
+            if ix != self.ix:
+                temporal_filter = self.sensor.temporal_filter
+                if temporal_filter is not None:
+                    with self.sensor.update_lock:
+                        temporal_filter.reset()
+                self.show_frame(ix)
+        self.wake.set()
+
+    def seek_time(self, seconds: float):
+        """Jumps to a time in seconds from the first frame"""
+        seconds = min(max(seconds, 0), self.time_index.duration)
+        self.seek(self.time_index.frame_at(seconds), seconds)
+
+    def step(self, frames: int):
+        with self.lock:
+            ix = (self.ix + frames) % self.ix_max
+            self.log_time = self.time_index.time(ix)
+            self.last_tick = time.monotonic()
+            self.show_frame(ix)
+        self.wake.set()
+
+    def next_frame(self):
+        self.step(1)
     
     def previous_frame(self):
-        self.ix -= 1
-
-        if self.ix < 0:
-            self.ix = self.ix_max - 1
-        
-        # self.sensor.vertices = self.frames[self.ix].get_point_cloud()
-        self.sensor.update_pointcloud(self.frames[self.ix])
+        self.step(-1)
     
     def run(self):
         try:
             while not self.killed:
-                self.update()
-                self.clock.tick(self.update_frequency)
+                self.wake.wait(self.update())
+                self.wake.clear()
         finally:
             pass # Just die
 
 
 class SerialPortWorker(threading.Thread):
-    def __init__(self, render, com_port: str, baud_rate: int, path_to_save: str | None, point_color: pg.Color):
+    def __init__(
+        self,
+        render,
+        com_port: str,
+        baud_rate: int,
+        path_to_save: str | None,
+        point_color: pg.Color,
+        rotate_bytes: int | None = None,
+        rotate_seconds: float | None = None,
+        frames_in_memory: int = 256,
+        sensor: Sensor3D | None = None,
+        name: str | None = None,
+        info_position: tuple[int, int] = (20, 360),
+        ):
         threading.Thread.__init__(self)
 
         self.killed = False
-        self.clock = pg.time.Clock()
 
-        self.sensor = Sensor3D(render, point_color)
-        # Filename, default is log_<datetime>.json
+        # A sensor that is part of a rig is drawn by the rig
+        self.draws_sensor = sensor is None
+        self.sensor = Sensor3D(render, point_color) if sensor is None else sensor
+        self.sensor_name = name    # Not self.name, Thread.name is always a string
+        # Filename, default is log_<datetime>.vlog
         if path_to_save == "":
             file_timestamp = datetime.now().strftime("%d%m%Y_%H%M%S")
-            self.path_to_save = f'log_{file_timestamp}.json'
+            self.path_to_save = f'log_{file_timestamp}{BINARY_LOG_SUFFIX}'
         else:
-            self.path_to_save = path_to_save
-        
-        # Read frames are stored in self.frames. Can be saved when worker is killed.
-        self.frames = list()
+            # Live view records binary logs whatever the suffix given
+            self.path_to_save = str(Path(path_to_save).with_suffix(BINARY_LOG_SUFFIX))
 
-        # Start serial communication.
-        self.serial = serial.Serial(com_port, baud_rate, timeout=1)
+        # Every frame is streamed to disk (lossless), the display only needs the newest one (keep latest).
+        # The latest displayed frames are kept in self.frames
+        self.frames = deque(maxlen=frames_in_memory)
+        self.display = FrameRing(1, KEEP_LATEST)
+        self.recorder = StreamingLogWriter(self.path_to_save, max_bytes=rotate_bytes, max_seconds=rotate_seconds)
+        self.recorder.start()
+        path = Path(self.path_to_save)
+        if self.recorder.rotate:
+            # Rotated logs are numbered from the first file on
+            path = path.with_name(f'{path.stem}_<part>{path.suffix}')
+        print(f'Recording to {path}')
+
+        # Start serial communication. The short timeout lets the reader notice when it is stopped
+        import serial   # pyserial, only needed live
+        self.serial = serial.Serial(com_port, baud_rate, timeout=0.1)
         self.serial.flush()
+        self.reader = SerialReader(self.serial, [self.display, self.recorder.queue])
 
-        # Need to put at least some data in the frame
-        # wait for something on serial and poll before exiting __init__
-        # while not self.serial.in_waiting:
-        #     sleep(0.1)
-        self.poll()
+        # For infobox:
+        self.info_position = info_position
+        self.text_color = pg.Color('aqua')
+        self.font = pg.font.SysFont("Source Code Pro", 14)
 
 
     def draw(self):
-        self.sensor.draw()
+        if self.draws_sensor:
+            self.sensor.draw()
+        self.draw_info()
 
 
     def kill(self):
-        save_readings_json(self.frames, self.path_to_save)
         self.killed = True
 
 
-    def poll(self):
-        try:
-            if self.serial.in_waiting:
-                rx_data = self.serial.read_until()
-                tokenized_data = rx_data.decode().replace(" ", "").strip().split(';')
-                reading = VL53L5CX_Reading(tokenized_data)
-                
-                # self.sensor.vertices = reading.get_point_cloud()
+    def update(self, timeout: float = 0.1):
+        reading = self.display.get(timeout)
+        if reading is not None:
+            with profiler.span('pointcloud'):
                 self.sensor.update_pointcloud(reading)
-                self.frames.append(reading)
-        except(ValueError):
-            pass
+            self.frames.append(reading)
     
     def control(self, events):
         # No functions to control as of now
         pass
 
+    def draw_info(self):
+        panel_rows = [
+            # (text string,                    px linespace )
+            ("Live:" if self.sensor_name is None else f'Live ({self.sensor_name}):', 0),
+            (f'Format                  - {self.reader.decoder.format or "Detecting"}', 20),
+            (f'Frames received         - {self.reader.decoder.frames}', 20),
+            (f'Malformed frames        - {self.reader.decoder.errors}', 20),
+            (f'Frames not displayed    - {self.display.dropped}', 20),
+            (f'Frames not recorded     - {self.recorder.queue.dropped}', 20),
+            (f'Recording               - {"Failed" if self.recorder.error else "OK"}', 20),
+            (f'Temporal filter         - {filter_name(self.sensor.temporal_filter)}', 20),
+        ]
+
+        draw_panel(self.sensor.render.screen, self.font, self.text_color, self.info_position, panel_rows)
+
     def run(self):
-        while not self.killed:
-            self.poll()
-            self.clock.tick(60)
\ No newline at end of file
+        self.reader.start()
+        try:
+            while not self.killed:
+                self.update()
+        finally:
+            self.reader.stop()
+            self.serial.close()
+            self.recorder.close()